@@ -1,20 +1,34 @@
-"""Flask application factory."""
+"""Flask application factory.
+
+Building the app never connects to the database, so workers boot quickly;
+schema and first-user setup live in ``flask init-db`` and
+``flask create-admin``.
+"""
 import os
+
 from flask import Flask, render_template
 
 from config import config
-from app.extensions import db
+from app.extensions import configure_engine, db
+from app.utils.metrics import init_metrics
+from app.utils.page_cache import init_page_cache
 
 
 def create_app(config_name='default'):
     """Create and configure the Flask application."""
-    app = Flask(__name__)
+    # INSTANCE_PATH moves the instance folder (caches, content version, snapshots)
+    instance_path = os.environ.get('INSTANCE_PATH')
+    app = Flask(__name__, instance_path=os.path.abspath(instance_path) if instance_path else None)
     
     # Load configuration
     app.config.from_object(config[config_name])
+    app.config['CONFIG_NAME'] = config_name
     
     # Initialize extensions
     db.init_app(app)
+    configure_engine(app)
+    init_page_cache(app)
+    init_metrics(app)
     
     # Register blueprints
     from app.routes import main, auth, media, api, blog
@@ -43,50 +57,27 @@ def create_app(config_name='default'):
     
     # Register template filters
     from app.utils import format_file_size
+    from app.utils.images import image_url, rendition_url, upload_url
     
     @app.template_filter('filesize')
     def filesize_filter(size_bytes):
         return format_file_size(size_bytes)
     
-    # Register CLI commands
-    @app.cli.command()
-    def init_db():
-        """Initialize the database."""
-        db.create_all()
-        print("Database tables created.")
-
-    @app.cli.command()
-    def create_admin():
-        """Create admin user."""
-        from app.models import User
-        username = input("Enter admin username: ")
-        password = input("Enter admin password: ")
-        
-        existing_user = User.query.filter_by(username=username).first()
-        if existing_user:
-            print(f"User '{username}' already exists!")
-            return
-        
-        admin = User(username=username, is_admin=True)
-        admin.set_password(password)
-        db.session.add(admin)
-        db.session.commit()
-        print(f"Admin user '{username}' created successfully!")
+    app.add_template_global(rendition_url)
+    app.add_template_global(upload_url)
+    app.add_template_global(image_url)
+    
+    @app.template_global()
+    def url_with(**changes):
+        """Current URL with some query parameters replaced (None drops one)."""
+        from flask import request, url_for
+        args = request.args.to_dict()
+        args.update(changes)
+        return url_for(request.endpoint, **{k: v for k, v in args.items() if v is not None},
+                       **request.view_args)
     
-    # Ensure upload directory exists
-    with app.app_context():
-        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-        
-        # Create tables if they don't exist
-        db.create_all()
-        
-        # Create default admin if no users exist
-        from app.models import User
-        if User.query.count() == 0:
-            default_admin = User(username='admin', is_admin=True)
-            default_admin.set_password('Andre4301$$')
-            db.session.add(default_admin)
-            db.session.commit()
-            print("Default admin user created: admin / Andre4301$$")
+    # Register CLI commands
+    from app.cli import register_commands
+    register_commands(app)
     
     return app
@@ -0,0 +1,304 @@
+"""Flask CLI commands for BirdyPhillips application."""
+import os
+from functools import partial
+
+import click
+from sqlalchemy import update
+
+from app.extensions import db
+from app.utils.page_cache import bump_content_version
+
+
+def _read_safely(reader, path):
+    try:
+        return reader(path), None
+    except Exception as e:
+        return None, str(e)
+
+
+def _map_files(reader, paths, workers):
+    """Yield ``(result, error)`` for each path, in order, from ``reader`` run in worker processes.
+
+    Image parsing is CPU-bound Python, so it scales with processes rather
+    than threads; forkserver children never inherit the parent's open DB
+    connections. ``reader`` must be a module-level function.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    context = multiprocessing.get_context('forkserver')
+    with ProcessPoolExecutor(max_workers=max(workers, 1), mp_context=context) as pool:
+        yield from pool.map(partial(_read_safely, reader), paths, chunksize=32)
+
+
+def _update_media(updates):
+    """Apply ``[{'id': ..., column: value}]`` as one executemany and commit."""
+    from app.models import Media
+    if updates:
+        db.session.execute(update(Media), updates)
+    db.session.commit()
+
+
+def register_commands(app):
+    """Attach maintenance commands to the application CLI."""
+
+    @app.cli.command('init-db')
+    def init_db():
+        """Create the database tables and the uploads folder."""
+        from app import migrations
+        from app.models import User
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        db.create_all()
+        # A fresh schema already includes every migration
+        migrations.stamp()
+        print("Database tables created.")
+        if User.query.count() == 0:
+            print("No users yet; run 'flask create-admin' to add one.")
+
+    @app.cli.command('create-admin')
+    @click.option('--username', prompt='Enter admin username', help='Login name for the new admin.')
+    @click.option('--password', prompt='Enter admin password', hide_input=True,
+                  confirmation_prompt=True, help='Password (prompted for when omitted).')
+    def create_admin(username, password):
+        """Create admin user."""
+        from app.models import User
+        existing_user = User.query.filter_by(username=username).first()
+        if existing_user:
+            print(f"User '{username}' already exists!")
+            return
+
+        admin = User(username=username, is_admin=True)
+        admin.set_password(password)
+        db.session.add(admin)
+        db.session.commit()
+        print(f"Admin user '{username}' created successfully!")
+
+    @app.cli.command('startup-report')
+    @click.option('--limit', type=int, default=15, help='Number of modules to list.')
+    def startup_report(limit):
+        """Show how long a cold create_app takes and which imports dominate it."""
+        from app.utils.startup import measure_startup
+        try:
+            report = measure_startup(app.config['CONFIG_NAME'])
+        except RuntimeError as e:
+            raise click.ClickException(f"Startup probe failed: {e}")
+        total = report['import_seconds'] + report['create_seconds']
+        print(f"Cold start: {total * 1000:.0f} ms "
+              f"(imports {report['import_seconds'] * 1000:.0f} ms, "
+              f"create_app {report['create_seconds'] * 1000:.0f} ms, "
+              f"{len(report['modules'])} modules)")
+
+        print("\nBy package (self time):")
+        packages = sorted(report['packages'].items(), key=lambda item: -item[1])
+        for name, self_us in packages[:limit]:
+            print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+        print("\nSlowest modules (self time):")
+        for name, self_us, cumulative_us in sorted(report['modules'], key=lambda m: -m[1])[:limit]:
+            print(f"  {self_us / 1000:8.1f} ms  {name}  (cumulative {cumulative_us / 1000:.1f} ms)")
+
+    @app.cli.command('worker')
+    @click.option('--workers', type=int, default=None, help='Pool size (default: one per CPU core).')
+    @click.option('--once', is_flag=True, help='Exit once the queue is empty.')
+    def worker(workers, once):
+        """Run queued background jobs in a process pool."""
+        from app.jobs import run_worker
+        print(f"Job worker started (pid {os.getpid()}).")
+        try:
+            run_worker(app, workers=workers, once=once)
+        except KeyboardInterrupt:
+            print("Job worker stopped.")
+
+    @app.cli.command('backfill-renditions')
+    @click.option('--force', is_flag=True, help='Regenerate renditions that already exist.')
+    def backfill_renditions(force):
+        """Generate renditions for media uploaded before they existed."""
+        from app.models import Media
+        from app.utils.images import build_renditions
+
+        query = db.session.query(Media.id, Media.filename)
+        if not force:
+            query = query.filter(Media.renditions.is_(None))
+        pending = query.order_by(Media.id).all()
+
+        done = failed = 0
+        for media_id, filename in pending:
+            try:
+                renditions = build_renditions(filename)
+            except Exception as e:
+                print(f"  ✗ {filename}: {e}")
+                failed += 1
+                continue
+            db.session.query(Media).filter_by(id=media_id).update({'renditions': renditions})
+            done += 1
+            # Commit in small batches so an interrupted run keeps its progress
+            if done % 25 == 0:
+                db.session.commit()
+        db.session.commit()
+        bump_content_version()
+        print(f"Renditions generated for {done} files ({failed} failed).")
+
+    @app.cli.command('backfill-exif')
+    @click.option('--workers', type=int, default=os.cpu_count(), help='Processes reading image headers.')
+    @click.option('--force', is_flag=True, help='Re-read files that already have dimensions.')
+    def backfill_exif(workers, force):
+        """Store dimensions and EXIF data for media uploaded before they were recorded."""
+        from app.models import Media
+        from app.utils.images import image_columns, read_image_info
+
+        upload_folder = app.config['UPLOAD_FOLDER']
+        query = db.session.query(Media.id, Media.filename, Media.upload_time).filter(Media.is_missing.is_(False))
+        if not force:
+            query = query.filter(Media.width.is_(None))
+        pending = query.order_by(Media.id).all()
+        paths = [os.path.join(upload_folder, filename) for _, filename, _ in pending]
+
+        done = failed = 0
+        updates = []
+        for (media_id, filename, upload_time), (info, error) in zip(
+                pending, _map_files(read_image_info, paths, workers)):
+            if error:
+                print(f"  ✗ {filename}: {error}")
+                failed += 1
+                continue
+            updates.append(dict(image_columns(info, upload_time), id=media_id))
+            done += 1
+            # Committed in batches so an interrupted run keeps its progress
+            if len(updates) == 500:
+                _update_media(updates)
+                updates = []
+        _update_media(updates)
+        bump_content_version()
+        print(f"Image data stored for {done} files ({failed} failed).")
+
+    @app.cli.command('backfill-placeholders')
+    @click.option('--workers', type=int, default=os.cpu_count(), help='Processes encoding placeholders.')
+    @click.option('--force', is_flag=True, help='Regenerate placeholders that already exist.')
+    def backfill_placeholders(workers, force):
+        """Generate inline placeholders for media uploaded before they existed."""
+        from app.models import Media
+        from app.utils.images import generate_placeholder, placeholder_source
+
+        upload_folder = app.config['UPLOAD_FOLDER']
+        query = db.session.query(Media.id, Media.filename, Media.renditions).filter(Media.is_missing.is_(False))
+        if not force:
+            query = query.filter(Media.placeholder.is_(None))
+        pending = query.order_by(Media.id).all()
+        # Drawn from the 400px thumb where one exists, so most files decode small
+        paths = [placeholder_source(upload_folder, filename, renditions) for _, filename, renditions in pending]
+
+        done = failed = 0
+        updates = []
+        for (media_id, filename, _), (placeholder, error) in zip(
+                pending, _map_files(generate_placeholder, paths, workers)):
+            if error:
+                print(f"  ✗ {filename}: {error}")
+                failed += 1
+                continue
+            updates.append({'id': media_id, 'placeholder': placeholder})
+            done += 1
+            if len(updates) == 500:
+                _update_media(updates)
+                updates = []
+        _update_media(updates)
+        bump_content_version()
+        print(f"Placeholders generated for {done} files ({failed} failed).")
+
+    @app.cli.command('reindex-blog')
+    def reindex_blog():
+        """Rebuild the blog manifest and search index from the markdown files."""
+        from app.routes.blog import post_index, search_index
+        posts = post_index.refresh(force=True)['posts']
+        search_index.refresh(force=True)
+        bump_content_version()
+        print(f"Indexed {len(posts)} blog posts.")
+
+    @app.cli.command('sync-uploads')
+    @click.option('--full', is_flag=True, help='Ignore the cached snapshot and compare every row.')
+    @click.option('--watch', is_flag=True, help='Keep running and apply changes as they happen.')
+    @click.option('--interval', type=float, default=5.0, help='Polling interval without inotify.')
+    def sync_uploads(full, watch, interval):
+        """Reconcile the uploads folder with the media table."""
+        from app.utils import sync
+        if watch:
+            try:
+                sync.watch(interval=interval)
+            except KeyboardInterrupt:
+                print("Upload watcher stopped.")
+            return
+        result = sync.reconcile(full=full)
+        print(f"Sync complete: {result}")
+
+    @app.cli.command('hash-uploads')
+    def hash_uploads():
+        """Hash legacy uploads and move them into content-addressed storage."""
+        from app.models import Media
+        from app.utils.storage import adopt_file, hash_file
+
+        upload_folder = app.config['UPLOAD_FOLDER']
+        pending = db.session.query(Media.id, Media.filename).filter(
+            Media.content_hash.is_(None), Media.is_missing.is_(False)
+        ).order_by(Media.id).all()
+
+        done = failed = 0
+        for media_id, filename in pending:
+            try:
+                content_hash = hash_file(os.path.join(upload_folder, filename))
+                adopt_file(upload_folder, filename, content_hash)
+            except OSError as e:
+                print(f"  ✗ {filename}: {e}")
+                failed += 1
+                continue
+            db.session.query(Media).filter_by(id=media_id).update({'content_hash': content_hash})
+            done += 1
+            if done % 100 == 0:
+                db.session.commit()
+        db.session.commit()
+        bump_content_version()
+        print(f"Hashed {done} files ({failed} failed).")
+
+    @app.cli.command('repair-stats')
+    def repair_stats():
+        """Recompute the materialized gallery statistics from the media table."""
+        from app.utils.stats import get_breakdown, get_totals, rebuild_stats
+
+        version = rebuild_stats()
+        db.session.commit()
+        bump_content_version()
+        totals = get_totals()
+        print(f"Stats rebuilt (version {version}): {totals.count} files, {totals.bytes} bytes, "
+              f"{len(get_breakdown('type'))} types, {len(get_breakdown('uploader'))} uploaders.")
+
+    @app.cli.command('clear-page-cache')
+    def clear_page_cache():
+        """Drop cached public pages (e.g. after deploying new templates)."""
+        page_cache = app.extensions.get('page_cache')
+        if page_cache:
+            page_cache.backend.clear()
+        bump_content_version()
+        print("Page cache cleared.")
+
+    @app.cli.command('export-static')
+    @click.option('--full', is_flag=True, help='Re-render every page, not just the changed ones.')
+    @click.option('--dir', 'export_dir', default=None, help='Output directory (default: STATIC_EXPORT_DIR).')
+    def export_static(full, export_dir):
+        """Render the public pages to static files for nginx."""
+        from app.utils.static_export import export_static as run_export
+        export_dir = export_dir or app.config['STATIC_EXPORT_DIR']
+        result = run_export(app, export_dir, full=full)
+        print(f"Exported to {export_dir}: {result['rendered']} rendered, {result['written']} changed, "
+              f"{result['skipped']} up to date, {result['removed']} removed.")
+
+    @app.cli.command('migrate')
+    @click.option('--to', 'target', default=None, help='Stop after this version (e.g. 0002).')
+    def migrate(target):
+        """Apply pending schema migrations."""
+        from app import migrations
+        count = migrations.upgrade(target)
+        print(f"Applied {count} migrations." if count else "Database schema is up to date.")
+
+    @app.cli.command('migrate-status')
+    def migrate_status():
+        """List schema migrations and whether each has been applied."""
+        from app import migrations
+        for version, name, description, is_applied in migrations.status():
+            print(f"  [{'x' if is_applied else ' '}] {version} {name}: {description}")
@@ -0,0 +1,209 @@
+"""Database-backed background job queue.
+
+Web requests call ``enqueue`` inside their own transaction; the
+``flask worker`` command claims due jobs and runs them in a process pool
+sized to the CPU count, so image work never blocks a request thread.
+"""
+import multiprocessing
+import os
+import random
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import insert
+
+from app.extensions import db
+from app.models import Job
+
+# Task registry: kind -> callable(payload) -> JSON-serializable result
+TASKS = {}
+
+# Application instance owned by each pool process
+_worker_app = None
+
+
+def task(kind):
+    """Register a function as the handler for a job kind."""
+    def decorator(func):
+        TASKS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, payload=None, delay=0):
+    """Add a job to the current session; the caller commits it."""
+    job = Job(
+        kind=kind,
+        payload=payload or {},
+        max_attempts=current_app.config['JOB_MAX_ATTEMPTS'],
+        run_after=datetime.utcnow() + timedelta(seconds=delay)
+    )
+    db.session.add(job)
+    return job
+
+
+def enqueue_many(kind, payloads):
+    """Queue one job per payload with a single bulk INSERT; the caller commits."""
+    payloads = list(payloads)
+    if payloads:
+        now = datetime.utcnow()
+        max_attempts = current_app.config['JOB_MAX_ATTEMPTS']
+        db.session.execute(insert(Job), [
+            {'kind': kind, 'payload': payload, 'status': 'queued', 'attempts': 0,
+             'max_attempts': max_attempts, 'run_after': now, 'created_at': now}
+            for payload in payloads])
+    return len(payloads)
+
+
+def retry_delay(attempts, base, maximum):
+    """Exponential backoff with jitter for the given attempt number."""
+    delay = min(base * 2 ** (attempts - 1), maximum)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def claim_jobs(limit):
+    """Atomically mark up to ``limit`` due jobs as running and return them."""
+    now = datetime.utcnow()
+    candidates = db.session.query(Job.id).filter(
+        Job.status == 'queued', Job.run_after <= now
+    ).order_by(Job.run_after, Job.id).limit(limit).all()
+
+    claimed = []
+    for (job_id,) in candidates:
+        # The status guard makes the claim safe against a second worker
+        updated = db.session.query(Job).filter_by(id=job_id, status='queued').update({
+            'status': 'running',
+            'attempts': Job.attempts + 1,
+            'started_at': now
+        }, synchronize_session=False)
+        if updated:
+            claimed.append(job_id)
+    db.session.commit()
+
+    if not claimed:
+        return []
+    return Job.query.filter(Job.id.in_(claimed)).order_by(Job.id).all()
+
+
+def complete_job(job_id, result):
+    """Record a successful run."""
+    db.session.query(Job).filter_by(id=job_id).update({
+        'status': 'done',
+        'result': result,
+        'last_error': None,
+        'finished_at': datetime.utcnow()
+    })
+    db.session.commit()
+
+
+def fail_job(job_id, error):
+    """Record a failed run and schedule a retry if attempts remain."""
+    config = current_app.config
+    job = db.session.get(Job, job_id)
+    job.last_error = error
+    if job.attempts >= job.max_attempts:
+        job.status = 'failed'
+        job.finished_at = datetime.utcnow()
+    else:
+        job.status = 'queued'
+        delay = retry_delay(job.attempts, config['JOB_RETRY_BASE'], config['JOB_RETRY_MAX'])
+        job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+    db.session.commit()
+
+
+def requeue_stale_jobs():
+    """Return jobs orphaned by a crashed worker to the queue."""
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['JOB_STALE_AFTER'])
+    count = db.session.query(Job).filter(
+        Job.status == 'running', Job.started_at < cutoff
+    ).update({'status': 'queued', 'run_after': datetime.utcnow()}, synchronize_session=False)
+    db.session.commit()
+    return count
+
+
+def release_jobs(job_ids):
+    """Put interrupted jobs back in the queue without counting the attempt."""
+    db.session.query(Job).filter(Job.id.in_(list(job_ids))).update({
+        'status': 'queued',
+        'attempts': Job.attempts - 1,
+        'run_after': datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+
+
+def _init_worker(config_name):
+    """Pool initializer: build one application per worker process."""
+    global _worker_app
+    from app import create_app
+    from app import tasks  # noqa: F401  (registers task handlers)
+    _worker_app = create_app(config_name)
+
+
+def _execute(kind, payload):
+    """Run a single job inside the worker process."""
+    with _worker_app.app_context():
+        try:
+            return TASKS[kind](payload)
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            db.session.remove()
+
+
+def run_worker(app, workers=None, once=False):
+    """Claim and execute jobs until interrupted (or the queue drains with ``once``)."""
+    from app import tasks  # noqa: F401
+    workers = workers or app.config['JOB_WORKERS'] or os.cpu_count() or 1
+    poll_interval = app.config['JOB_POLL_INTERVAL']
+    # forkserver children never inherit the parent's open DB connections
+    context = multiprocessing.get_context('forkserver')
+
+    with app.app_context():
+        requeued = requeue_stale_jobs()
+        if requeued:
+            print(f"Requeued {requeued} stale jobs.")
+
+        while True:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                       initializer=_init_worker,
+                                       initargs=(app.config['CONFIG_NAME'],))
+            running = {}
+            try:
+                while True:
+                    free = workers - len(running)
+                    if free > 0:
+                        for job in claim_jobs(free):
+                            future = pool.submit(_execute, job.kind, job.payload)
+                            running[future] = job.id
+
+                    if not running:
+                        if once:
+                            return
+                        time.sleep(poll_interval)
+                        continue
+
+                    done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        job_id = running.pop(future)
+                        try:
+                            complete_job(job_id, future.result())
+                        except BrokenProcessPool:
+                            running[future] = job_id
+                            raise
+                        except Exception:
+                            fail_job(job_id, traceback.format_exc(limit=5))
+            except BrokenProcessPool:
+                # A child died hard; fail what it was running and start a fresh pool
+                for job_id in running.values():
+                    fail_job(job_id, 'Worker process terminated unexpectedly')
+                print("Worker pool crashed; restarting.")
+            except KeyboardInterrupt:
+                release_jobs(running.values())
+                raise
+            finally:
+                pool.shutdown(wait=True, cancel_futures=True)
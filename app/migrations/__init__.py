@@ -0,0 +1,120 @@
+"""Versioned schema migrations, applied with ``flask migrate``.
+
+Each ``vNNNN_<name>.py`` module in this package defines ``DESCRIPTION``
+and ``upgrade(conn)``. Applied versions are recorded in the
+``schema_migrations`` table. Migrations never run at application startup.
+
+``db.create_all()`` builds a fresh database that is already current, so
+``flask init-db`` stamps every version as applied. Migrations inspect the
+live schema before changing it, so running them against a database that
+``create_all`` has partly upgraded is safe.
+"""
+import importlib
+import pkgutil
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, MetaData, String, Table, inspect
+
+from app.extensions import db
+
+# Kept outside the models' metadata so create_all never touches it
+_metadata = MetaData()
+schema_migrations = Table(
+    'schema_migrations', _metadata,
+    Column('version', String(4), primary_key=True),
+    Column('name', String(100), nullable=False),
+    Column('applied_at', DateTime, nullable=False),
+)
+
+
+def available():
+    """All migration modules as ``[(version, name, module)]``, oldest first."""
+    found = []
+    for info in pkgutil.iter_modules(__path__):
+        if info.name.startswith('v') and info.name[1:5].isdigit():
+            module = importlib.import_module(f"{__name__}.{info.name}")
+            found.append((info.name[1:5], info.name[6:], module))
+    return sorted(found, key=lambda item: item[0])
+
+
+def applied(conn):
+    """Versions recorded as applied."""
+    _metadata.create_all(conn, checkfirst=True)
+    return {row.version for row in conn.execute(schema_migrations.select())}
+
+
+def _record(conn, version, name):
+    conn.execute(schema_migrations.insert().values(version=version, name=name,
+                                                   applied_at=datetime.utcnow()))
+
+
+def upgrade(target=None, log=print):
+    """Apply pending migrations up to ``target`` (default: all); returns how many ran."""
+    count = 0
+    with db.engine.connect() as conn:
+        done = applied(conn)
+        conn.commit()
+        for version, name, module in available():
+            if version in done:
+                continue
+            if target and version > target:
+                break
+            log(f"Applying {version} {name}: {module.DESCRIPTION}")
+            # One transaction per migration (MySQL commits DDL implicitly)
+            with conn.begin():
+                module.upgrade(conn)
+                _record(conn, version, name)
+            count += 1
+    return count
+
+
+def stamp(log=print):
+    """Mark every migration as applied without running it (fresh databases)."""
+    with db.engine.connect() as conn:
+        done = applied(conn)
+        for version, name, _module in available():
+            if version not in done:
+                _record(conn, version, name)
+                log(f"Stamped {version} {name}")
+        conn.commit()
+
+
+def status():
+    """``[(version, name, description, applied)]`` for every migration."""
+    with db.engine.connect() as conn:
+        done = applied(conn)
+        conn.commit()
+    return [(version, name, module.DESCRIPTION, version in done)
+            for version, name, module in available()]
+
+
+# Helpers for migration modules
+
+def has_column(conn, table, column):
+    return column in {c['name'] for c in inspect(conn).get_columns(table)}
+
+
+def has_index(conn, table, index):
+    return index in {i['name'] for i in inspect(conn).get_indexes(table)}
+
+
+def add_column(conn, table, column):
+    """``ALTER TABLE ... ADD COLUMN`` for a Column, unless it already exists."""
+    if has_column(conn, table, column.name):
+        return False
+    dialect = conn.dialect
+    ddl = f"ALTER TABLE {table} ADD COLUMN {column.name} {column.type.compile(dialect=dialect)}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    conn.exec_driver_sql(ddl)
+    return True
+
+
+def create_index(conn, index):
+    """Create an Index unless one with its name exists."""
+    if has_index(conn, index.table.name, index.name):
+        return False
+    index.create(conn)
+    return True
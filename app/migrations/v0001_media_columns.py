@@ -0,0 +1,22 @@
+"""Add the columns and tables introduced after the original schema."""
+from sqlalchemy import JSON, Boolean, Column, String
+
+from app.extensions import db
+from app.migrations import add_column, create_index
+
+DESCRIPTION = 'media storage/processing columns; jobs, upload_sessions and media_stats tables'
+
+
+def upgrade(conn):
+    from app.models import Job, Media, MediaStat, UploadSession
+
+    add_column(conn, 'media', Column('content_hash', String(64)))
+    add_column(conn, 'media', Column('renditions', JSON))
+    add_column(conn, 'media', Column('is_missing', Boolean, nullable=False, server_default='0'))
+    add_column(conn, 'media', Column('batch_id', String(32)))
+    for index in Media.__table__.indexes:
+        if index.name in ('ix_media_content_hash', 'ix_media_batch_id'):
+            create_index(conn, index)
+
+    db.metadata.create_all(conn, tables=[Job.__table__, UploadSession.__table__, MediaStat.__table__],
+                           checkfirst=True)
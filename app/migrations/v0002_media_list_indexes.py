@@ -0,0 +1,14 @@
+"""Indexes matching the media list queries."""
+from app.migrations import create_index
+
+DESCRIPTION = 'indexes for upload_time DESC, id ordering and file_type/uploaded_by filters'
+
+
+def upgrade(conn):
+    from app.models import Media
+
+    # Declared on the model so fresh databases get them from create_all too
+    for index in Media.__table__.indexes:
+        if index.name in ('ix_media_upload_time_id', 'ix_media_file_type_upload_time',
+                          'ix_media_uploaded_by_upload_time'):
+            create_index(conn, index)
@@ -0,0 +1,19 @@
+"""Image dimensions and EXIF metadata on media."""
+from sqlalchemy import Column, DateTime, Integer, SmallInteger, String
+
+from app.migrations import add_column, create_index
+
+DESCRIPTION = 'width/height/orientation/taken_at/camera columns (fill with flask backfill-exif)'
+
+
+def upgrade(conn):
+    from app.models import Media
+
+    add_column(conn, 'media', Column('width', Integer))
+    add_column(conn, 'media', Column('height', Integer))
+    add_column(conn, 'media', Column('orientation', SmallInteger))
+    add_column(conn, 'media', Column('taken_at', DateTime))
+    add_column(conn, 'media', Column('camera', String(100)))
+    for index in Media.__table__.indexes:
+        if index.name in ('ix_media_taken_at_id', 'ix_media_camera'):
+            create_index(conn, index)
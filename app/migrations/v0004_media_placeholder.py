@@ -0,0 +1,10 @@
+"""Inline low-quality placeholder images on media."""
+from sqlalchemy import Column, Text
+
+from app.migrations import add_column
+
+DESCRIPTION = 'placeholder column (fill with flask backfill-placeholders)'
+
+
+def upgrade(conn):
+    add_column(conn, 'media', Column('placeholder', Text))
@@ -0,0 +1,14 @@
+"""Store missing renditions as SQL NULL instead of a JSON null."""
+from sqlalchemy import text
+
+DESCRIPTION = "renditions holding JSON null become SQL NULL (retried by flask backfill-renditions)"
+
+
+def upgrade(conn):
+    if conn.dialect.name == 'mysql':
+        condition = "JSON_TYPE(renditions) = 'NULL'"
+    elif conn.dialect.name == 'postgresql':
+        condition = "renditions::text = 'null'"
+    else:
+        condition = "renditions = 'null'"
+    conn.execute(text(f"UPDATE media SET renditions = NULL WHERE {condition}"))
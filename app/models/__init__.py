@@ -1,4 +1,4 @@
 """Models package."""
-from .models import User, Media
+from .models import User, Media, Job, UploadSession, MediaStat
 
-__all__ = ['User', 'Media']
+__all__ = ['User', 'Media', 'Job', 'UploadSession', 'MediaStat']
@@ -31,6 +31,11 @@ class Media(db.Model):
     """Media model for uploaded images."""
     
     __tablename__ = 'media'
+    __table_args__ = (
+        # Admin filters by type/uploader, sorted by date, and the stats GROUP BYs
+        db.Index('ix_media_file_type_upload_time', 'file_type', 'upload_time'),
+        db.Index('ix_media_uploaded_by_upload_time', 'uploaded_by', 'upload_time'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False, unique=True)
@@ -39,6 +44,107 @@ class Media(db.Model):
     file_size = db.Column(db.Integer)  # in bytes
     upload_time = db.Column(db.DateTime, default=datetime.utcnow)
     uploaded_by = db.Column(db.String(80))
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256 of the stored blob
+    # {size: {'width', 'height', 'formats': {fmt: path}}}; None is SQL NULL so backfills find the row
+    renditions = db.Column(db.JSON(none_as_null=True))
+    is_missing = db.Column(db.Boolean, nullable=False, default=False)  # file gone from disk
+    batch_id = db.Column(db.String(32), index=True)  # groups the files of one upload
+    # Read from the image header at ingest (no pixel decode); see read_image_info
+    width = db.Column(db.Integer)  # as displayed, i.e. after EXIF orientation
+    height = db.Column(db.Integer)
+    orientation = db.Column(db.SmallInteger)  # EXIF orientation tag, 1-8
+    taken_at = db.Column(db.DateTime)  # EXIF capture time, else the upload time
+    camera = db.Column(db.String(100), index=True)  # EXIF make + model
+    placeholder = db.Column(db.Text)  # data: URI of a ~16px JPEG shown until the image loads
+    
+    def rendition(self, size, fmt='jpeg'):
+        """Return the rendition path for a size and format, if generated."""
+        entry = (self.renditions or {}).get(size)
+        if not entry:
+            return None
+        return entry['formats'].get(fmt)
     
     def __repr__(self):
         return f'<Media {self.filename}>'
+
+
+# Gallery, feed and admin lists: ORDER BY upload_time DESC, id DESC
+db.Index('ix_media_upload_time_id', Media.upload_time.desc(), Media.id.desc())
+# Gallery and feed sorted by capture date
+db.Index('ix_media_taken_at_id', Media.taken_at.desc(), Media.id.desc())
+
+
+class Job(db.Model):
+    """Background job processed by the `flask worker` command."""
+    
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_after', 'status', 'run_after'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.JSON)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)
+    last_error = db.Column(db.Text)
+    result = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        """Serialize the job for the status API."""
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'run_after': self.run_after.isoformat() if self.run_after else None,
+            'last_error': self.last_error,
+            'result': self.result,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+
+class UploadSession(db.Model):
+    """Resumable chunked upload in progress; bytes live in a staging file."""
+    
+    __tablename__ = 'upload_sessions'
+    
+    id = db.Column(db.String(32), primary_key=True)
+    original_filename = db.Column(db.String(255), nullable=False)
+    length = db.Column(db.BigInteger, nullable=False)
+    uploaded_by = db.Column(db.String(80))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    def __repr__(self):
+        return f'<UploadSession {self.id} {self.original_filename}>'
+
+
+class MediaStat(db.Model):
+    """Materialized gallery statistics, kept current by every media write.
+    
+    One ``total`` row plus one row per file type and per uploader. The
+    total row's ``version`` increases on every change and backs the
+    ``/api/stats`` ETag.
+    """
+    
+    __tablename__ = 'media_stats'
+    
+    scope = db.Column(db.String(20), primary_key=True)  # total, type, uploader
+    name = db.Column(db.String(80), primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+    bytes = db.Column(db.BigInteger, nullable=False, default=0)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<MediaStat {self.scope}:{self.name} {self.count}>'
@@ -1,26 +1,235 @@
 """API routes."""
-from flask import Blueprint, jsonify, current_app
+import os
+
+from flask import Blueprint, jsonify, current_app, request, session, url_for
+from sqlalchemy.orm import load_only
 
 from app.extensions import db
-from app.models import Media
+from app.models import Media, Job
 from app.utils import format_file_size
+from app.utils.images import image_url, rendition_url, upload_url
+from app.utils.ingest import new_batch_id, stage_uploads, store_staged_files
+from app.utils.page_cache import bump_content_version
+from app.utils.pagination import keyset_page
+from app.utils.serving import fingerprint
+from app.utils.stats import get_totals
 
 api = Blueprint('api', __name__, url_prefix='/api')
 
+# Public fields of the media feed and the columns each one needs
+MEDIA_FIELDS = {
+    'id': ('id',),
+    'filename': ('filename',),
+    'original_filename': ('original_filename',),
+    'file_type': ('file_type',),
+    'file_size': ('file_size',),
+    'upload_time': ('upload_time',),
+    'width': ('width',),
+    'height': ('height',),
+    'orientation': ('orientation',),
+    'taken_at': ('taken_at',),
+    'camera': ('camera',),
+    'placeholder': ('placeholder',),
+    'url': ('filename', 'content_hash'),
+    'thumb': ('filename', 'renditions', 'content_hash', 'width', 'height'),
+    'slide': ('filename', 'renditions', 'content_hash', 'width', 'height'),
+}
+DEFAULT_MEDIA_FIELDS = ('id', 'filename', 'file_size', 'upload_time', 'width', 'height',
+                        'placeholder', 'url', 'thumb', 'slide')
+
+# Public gallery orderings: newest upload first, or newest capture first
+GALLERY_SORTS = {
+    'uploaded': Media.upload_time,
+    'taken': Media.taken_at,
+}
+
+
+def serialize_media(media, fields=DEFAULT_MEDIA_FIELDS):
+    """Build the JSON representation of a Media row for the requested fields."""
+    data = {}
+    for field in fields:
+        if field == 'url':
+            data['url'] = upload_url(media)
+        elif field in ('thumb', 'slide'):
+            entry = (media.renditions or {}).get(field)
+            if entry:
+                data[field] = {
+                    'width': entry['width'],
+                    'height': entry['height'],
+                    'sources': {fmt: rendition_url(media, field, fmt) for fmt in entry['formats']},
+                    'src': rendition_url(media, field),
+                }
+            else:
+                # Same fallback as the picture macro: a layout-sized variant, not the original
+                data[field] = {
+                    'width': media.width,
+                    'height': media.height,
+                    'sources': {},
+                    'src': image_url(media, current_app.config['RENDITION_SIZES'][field]),
+                }
+        elif field in ('upload_time', 'taken_at'):
+            value = getattr(media, field)
+            data[field] = value and value.isoformat()
+        else:
+            data[field] = getattr(media, field)
+    return data
+
+
+def media_page_query(fields):
+    """Media query loading only the columns the requested fields need."""
+    columns = {'id', 'upload_time', 'taken_at'}
+    for field in fields:
+        columns.update(MEDIA_FIELDS[field])
+    return Media.query.filter(Media.is_missing.is_(False)).options(
+        load_only(*(getattr(Media, name) for name in columns)))
+
+
+def gallery_page(fields, args, limit):
+    """One keyset page of the gallery for the ``sort``, ``camera`` and ``cursor`` in ``args``.
+
+    Sorting and filtering use the indexed metadata columns only, so no image
+    file is read. Returns ``(rows, next_cursor)``; raises ValueError for a bad cursor.
+    """
+    sort_column = GALLERY_SORTS.get(args.get('sort'), Media.upload_time)
+    query = media_page_query(fields)
+    if sort_column is Media.taken_at:
+        # Rows the EXIF backfill has not reached yet have no capture time to seek on
+        query = query.filter(Media.taken_at.isnot(None))
+    if args.get('camera'):
+        query = query.filter(Media.camera == args['camera'])
+    return keyset_page(query, sort_column, Media.id, cursor=args.get('cursor'), limit=limit)
+
 
 @api.route('/stats')
 def stats():
     """API endpoint for gallery statistics."""
     try:
-        total_images = Media.query.count()
-        total_size = db.session.query(db.func.sum(Media.file_size)).scalar() or 0
-        
-        return jsonify({
-            'success': True,
-            'total_images': total_images,
-            'total_size': total_size,
-            'total_size_formatted': format_file_size(total_size),
-            'allowed_formats': list(current_app.config['ALLOWED_EXTENSIONS'])
-        })
+        # One primary-key read of the materialized totals
+        totals = get_totals()
+        # The timestamp keeps tags unique even if the table is ever recreated
+        etag = f"stats-{totals.version}-{totals.updated_at.timestamp():.0f}"
+        if etag in request.if_none_match:
+            response = current_app.response_class(status=304)
+        else:
+            response = jsonify({
+                'success': True,
+                'total_images': totals.count,
+                'total_size': totals.bytes,
+                'total_size_formatted': format_file_size(totals.bytes),
+                'allowed_formats': sorted(current_app.config['ALLOWED_EXTENSIONS']),
+                'version': totals.version,
+                'updated_at': totals.updated_at.isoformat() if totals.updated_at else None
+            })
+        response.set_etag(etag)
+        response.cache_control.no_cache = True  # always revalidate; a 304 is cheap
+        return response
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@api.route('/media')
+def media_feed():
+    """API endpoint for the gallery feed, paginated by keyset cursor.
+
+    ``sort=taken`` orders by capture date instead of upload; ``camera``
+    keeps one camera's photos.
+    """
+    fields = request.args.get('fields')
+    fields = [f.strip() for f in fields.split(',') if f.strip()] if fields else list(DEFAULT_MEDIA_FIELDS)
+    unknown = [f for f in fields if f not in MEDIA_FIELDS]
+    if unknown:
+        return jsonify({'success': False, 'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    
+    limit = request.args.get('limit', current_app.config['GALLERY_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, current_app.config['API_MAX_PAGE_SIZE']))
+    
+    try:
+        items, next_cursor = gallery_page(fields, request.args, limit)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    return jsonify({
+        'success': True,
+        'items': [serialize_media(item, fields) for item in items],
+        'next_cursor': next_cursor
+    })
+
+
+@api.route('/media/batch', methods=['POST'])
+def media_batch():
+    """Ingest a multi-file upload and report the outcome of every file."""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'error': 'Login required'}), 401
+    
+    files = [f for f in request.files.getlist('files') if f.filename]
+    if not files:
+        return jsonify({'success': False, 'error': 'No files selected'}), 400
+    if len(files) > current_app.config['UPLOAD_BATCH_MAX_FILES']:
+        return jsonify({'success': False,
+                        'error': f"At most {current_app.config['UPLOAD_BATCH_MAX_FILES']} files per batch"}), 413
+    
+    staged, errors = stage_uploads(files)
+    batch_id = new_batch_id()
+    uploaded_files, store_errors = store_staged_files(staged, session.get('username'), batch_id)
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': f"Database error: {e}"}), 500
+    if uploaded_files:
+        bump_content_version()
+    
+    results = [dict(item, status='duplicate' if item['duplicate'] else 'created',
+                    url=url_for('media.uploaded_file', filename=item['filename'],
+                                v=fingerprint(item['content_hash'])))
+               for item in uploaded_files]
+    results += [{'original_filename': name, 'status': 'error', 'error': message}
+                for name, message in errors + store_errors]
+    
+    return jsonify({
+        'success': not (errors or store_errors),
+        'batch_id': batch_id,
+        'created': len(uploaded_files),
+        'failed': len(errors) + len(store_errors),
+        'total_size': sum(item['size'] for item in uploaded_files),
+        'success_url': url_for('media.upload_success_batch', batch_id=batch_id) if uploaded_files else None,
+        'files': results
+    }), 201 if uploaded_files else 400
+
+
+@api.route('/jobs')
+def job_summary():
+    """API endpoint for background job queue counts."""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'error': 'Login required'}), 401
+    
+    counts = dict(db.session.query(Job.status, db.func.count(Job.id)).group_by(Job.status).all())
+    return jsonify({
+        'success': True,
+        'counts': {status: counts.get(status, 0) for status in ('queued', 'running', 'done', 'failed')}
+    })
+
+
+@api.route('/jobs/<int:job_id>')
+def job_status(job_id):
+    """API endpoint for the status of a single background job."""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'error': 'Login required'}), 401
+    
+    job = db.session.get(Job, job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job not found'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+
+@api.route('/cache')
+def cache_stats():
+    """API endpoint for cache hit/miss counters of this worker process."""
+    from app.routes.blog import render_cache
+    page_cache = current_app.extensions.get('page_cache')
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'blog_render': render_cache.stats(),
+        'page': page_cache.stats() if page_cache else None
+    })
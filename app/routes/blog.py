@@ -1,107 +1,213 @@
 """Blog route handlers."""
 from flask import Blueprint, render_template, abort, request, redirect, url_for, flash, session
 import os
-import markdown
-import yaml
 from datetime import datetime
 import re
 
+from app.utils.blog_index import BlogIndex
+from app.utils.page_cache import bump_content_version, cached_page
+from app.utils.search_index import SearchIndex
+from app.utils.render_cache import RenderCache
+
 blog = Blueprint('blog', __name__)
 
-# Path to blogs
-CONTENT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'content', 'blogs')
+# Path to blogs; read at import because the indexes below are built on it
+CONTENT_DIR = os.environ.get('BLOG_CONTENT_DIR') or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'content', 'blogs')
 
 
-def parse_blog(filename):
-    """Parse blog markdown file with frontmatter."""
-    filepath = os.path.join(CONTENT_DIR, filename)
-    
-    if not os.path.exists(filepath):
-        return None
-    
-    with open(filepath, 'r', encoding='utf-8') as f:
-        content = f.read()
-    
-    # Split frontmatter and content
+# Rendered posts, keyed by path + mtime + size
+render_cache = RenderCache(os.path.join(CONTENT_DIR, '.cache'))
+
+# Average adult reading speed used for the "N min read" estimate
+WORDS_PER_MINUTE = 200
+EXCERPT_LENGTH = 200
+
+
+def split_frontmatter(content):
+    """Split a post into its frontmatter dict and markdown body."""
     if content.startswith('---'):
         parts = content.split('---', 2)
         if len(parts) >= 3:
-            frontmatter = yaml.safe_load(parts[1])
-            md_content = parts[2].strip()
-        else:
-            frontmatter = {}
-            md_content = content
-    else:
-        frontmatter = {}
-        md_content = content
-    
-    # Convert markdown to HTML
-    html_content = markdown.markdown(
-        md_content, 
-        extensions=[
-            'fenced_code', 
-            'codehilite', 
-            'tables',
-            'nl2br',  # Convert newlines to <br> tags
-            'sane_lists'  # Better list handling
-        ]
-    )
-    
-    # Normalize date to datetime object
-    date_value = frontmatter.get('date', datetime.now())
+            # Imported on first use to keep application startup fast
+            import yaml
+            return yaml.safe_load(parts[1]) or {}, parts[2].strip()
+    return {}, content
+
+
+def format_post(frontmatter, content):
+    """Serialize frontmatter and a markdown body into a post file."""
+    import yaml
+    return f"---\n{yaml.dump(frontmatter, default_flow_style=False)}---\n\n{content}"
+
+
+def normalize_date(date_value):
+    """Normalize a frontmatter date to a datetime object."""
     if isinstance(date_value, str):
         try:
             # Try parsing common date formats
-            date_value = datetime.strptime(date_value, '%Y-%m-%d')
+            return datetime.strptime(date_value, '%Y-%m-%d')
         except ValueError:
             try:
-                date_value = datetime.strptime(date_value, '%Y-%m-%d %H:%M:%S')
+                return datetime.strptime(date_value, '%Y-%m-%d %H:%M:%S')
             except ValueError:
-                date_value = datetime.now()
+                return datetime.now()
     elif not isinstance(date_value, datetime):
         # If it's a date object, convert to datetime
         try:
-            date_value = datetime.combine(date_value, datetime.min.time())
+            return datetime.combine(date_value, datetime.min.time())
         except:
-            date_value = datetime.now()
-    
+            return datetime.now()
+    return date_value
+
+
+def post_metadata(frontmatter):
+    """Frontmatter fields with defaults, in JSON-serializable form."""
     return {
-        'filename': filename,
-        'slug': filename.replace('.md', ''),
         'title': frontmatter.get('title', 'Untitled'),
-        'date': date_value,
+        'date': normalize_date(frontmatter.get('date', datetime.now())).isoformat(),
         'author': frontmatter.get('author', 'BirdyPhillips'),
         'tags': frontmatter.get('tags', []),
-        'published': frontmatter.get('published', True),
-        'content': html_content
+        'published': frontmatter.get('published', True)
     }
 
 
-def get_all_blogs():
-    """Get all published blogs sorted by date."""
-    if not os.path.exists(CONTENT_DIR):
-        return []
+def plain_text(md_content):
+    """Strip the most common markdown syntax, leaving readable text."""
+    text = re.sub(r'```.*?```', ' ', md_content, flags=re.S)
+    text = re.sub(r'!\[[^\]]*\]\([^)]*\)', ' ', text)
+    text = re.sub(r'\[([^\]]*)\]\([^)]*\)', r'\1', text)
+    text = re.sub(r'^\s*(?:[-+]|\d+\.)\s+', '', text, flags=re.M)
+    text = re.sub(r'[#>*_`~|]+', ' ', text)
+    return ' '.join(text.split())
+
+
+def render_post(filepath):
+    """Read a markdown file and render it (the render cache's miss path)."""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        frontmatter, md_content = split_frontmatter(f.read())
     
+    # Convert markdown to HTML (markdown and Pygments load on the first render)
+    import markdown
+    html_content = markdown.markdown(
+        md_content, 
+        extensions=[
+            'fenced_code', 
+            'codehilite', 
+            'tables',
+            'nl2br',  # Convert newlines to <br> tags
+            'sane_lists'  # Better list handling
+        ]
+    )
+    
+    return dict(post_metadata(frontmatter), content=html_content)
+
+
+def read_listing(filepath):
+    """Listing metadata and the plain text of a post."""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        frontmatter, md_content = split_frontmatter(f.read())
+    
+    text = plain_text(md_content)
+    excerpt = text[:EXCERPT_LENGTH]
+    if len(text) > EXCERPT_LENGTH:
+        excerpt = excerpt.rsplit(' ', 1)[0] + '…'
+    
+    listing = dict(post_metadata(frontmatter),
+                   excerpt=excerpt,
+                   reading_time=max(1, round(len(text.split()) / WORDS_PER_MINUTE)))
+    return listing, text
+
+
+def extract_post(filepath):
+    """Read only what listings need from a post (the manifest's miss path)."""
+    return read_listing(filepath)[0]
+
+
+def extract_search_document(filepath):
+    """Listing metadata plus the text fields the search index tokenizes."""
+    listing, text = read_listing(filepath)
+    tags = listing['tags']
+    return dict(listing, fields={
+        'title': str(listing['title']),
+        'tags': ' '.join(map(str, tags)) if isinstance(tags, list) else str(tags),
+        'body': text
+    })
+
+
+# Frontmatter manifest used for listings and slug lookups
+post_index = BlogIndex(CONTENT_DIR, os.path.join(CONTENT_DIR, '.cache', 'index.json'), extract_post)
+
+# Inverted index behind /blog/search and /blog/tag/<tag>
+search_index = SearchIndex(CONTENT_DIR, os.path.join(CONTENT_DIR, '.cache', 'search.json'),
+                           extract_search_document)
+
+
+def parse_blog(filename):
+    """Parse blog markdown file with frontmatter."""
+    filepath = os.path.join(CONTENT_DIR, filename)
+    
+    try:
+        post = render_cache.get(filepath, render_post)
+    except FileNotFoundError:
+        return None
+    
+    return dict(post,
+                filename=filename,
+                slug=filename.replace('.md', ''),
+                date=datetime.fromisoformat(post['date']))
+
+
+def get_all_blogs(include_drafts=False):
+    """Get blog metadata (no rendered content) sorted by date, newest first."""
     blogs = []
-    for filename in os.listdir(CONTENT_DIR):
-        if filename.endswith('.md'):
-            blog = parse_blog(filename)
-            if blog and blog['published']:
-                blogs.append(blog)
+    for filename, meta in post_index.posts().items():
+        if meta['published'] or include_drafts:
+            blogs.append(dict(meta,
+                              filename=filename,
+                              slug=filename[:-3],
+                              date=datetime.fromisoformat(meta['date'])))
     
-    # Sort by date, newest first
     blogs.sort(key=lambda x: x['date'], reverse=True)
     return blogs
 
 
 @blog.route('/blog')
+@cached_page
 def blog_index():
     """Blog listing page."""
     blogs = get_all_blogs()
     return render_template('blog/index.html', blogs=blogs)
 
 
+def listing_entries(results):
+    """Shape ``(filename, metadata, ...)`` index results like ``get_all_blogs`` entries."""
+    return [dict(meta,
+                 filename=filename,
+                 slug=filename[:-3],
+                 date=datetime.fromisoformat(meta['date']))
+            for filename, meta, *_ in results]
+
+
+@blog.route('/blog/search')
+def blog_search():
+    """Full-text search over titles, bodies and tags, answered from the index."""
+    query = request.args.get('q', '').strip()
+    blogs = listing_entries(search_index.search(query)) if query else []
+    return render_template('blog/index.html', blogs=blogs, query=query)
+
+
+@blog.route('/blog/tag/<tag>')
+@cached_page
+def blog_tag(tag):
+    """Posts carrying a tag, newest first."""
+    blogs = listing_entries(search_index.tagged(tag))
+    blogs.sort(key=lambda x: x['date'], reverse=True)
+    return render_template('blog/index.html', blogs=blogs, tag=tag)
+
+
 @blog.route('/blog/<slug>')
+@cached_page
 def blog_post(slug):
     """Individual blog post page."""
     filename = slug if slug.endswith('.md') else f"{slug}.md"
@@ -166,7 +272,7 @@ def new_post():
         }
         
         # Create file content
-        file_content = f"---\n{yaml.dump(frontmatter, default_flow_style=False)}---\n\n{content}"
+        file_content = format_post(frontmatter, content)
         
         # Save file
         os.makedirs(CONTENT_DIR, exist_ok=True)
@@ -174,6 +280,10 @@ def new_post():
         
         with open(filepath, 'w', encoding='utf-8') as f:
             f.write(file_content)
+        render_cache.store(filepath, render_post)
+        post_index.update(filename)
+        search_index.update(filename)
+        bump_content_version()
         
         flash(f'✓ Blog post "{title}" created successfully!', 'success')
         return redirect(url_for('blog.blog_index'))
@@ -188,21 +298,14 @@ def edit_post(slug):
         flash('Please login first to edit blog posts.', 'error')
         return redirect(url_for('auth.login'))
     
-    # Find the markdown file
-    filename = slug if slug.endswith('.md') else f"{slug}.md"
-    
-    # Try to find the file (may have date prefix)
-    blog_file = None
-    for file in os.listdir(CONTENT_DIR):
-        if file.endswith(filename) or file == filename:
-            blog_file = file
-            break
+    # Resolve the slug (may omit its date prefix) through the manifest
+    blog_file = post_index.lookup(slug[:-3] if slug.endswith('.md') else slug)
     
     if not blog_file:
         flash(f'Blog post "{slug}" not found.', 'error')
         return redirect(url_for('blog.blog_index'))
     
-    filepath = os.path.join(CONTENT_DIR, essay_file)
+    filepath = os.path.join(CONTENT_DIR, blog_file)
     
     if request.method == 'POST':
         title = request.form.get('title', '').strip()
@@ -249,11 +352,15 @@ def edit_post(slug):
         }
         
         # Create file content
-        file_content = f"---\n{yaml.dump(frontmatter, default_flow_style=False)}---\n\n{content}"
+        file_content = format_post(frontmatter, content)
         
         # Save file
         with open(filepath, 'w', encoding='utf-8') as f:
             f.write(file_content)
+        render_cache.store(filepath, render_post)
+        post_index.update(blog_file)
+        search_index.update(blog_file)
+        bump_content_version()
         
         flash(f'✓ Blog post "{title}" updated successfully!', 'success')
         return redirect(url_for('blog.blog_index'))
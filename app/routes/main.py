@@ -1,52 +1,103 @@
 """Main application routes."""
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
-from werkzeug.utils import secure_filename
-from datetime import datetime
-import os
 
 from app.extensions import db
 from app.models import Media
-from app.utils import allowed_file, format_file_size
+from app.utils import format_file_size
+from app.utils.page_cache import cached_page
+from app.utils.pagination import ListPage
+from app.utils.stats import UNKNOWN_UPLOADER, get_breakdown, get_totals
+from app.jobs import enqueue
 
 main = Blueprint('main', __name__)
 
 
 @main.route('/')
+@cached_page
 def home():
     """Landing page."""
     return render_template('index.html')
 
 
 @main.route('/gallery')
+@cached_page
 def gallery():
-    """Gallery page with image slideshow."""
-    # Get all media from database, ordered by newest first
-    media_list = Media.query.order_by(Media.upload_time.desc()).all()
+    """Gallery page: the first page is rendered here, the rest streams from /api/media."""
+    from flask import current_app
+    from app.routes.api import DEFAULT_MEDIA_FIELDS, GALLERY_SORTS, gallery_page, serialize_media
     
-    # Build image data list
-    images = []
-    image_data = []
-    total_size = 0
+    sort = request.args.get('sort') if request.args.get('sort') in GALLERY_SORTS else 'uploaded'
+    camera = request.args.get('camera') or None
+    # The first page never takes a cursor; later pages come from the feed
+    page, next_cursor = gallery_page(DEFAULT_MEDIA_FIELDS, {'sort': sort, 'camera': camera},
+                                     limit=current_app.config['GALLERY_PAGE_SIZE'])
+    cameras = [name for (name,) in db.session.query(Media.camera).filter(
+        Media.camera.isnot(None), Media.is_missing.is_(False)).distinct().order_by(Media.camera)]
     
-    from flask import current_app
-    for media in media_list:
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], media.filename)
-        if os.path.exists(filepath):
-            images.append(media.filename)
-            image_data.append({
-                'name': media.filename,
-                'size': media.file_size,
-                'size_mb': round(media.file_size / (1024 * 1024), 2),
-                'modified': media.upload_time.strftime('%Y-%m-%d %H:%M:%S'),
-                'timestamp': media.upload_time.timestamp()
-            })
-            total_size += media.file_size
+    totals = get_totals()
     
     return render_template('gallery.html', 
-                         images=images,
-                         image_data=image_data,
-                         total_images=len(images),
-                         total_size=format_file_size(total_size))
+                         images=page,
+                         slides=[serialize_media(media) for media in page],
+                         next_cursor=next_cursor,
+                         sort=sort,
+                         camera=camera,
+                         cameras=cameras,
+                         total_images=totals.count,
+                         total_size=format_file_size(totals.bytes))
+
+
+# Sortable columns of the admin media table
+MEDIA_SORTS = {
+    'date': Media.upload_time,
+    'taken': Media.taken_at,
+    'name': Media.original_filename,
+    'size': Media.file_size,
+    'type': Media.file_type,
+}
+BLOG_SORTS = ('date', 'title')
+
+
+def admin_media_page(args, per_page):
+    """Filtered, sorted page of the admin media table; one COUNT and one SELECT."""
+    query = Media.query.filter(Media.is_missing.is_(False))
+    search = args.get('q', '').strip()
+    if search:
+        pattern = f"%{search}%"
+        query = query.filter(db.or_(Media.original_filename.ilike(pattern), Media.filename.ilike(pattern)))
+    if args.get('type'):
+        query = query.filter(Media.file_type == args['type'])
+    if args.get('uploader') == UNKNOWN_UPLOADER:
+        query = query.filter(db.or_(Media.uploaded_by.is_(None), Media.uploaded_by == UNKNOWN_UPLOADER))
+    elif args.get('uploader'):
+        query = query.filter(Media.uploaded_by == args['uploader'])
+    
+    column = MEDIA_SORTS.get(args.get('sort'), Media.upload_time)
+    if args.get('dir') == 'asc':
+        query = query.order_by(column.asc(), Media.id.asc())
+    else:
+        query = query.order_by(column.desc(), Media.id.desc())
+    page = query.paginate(page=args.get('page', 1, type=int), per_page=per_page, error_out=False)
+    if not page.items and page.page > page.pages > 0:
+        # A stale page number after deletes or a narrower filter: show the last page
+        page = query.paginate(page=page.pages, per_page=per_page, error_out=False)
+    return page
+
+
+def admin_blog_page(posts, args, per_page):
+    """Filtered, sorted page of the admin blog table, built from the manifest."""
+    search = args.get('bq', '').strip().lower()
+    if search:
+        posts = [post for post in posts
+                 if search in post['title'].lower() or search in ' '.join(post['tags']).lower()]
+    if args.get('status') in ('published', 'draft'):
+        posts = [post for post in posts if post['published'] == (args['status'] == 'published')]
+    
+    sort = args.get('bsort') if args.get('bsort') in BLOG_SORTS else 'date'
+    reverse = args.get('bdir', 'desc' if sort == 'date' else 'asc') == 'desc'
+    posts = sorted(posts, key=lambda post: post['title'].lower() if sort == 'title' else post['date'],
+                   reverse=reverse)
+    return ListPage(posts, args.get('bpage', 1, type=int), per_page)
 
 
 @main.route('/admin')
@@ -57,93 +108,48 @@ def admin_dashboard():
         return redirect(url_for('auth.login'))
     
     from flask import current_app
+    from app.routes.blog import get_all_blogs
+    per_page = current_app.config['ADMIN_PAGE_SIZE']
     
-    # Get media statistics
-    media_list = Media.query.order_by(Media.upload_time.desc()).all()
-    total_media = len(media_list)
-    total_media_size = sum(m.file_size for m in media_list)
-    recent_media = media_list[:10]  # Last 10 uploads
+    # Media statistics, read from the materialized stats table
+    totals = get_totals()
     
-    # Get blog statistics
-    from app.routes.blog import get_all_blogs, CONTENT_DIR
-    blogs = get_all_blogs()
+    # Blog statistics come from the frontmatter manifest; nothing is rendered
+    blogs = get_all_blogs(include_drafts=True)
     total_blogs = len(blogs)
-    published_blogs = len([b for b in blogs if b['published']])
+    published_blogs = sum(1 for b in blogs if b['published'])
     draft_blogs = total_blogs - published_blogs
     
-    # Build media data for management
-    media_data = []
-    for media in media_list:
-        media_data.append({
-            'id': media.id,
-            'filename': media.filename,
-            'original_filename': media.original_filename,
-            'file_type': media.file_type,
-            'file_size': media.file_size,
-            'size_formatted': format_file_size(media.file_size),
-            'upload_time': media.upload_time,
-            'uploaded_by': media.uploaded_by or 'Unknown'
-        })
-    
-    # Build blog data for management
-    blog_posts = []
-    for blog in blogs:
-        blog_posts.append({
-            'slug': blog['slug'],
-            'title': blog['title'],
-            'date': blog['date'],
-            'author': blog['author'],
-            'tags': blog['tags'],
-            'published': blog['published']
-        })
-    
     return render_template('admin_dashboard.html',
-                         total_media=total_media,
-                         total_media_size=format_file_size(total_media_size),
-                         recent_media=recent_media,
-                         media_data=media_data,
+                         active_tab=request.args.get('tab', 'media'),
+                         total_media=totals.count,
+                         total_media_size=format_file_size(totals.bytes),
+                         media_by_type=[(file_type, count, format_file_size(size))
+                                        for file_type, count, size in get_breakdown('type')],
+                         media_by_uploader=[(uploader, count, format_file_size(size))
+                                            for uploader, count, size in get_breakdown('uploader')],
+                         media_page=admin_media_page(request.args, per_page),
+                         media_sort=request.args.get('sort') if request.args.get('sort') in MEDIA_SORTS else 'date',
+                         media_dir='asc' if request.args.get('dir') == 'asc' else 'desc',
                          total_blogs=total_blogs,
                          published_blogs=published_blogs,
                          draft_blogs=draft_blogs,
-                         blog_data=blog_posts)
+                         blog_page=admin_blog_page(blogs, request.args, per_page),
+                         blog_sort=request.args.get('bsort') if request.args.get('bsort') in BLOG_SORTS else 'date',
+                         blog_dir=request.args.get('bdir', 'desc' if request.args.get('bsort', 'date') == 'date' else 'asc'))
 
 
 @main.route('/sync')
 def sync_filesystem():
-    """Admin route to sync filesystem with database."""
+    """Admin route to queue a filesystem/database reconcile."""
     if 'logged_in' not in session or not session['logged_in']:
         flash('Please login first.', 'error')
         return redirect(url_for('auth.login'))
     
-    from flask import current_app
     try:
-        # Get all files from uploads folder
-        files_in_folder = [f for f in os.listdir(current_app.config['UPLOAD_FOLDER']) 
-                          if allowed_file(f)]
-        
-        # Get all files from database
-        files_in_db = [m.filename for m in Media.query.all()]
-        
-        added = 0
-        # Add missing files to database
-        for filename in files_in_folder:
-            if filename not in files_in_db:
-                filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                file_size = os.path.getsize(filepath)
-                file_type = filename.rsplit('.', 1)[1].lower()
-                
-                new_media = Media(
-                    filename=filename,
-                    original_filename=filename,
-                    file_type=file_type,
-                    file_size=file_size,
-                    uploaded_by='system'
-                )
-                db.session.add(new_media)
-                added += 1
-        
+        job = enqueue('sync_uploads')
         db.session.commit()
-        flash(f'✓ Sync complete! Added {added} files to database.', 'success')
+        flash(f'✓ Sync queued (job #{job.id}); new and missing files will be picked up shortly.', 'success')
     except Exception as e:
         db.session.rollback()
         flash(f'Sync error: {str(e)}', 'error')
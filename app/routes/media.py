@@ -1,12 +1,26 @@
 """Media upload and management routes."""
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, send_from_directory, current_app
+from flask import Blueprint, abort, jsonify, render_template, request, redirect, url_for, flash, session, current_app
 from werkzeug.utils import secure_filename
-from datetime import datetime
+from datetime import datetime, timedelta
+import base64
 import os
+import uuid
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
 
 from app.extensions import db
-from app.models import Media
+from app.models import Media, UploadSession
 from app.utils import allowed_file, format_file_size
+from app.utils.images import RENDITION_DIR, delete_renditions, rendition_paths
+from app.utils.ingest import new_batch_id, public_filename, stage_uploads, store_staged_files
+from app.utils.page_cache import bump_content_version
+from app.utils.storage import CHUNK_SIZE, hash_file, objects_root, remove_blob
+from app.utils.serving import fingerprint, send_upload
+from app.utils.stats import record_media
+from app.utils.transform import clamp_width, get_variant, negotiate_format
 
 media = Blueprint('media', __name__)
 
@@ -29,55 +43,13 @@ def upload():
             flash('No files selected', 'error')
             return redirect(request.url)
         
-        uploaded_files = []
-        total_size = 0
-        errors = []
-        
-        for file in files:
-            if file.filename == '':
-                continue
-                
-            if file and allowed_file(file.filename):
-                try:
-                    original_filename = file.filename
-                    filename = secure_filename(file.filename)
-                    
-                    # Check if filename already exists in database
-                    existing_media = Media.query.filter_by(filename=filename).first()
-                    if existing_media:
-                        name, ext = os.path.splitext(filename)
-                        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                        filename = f"{name}_{timestamp}{ext}"
-                    
-                    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-                    file.save(filepath)
-                    
-                    # Get file info
-                    file_size = os.path.getsize(filepath)
-                    file_type = filename.rsplit('.', 1)[1].lower()
-                    
-                    # Save to database
-                    new_media = Media(
-                        filename=filename,
-                        original_filename=original_filename,
-                        file_type=file_type,
-                        file_size=file_size,
-                        uploaded_by=session.get('username')
-                    )
-                    db.session.add(new_media)
-                    
-                    uploaded_files.append({
-                        'filename': filename,
-                        'original_filename': original_filename,
-                        'size': file_size
-                    })
-                    total_size += file_size
-                except Exception as e:
-                    errors.append(f"{file.filename}: {str(e)}")
-            else:
-                errors.append(f"{file.filename}: Invalid file type")
+        # Stream every file to staging, hashing it on the way to disk
+        staged, errors = stage_uploads(files)
+        batch_id = new_batch_id()
+        uploaded_files, store_errors = store_staged_files(staged, session.get('username'), batch_id)
+        errors = [f"{name}: {message}" for name, message in errors + store_errors]
         
-        # Commit all uploads
+        # Commit all uploads; renditions are generated by the job worker
         if uploaded_files:
             try:
                 db.session.commit()
@@ -85,6 +57,7 @@ def upload():
                 db.session.rollback()
                 flash(f'Database error: {str(e)}', 'error')
                 return redirect(request.url)
+            bump_content_version()
         
         # Show results
         if uploaded_files:
@@ -92,9 +65,8 @@ def upload():
                 # Single file - redirect to splash page
                 return redirect(url_for('media.upload_success', filename=uploaded_files[0]['filename']))
             else:
-                # Multiple files - redirect to multi-upload success page
-                filenames = ','.join([f['filename'] for f in uploaded_files])
-                return redirect(url_for('media.upload_success_multi', filenames=filenames, count=len(uploaded_files), total_size=total_size))
+                # Multiple files - redirect to the batch's success page
+                return redirect(url_for('media.upload_success_batch', batch_id=batch_id))
         
         if errors:
             flash('Upload errors: ' + '; '.join(errors), 'error')
@@ -104,7 +76,161 @@ def upload():
             
         return redirect(request.url)
     
-    return render_template('upload.html')
+    return render_template('upload.html',
+                         chunk_size=current_app.config['CHUNKED_UPLOAD_CHUNK_SIZE'])
+
+
+# --- Resumable chunked uploads (tus-style: create, HEAD/PATCH, finalize) ---
+
+TUS_VERSION = '1.0.0'
+
+
+def _staging_path(session_id):
+    """Staging file that collects a chunked upload's bytes."""
+    return os.path.join(objects_root(current_app.config['UPLOAD_FOLDER']), 'tmp', f"{session_id}.part")
+
+
+def _parse_upload_metadata(header):
+    """Decode a tus ``Upload-Metadata`` header (``key base64value, ...``)."""
+    metadata = {}
+    for pair in header.split(','):
+        parts = pair.strip().split(' ', 1)
+        if parts[0]:
+            try:
+                metadata[parts[0]] = base64.b64decode(parts[1]).decode() if len(parts) > 1 else ''
+            except (ValueError, UnicodeDecodeError):
+                continue
+    return metadata
+
+
+def _tus_response(body, status, offset=None, **headers):
+    response = jsonify(body) if body is not None else current_app.response_class(status=status)
+    response.status_code = status
+    response.headers['Tus-Resumable'] = TUS_VERSION
+    response.headers['Cache-Control'] = 'no-store'
+    if offset is not None:
+        response.headers['Upload-Offset'] = str(offset)
+    response.headers.update(headers)
+    return response
+
+
+def _purge_expired_upload_sessions():
+    """Drop sessions (and staging files) abandoned longer than the TTL."""
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['CHUNKED_UPLOAD_TTL'])
+    for expired in UploadSession.query.filter(UploadSession.created_at < cutoff):
+        if os.path.exists(_staging_path(expired.id)):
+            os.remove(_staging_path(expired.id))
+        db.session.delete(expired)
+
+
+@media.route('/upload/sessions', methods=['POST'])
+def create_upload_session():
+    """Start a resumable upload; the client then PATCHes chunks to its URL."""
+    if not session.get('logged_in'):
+        return _tus_response({'success': False, 'error': 'Login required'}, 401)
+    
+    length = request.headers.get('Upload-Length', type=int)
+    filename = _parse_upload_metadata(request.headers.get('Upload-Metadata', '')).get('filename', '')
+    if length is None or length < 0:
+        return _tus_response({'success': False, 'error': 'Upload-Length header required'}, 400)
+    if length > current_app.config['CHUNKED_UPLOAD_MAX_SIZE']:
+        return _tus_response({'success': False, 'error': 'File too large'}, 413)
+    if not allowed_file(filename):
+        return _tus_response({'success': False, 'error': f"{filename or 'File'}: Invalid file type"}, 400)
+    
+    _purge_expired_upload_sessions()
+    upload_session = UploadSession(id=uuid.uuid4().hex, original_filename=filename,
+                                   length=length, uploaded_by=session.get('username'))
+    os.makedirs(os.path.dirname(_staging_path(upload_session.id)), exist_ok=True)
+    open(_staging_path(upload_session.id), 'wb').close()
+    db.session.add(upload_session)
+    db.session.commit()
+    
+    location = url_for('media.upload_session', session_id=upload_session.id)
+    return _tus_response({'success': True, 'id': upload_session.id, 'location': location},
+                         201, offset=0, Location=location)
+
+
+@media.route('/upload/sessions/<session_id>', methods=['HEAD', 'PATCH', 'DELETE'])
+def upload_session(session_id):
+    """Report the offset (HEAD), append a chunk (PATCH) or abort (DELETE)."""
+    if not session.get('logged_in'):
+        return _tus_response({'success': False, 'error': 'Login required'}, 401)
+    
+    upload_session = db.session.get(UploadSession, session_id)
+    path = _staging_path(session_id)
+    if upload_session is None or not os.path.exists(path):
+        return _tus_response({'success': False, 'error': 'Upload session not found'}, 404)
+    
+    # The staging file's size is the authoritative offset
+    offset = os.path.getsize(path)
+    
+    if request.method == 'HEAD':
+        return _tus_response(None, 200, offset=offset, **{'Upload-Length': str(upload_session.length)})
+    
+    if request.method == 'DELETE':
+        os.remove(path)
+        db.session.delete(upload_session)
+        db.session.commit()
+        return _tus_response(None, 204)
+    
+    if request.mimetype != 'application/offset+octet-stream':
+        return _tus_response({'success': False, 'error': 'Expected application/offset+octet-stream'}, 415)
+    if request.headers.get('Upload-Offset', type=int) != offset:
+        return _tus_response({'success': False, 'error': 'Offset mismatch'}, 409, offset=offset)
+    
+    remaining = upload_session.length - offset
+    with open(path, 'ab') as staging:
+        # One writer per session; a concurrent PATCH would interleave bytes
+        if fcntl is not None:
+            try:
+                fcntl.flock(staging, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return _tus_response({'success': False, 'error': 'Upload in progress'}, 409, offset=offset)
+        
+        # Copy the body in small blocks so memory stays flat whatever the chunk size
+        while remaining > 0:
+            block = request.stream.read(min(CHUNK_SIZE, remaining))
+            if not block:
+                break
+            staging.write(block)
+            remaining -= len(block)
+            offset += len(block)
+    
+    return _tus_response(None, 204, offset=offset)
+
+
+@media.route('/upload/sessions/<session_id>/finalize', methods=['POST'])
+def finalize_upload_session(session_id):
+    """Hash a completed chunked upload and store it like a regular upload."""
+    if not session.get('logged_in'):
+        return jsonify({'success': False, 'error': 'Login required'}), 401
+    
+    upload_session = db.session.get(UploadSession, session_id)
+    path = _staging_path(session_id)
+    if upload_session is None or not os.path.exists(path):
+        return jsonify({'success': False, 'error': 'Upload session not found'}), 404
+    
+    offset = os.path.getsize(path)
+    if offset != upload_session.length:
+        return jsonify({'success': False, 'error': 'Upload incomplete', 'offset': offset}), 409
+    
+    # Files finalized with the same batch id share one success page
+    batch_id = (request.get_json(silent=True) or {}).get('batch_id')
+    if not (isinstance(batch_id, str) and len(batch_id) == 32 and batch_id.isalnum()):
+        batch_id = None
+    
+    original_filename = upload_session.original_filename
+    staged = [(original_filename, public_filename(original_filename), path, hash_file(path), offset)]
+    uploaded_files, errors = store_staged_files(staged, upload_session.uploaded_by, batch_id)
+    if errors:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': '; '.join(message for _name, message in errors)}), 500
+    
+    db.session.delete(upload_session)
+    db.session.commit()
+    bump_content_version()
+    return jsonify(dict(uploaded_files[0], success=True)), 201
 
 
 @media.route('/upload/success/<filename>')
@@ -131,37 +257,48 @@ def upload_success(filename):
 
 @media.route('/upload/success/multi')
 def upload_success_multi():
-    """Show multi-upload success page."""
+    """Show multi-upload success page for a list of filenames."""
     if 'logged_in' not in session or not session['logged_in']:
         flash('Please login first.', 'error')
         return redirect(url_for('auth.login'))
     
-    filenames_str = request.args.get('filenames', '')
-    count = request.args.get('count', 0, type=int)
-    total_size = request.args.get('total_size', 0, type=int)
-    
-    if not filenames_str:
+    filenames = [secure_filename(name) for name in request.args.get('filenames', '').split(',') if name]
+    if not filenames:
         flash('No files uploaded', 'error')
         return redirect(url_for('main.admin_dashboard'))
     
-    filenames = filenames_str.split(',')
+    # One IN query for the whole list
+    items = Media.query.filter(Media.filename.in_(filenames)).order_by(Media.id).all()
+    return render_upload_batch(items)
+
+
+@media.route('/upload/success/batch/<batch_id>')
+def upload_success_batch(batch_id):
+    """Show the success page for every file of one upload batch."""
+    if 'logged_in' not in session or not session['logged_in']:
+        flash('Please login first.', 'error')
+        return redirect(url_for('auth.login'))
     
-    # Get media info from database
-    uploaded_images = []
-    for filename in filenames:
-        media_item = Media.query.filter_by(filename=secure_filename(filename)).first()
-        if media_item:
-            uploaded_images.append({
-                'filename': media_item.filename,
-                'original_filename': media_item.original_filename,
-                'file_size': format_file_size(media_item.file_size),
-                'file_type': media_item.file_type.upper()
-            })
+    items = Media.query.filter_by(batch_id=batch_id).order_by(Media.id).all()
+    if not items:
+        flash('No files uploaded', 'error')
+        return redirect(url_for('main.admin_dashboard'))
+    return render_upload_batch(items)
+
+
+def render_upload_batch(items):
+    """Render the multi-upload success page for already-loaded Media rows."""
+    uploaded_images = [{
+        'filename': media_item.filename,
+        'original_filename': media_item.original_filename,
+        'file_size': format_file_size(media_item.file_size),
+        'file_type': media_item.file_type.upper()
+    } for media_item in items]
     
     return render_template('upload_success_multi.html',
                          images=uploaded_images,
-                         count=count,
-                         total_size=format_file_size(total_size))
+                         count=len(items),
+                         total_size=format_file_size(sum(m.file_size or 0 for m in items)))
 
 
 @media.route('/delete/<filename>', methods=['POST'])
@@ -176,15 +313,30 @@ def delete_image(filename):
         media_item = Media.query.filter_by(filename=secure_filename(filename)).first()
         
         if media_item:
-            # Delete physical file
-            filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], media_item.filename)
+            # Delete the public link; the blob goes with the last row holding its hash
+            upload_folder = current_app.config['UPLOAD_FOLDER']
+            filepath = os.path.join(upload_folder, media_item.filename)
             if os.path.exists(filepath):
                 os.remove(filepath)
+            others = []
+            if media_item.content_hash:
+                others = db.session.query(Media.renditions).filter(
+                    Media.content_hash == media_item.content_hash, Media.id != media_item.id
+                ).all()
+                if not others:
+                    remove_blob(upload_folder, media_item.content_hash)
+            # Renditions are named after the file that produced them; duplicates
+            # may point at the same paths, which are kept while any row does
+            in_use = set().union(*(rendition_paths(renditions) for (renditions,) in others))
+            delete_renditions(upload_folder, media_item.renditions, keep=in_use)
             
-            # Delete from database
+            # Delete from database; a missing file was already taken out of the stats
             file_size = media_item.file_size
+            if not media_item.is_missing:
+                record_media([(media_item.file_type, media_item.uploaded_by, file_size)], sign=-1)
             db.session.delete(media_item)
             db.session.commit()
+            bump_content_version()
             
             flash(f'✓ "{filename}" deleted successfully ({format_file_size(file_size)} freed)', 'success')
         else:
@@ -199,4 +351,44 @@ def delete_image(filename):
 @media.route('/uploads/<filename>')
 def uploaded_file(filename):
     """Serve uploaded images."""
-    return send_from_directory(current_app.config['UPLOAD_FOLDER'], filename)
+    # The content hash is a strong validator and the URL fingerprint
+    content_hash = db.session.query(Media.content_hash).filter_by(filename=filename).scalar()
+    return send_upload(filename, etag=content_hash, version=fingerprint(content_hash))
+
+
+@media.route('/uploads/renditions/<size>/<filename>')
+def rendition_file(size, filename):
+    """Serve a resized rendition of an uploaded image."""
+    if size not in current_app.config['RENDITION_SIZES']:
+        abort(404)
+    # Renditions are named <original filename>.<ext>; they share its fingerprint
+    source = filename.rsplit('.', 1)[0]
+    content_hash = db.session.query(Media.content_hash).filter_by(filename=source).scalar()
+    return send_upload(f"{RENDITION_DIR}/{size}/{filename}", version=fingerprint(content_hash))
+
+
+@media.route('/img/<filename>')
+def transform_image(filename):
+    """Serve an upload resized to ``w`` and transcoded to ``fmt`` (or the Accept header's best)."""
+    config = current_app.config
+    item = db.session.query(Media.content_hash, Media.file_size).filter_by(
+        filename=filename, is_missing=False).first()
+    if item is None or not os.path.isfile(os.path.join(config['UPLOAD_FOLDER'], filename)):
+        abort(404)
+    
+    width = clamp_width(request.args.get('w', max(config['IMAGE_WIDTHS']), type=int), config['IMAGE_WIDTHS'])
+    low, high = config['IMAGE_QUALITY_RANGE']
+    quality = min(max(request.args.get('q', config['RENDITION_QUALITY'], type=int), low), high)
+    fmt, negotiated = negotiate_format(request.accept_mimetypes, request.args.get('fmt'))
+    if fmt is None:
+        abort(400)
+    
+    # Files never hashed fall back to their size as the cache version
+    version = item.content_hash or f"size-{item.file_size}"
+    relpath = get_variant(config['UPLOAD_FOLDER'], filename, version, width, fmt, quality,
+                          config['IMAGE_CACHE_MAX_BYTES'])
+    response = send_upload(relpath, etag=relpath.rsplit('/', 1)[1].split('.')[0],
+                           version=fingerprint(item.content_hash))
+    if negotiated:
+        response.vary.add('Accept')
+    return response
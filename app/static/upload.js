@@ -0,0 +1,180 @@
+// Resumable chunked uploads for the upload form.
+//
+// Each file gets an upload session on the server and is sent in fixed-size
+// chunks with PATCH requests. A failed chunk is retried with backoff, and a
+// session URL is remembered in localStorage so re-selecting the same file
+// after a reload or dropped connection resumes from the server's offset.
+(function () {
+    const form = document.getElementById('uploadForm');
+    if (!form || !window.fetch || !window.Blob || !Blob.prototype.slice) {
+        return;
+    }
+
+    const CHUNK_SIZE = parseInt(form.dataset.chunkSize, 10) || 8 * 1024 * 1024;
+    const MAX_RETRIES = 5;
+    const progress = document.getElementById('upload-progress');
+    const button = form.querySelector('button[type="submit"]');
+
+    function storageKey(file) {
+        return `upload:${file.name}:${file.size}:${file.lastModified}`;
+    }
+
+    function sleep(ms) {
+        return new Promise(resolve => setTimeout(resolve, ms));
+    }
+
+    function formatMB(bytes) {
+        return (bytes / 1024 / 1024).toFixed(1);
+    }
+
+    function encodeMetadata(value) {
+        return btoa(unescape(encodeURIComponent(value)));
+    }
+
+    async function withRetry(fn) {
+        for (let attempt = 0; ; attempt++) {
+            try {
+                return await fn();
+            } catch (err) {
+                if (err.fatal || attempt >= MAX_RETRIES) {
+                    throw err;
+                }
+                await sleep(Math.min(1000 * 2 ** attempt, 30000));
+            }
+        }
+    }
+
+    function fail(message, fatal) {
+        const err = new Error(message);
+        err.fatal = fatal;
+        return err;
+    }
+
+    async function createSession(file) {
+        const response = await fetch(form.dataset.sessionsUrl, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {
+                'Tus-Resumable': '1.0.0',
+                'Upload-Length': String(file.size),
+                'Upload-Metadata': `filename ${encodeMetadata(file.name)}`
+            }
+        });
+        const body = await response.json().catch(() => ({}));
+        if (!response.ok) {
+            throw fail(body.error || `Could not start upload (${response.status})`, response.status < 500);
+        }
+        return body.location;
+    }
+
+    // Returns the server's offset for a remembered session, or null if it is gone
+    async function resumeOffset(location) {
+        const response = await fetch(location, {
+            method: 'HEAD',
+            credentials: 'same-origin',
+            headers: {'Tus-Resumable': '1.0.0'}
+        });
+        if (!response.ok) {
+            return null;
+        }
+        return parseInt(response.headers.get('Upload-Offset'), 10);
+    }
+
+    async function sendChunk(location, file, offset) {
+        const response = await fetch(location, {
+            method: 'PATCH',
+            credentials: 'same-origin',
+            headers: {
+                'Tus-Resumable': '1.0.0',
+                'Content-Type': 'application/offset+octet-stream',
+                'Upload-Offset': String(offset)
+            },
+            body: file.slice(offset, offset + CHUNK_SIZE)
+        });
+        if (response.status === 409 && response.headers.has('Upload-Offset')) {
+            // Server has a different offset (e.g. a retried chunk already landed)
+            return parseInt(response.headers.get('Upload-Offset'), 10);
+        }
+        if (!response.ok) {
+            throw fail(`Chunk failed (${response.status})`, response.status < 500);
+        }
+        return parseInt(response.headers.get('Upload-Offset'), 10);
+    }
+
+    async function finalize(location, batchId) {
+        const response = await fetch(`${location}/finalize`, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({batch_id: batchId})
+        });
+        const body = await response.json().catch(() => ({}));
+        if (!response.ok) {
+            throw fail(body.error || `Finalize failed (${response.status})`, response.status < 500);
+        }
+        return body;
+    }
+
+    async function uploadFile(file, batchId, report) {
+        const key = storageKey(file);
+        let location = localStorage.getItem(key);
+        let offset = location ? await withRetry(() => resumeOffset(location)) : null;
+
+        if (offset === null || Number.isNaN(offset)) {
+            location = await withRetry(() => createSession(file));
+            localStorage.setItem(key, location);
+            offset = 0;
+        }
+
+        while (offset < file.size) {
+            report(offset);
+            const start = offset;
+            offset = await withRetry(() => sendChunk(location, file, start));
+        }
+        report(file.size);
+
+        const result = await withRetry(() => finalize(location, batchId));
+        localStorage.removeItem(key);
+        return result;
+    }
+
+    form.addEventListener('submit', async function (e) {
+        const files = Array.from(document.getElementById('files').files);
+        if (files.length === 0) {
+            return;
+        }
+        e.preventDefault();
+        button.disabled = true;
+
+        const totalBytes = files.reduce((sum, file) => sum + file.size, 0);
+        // Files finalized with one batch id share a success page
+        const batchId = Array.from(crypto.getRandomValues(new Uint8Array(16)),
+                                   byte => byte.toString(16).padStart(2, '0')).join('');
+        let doneBytes = 0;
+        const uploaded = [];
+        const errors = [];
+
+        for (const [index, file] of files.entries()) {
+            try {
+                const result = await uploadFile(file, batchId, sent => {
+                    const percent = totalBytes ? Math.floor((doneBytes + sent) / totalBytes * 100) : 100;
+                    progress.textContent = `Uploading ${index + 1}/${files.length}: ${file.name} ` +
+                        `(${formatMB(sent)} / ${formatMB(file.size)} MB) — ${percent}%`;
+                });
+                uploaded.push(result);
+            } catch (err) {
+                errors.push(`${file.name}: ${err.message}`);
+            }
+            doneBytes += file.size;
+        }
+
+        if (uploaded.length === 1 && errors.length === 0) {
+            window.location = form.dataset.successUrl.replace('__FILENAME__', encodeURIComponent(uploaded[0].filename));
+        } else if (uploaded.length > 0 && errors.length === 0) {
+            window.location = form.dataset.successBatchUrl.replace('__BATCH__', batchId);
+        } else {
+            progress.textContent = `Upload errors: ${errors.join('; ')}`;
+            button.disabled = false;
+        }
+    });
+})();
@@ -0,0 +1,51 @@
+"""Background job handlers run by the `flask worker` process pool."""
+import os
+
+from flask import current_app
+
+from app.extensions import db
+from app.jobs import task
+from app.models import Media
+from app.utils.images import (build_renditions, generate_placeholder, image_columns, placeholder_source,
+                              read_image_info)
+from app.utils.page_cache import bump_content_version
+from app.utils.storage import adopt_file, hash_file
+from app.utils.sync import reconcile
+
+
+@task('process_image')
+def process_image(payload):
+    """Generate renditions for a freshly uploaded image."""
+    media = db.session.get(Media, payload['media_id'])
+    if media is None:
+        return {'skipped': 'media deleted'}
+    
+    # Files that arrived through sync rather than upload are not hashed yet
+    if not media.content_hash:
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        media.content_hash = hash_file(os.path.join(upload_folder, media.filename))
+        adopt_file(upload_folder, media.filename, media.content_hash)
+    if media.width is None:
+        info = read_image_info(os.path.join(current_app.config['UPLOAD_FOLDER'], media.filename))
+        for column, value in image_columns(info, media.upload_time).items():
+            setattr(media, column, value)
+    
+    media.renditions = build_renditions(media.filename)
+    media.placeholder = generate_placeholder(
+        placeholder_source(current_app.config['UPLOAD_FOLDER'], media.filename, media.renditions))
+    db.session.commit()
+    bump_content_version()
+    return {'filename': media.filename, 'renditions': sorted(media.renditions)}
+
+
+@task('export_static')
+def export_static(payload):
+    """Re-render the public pages whose inputs changed."""
+    from app.utils.static_export import export_static as run_export
+    return run_export(current_app._get_current_object(), full=payload.get('full', False))
+
+
+@task('sync_uploads')
+def sync_uploads(payload):
+    """Reconcile the uploads folder with the media table."""
+    return reconcile(full=payload.get('full', False))
@@ -0,0 +1,145 @@
+"""Frontmatter-only manifest of the blog content directory.
+
+The manifest maps every post file to its frontmatter, excerpt and reading
+time, plus a slug -> filename map. It is refreshed incrementally: a read
+stats the post files (one ``scandir``, no file is opened, at most once
+per ``RECHECK_INTERVAL``) and compares them with the mtimes and sizes
+stored in the manifest, so posts added, removed or edited in place
+outside the admin UI are picked up. Only files whose mtime or size moved
+are re-read. Writers call ``update`` after
+saving a post.
+"""
+import json
+import os
+import threading
+import time
+
+INDEX_VERSION = 1
+
+# Seconds between per-file checks for posts edited in place
+RECHECK_INTERVAL = 1.0
+
+
+class BlogIndex:
+    """Persistent manifest of post metadata for a content directory."""
+
+    def __init__(self, content_dir, index_path, extract):
+        self.content_dir = content_dir
+        self.index_path = index_path
+        self.extract = extract  # extract(filepath) -> metadata dict
+        self._data = None
+        self._loaded_key = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _empty():
+        return {'version': INDEX_VERSION, 'dir_mtime': None, 'posts': {}, 'slugs': {}}
+
+    def _load(self):
+        """Reload the manifest file if another process rewrote it."""
+        try:
+            st = os.stat(self.index_path)
+        except FileNotFoundError:
+            if self._data is None:
+                self._data = self._empty()
+            return
+        key = (st.st_mtime_ns, st.st_size)
+        if key == self._loaded_key:
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except ValueError:
+            data = self._empty()
+        if data.get('version') != self._empty()['version']:
+            data = self._empty()
+        self._data = data
+        self._loaded_key = key
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f)
+        os.replace(tmp_path, self.index_path)
+        st = os.stat(self.index_path)
+        self._loaded_key = (st.st_mtime_ns, st.st_size)
+
+    def _rescan(self, changed=(), full=False):
+        """Re-stat the directory and re-extract new or modified posts."""
+        posts = self._data['posts']
+        seen = set()
+        for entry in os.scandir(self.content_dir):
+            if not entry.name.endswith('.md') or not entry.is_file():
+                continue
+            st = entry.stat()
+            seen.add(entry.name)
+            current = posts.get(entry.name)
+            if (full or entry.name in changed or current is None
+                    or current['mtime_ns'] != st.st_mtime_ns or current['size'] != st.st_size):
+                meta = self.extract(entry.path)
+                meta.update(mtime_ns=st.st_mtime_ns, size=st.st_size)
+                self._changed(entry.name, current, meta)
+                posts[entry.name] = meta
+
+        for filename in set(posts) - seen:
+            self._changed(filename, posts.pop(filename), None)
+
+        self._data['slugs'] = {filename[:-3]: filename for filename in posts}
+        self._data['dir_mtime'] = os.stat(self.content_dir).st_mtime_ns
+        self._save()
+
+    def _stale(self):
+        """True if a post was added, removed or edited since the last scan."""
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < RECHECK_INTERVAL:
+            return False
+        self._checked_at = now
+        posts = self._data['posts']
+        count = 0
+        for entry in os.scandir(self.content_dir):
+            if not entry.name.endswith('.md') or not entry.is_file():
+                continue
+            count += 1
+            current = posts.get(entry.name)
+            st = entry.stat()
+            if current is None or current['mtime_ns'] != st.st_mtime_ns or current['size'] != st.st_size:
+                return True
+        return count != len(posts)
+
+    def _changed(self, filename, old, new):
+        """Hook for subclasses: a post was added, re-read (``old`` set) or removed (``new`` None)."""
+
+    def refresh(self, force=False):
+        """Bring the manifest up to date and return it."""
+        if not os.path.isdir(self.content_dir):
+            return self._empty()
+        with self._lock:
+            self._load()
+            if force:
+                self._rescan(full=True)
+            elif self._data['dir_mtime'] != os.stat(self.content_dir).st_mtime_ns or self._stale():
+                # In-place edits leave the directory mtime alone, hence the per-file check
+                self._rescan()
+            return self._data
+
+    def update(self, filename):
+        """Re-index one post right after it was written."""
+        with self._lock:
+            self._load()
+            self._rescan(changed={filename})
+
+    def posts(self):
+        """Metadata for every post, keyed by filename."""
+        return self.refresh()['posts']
+
+    def lookup(self, slug):
+        """Resolve a slug (with or without its date prefix) to a filename."""
+        slugs = self.refresh()['slugs']
+        if slug in slugs:
+            return slugs[slug]
+        for full_slug, filename in slugs.items():
+            if full_slug.endswith(f"-{slug}"):
+                return filename
+        return None
@@ -0,0 +1,225 @@
+"""Image processing helpers for BirdyPhillips application.
+
+Pillow is imported inside the functions that decode or encode images, so
+web processes that only build URLs never pay for loading it.
+"""
+import base64
+import io
+import os
+from datetime import datetime
+
+from flask import current_app, url_for
+
+from app.utils.serving import fingerprint
+
+# Renditions live under UPLOAD_FOLDER/renditions/<size>/<filename>.<ext>
+RENDITION_DIR = 'renditions'
+
+FORMAT_EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp', 'avif': 'avif'}
+FORMAT_MIMETYPES = {'jpeg': 'image/jpeg', 'webp': 'image/webp', 'avif': 'image/avif'}
+
+# EXIF tags read at ingest
+EXIF_IFD = 0x8769
+EXIF_ORIENTATION = 0x0112
+EXIF_DATETIME = 0x0132
+EXIF_DATETIME_ORIGINAL = 0x9003
+EXIF_MAKE = 0x010F
+EXIF_MODEL = 0x0110
+
+# Placeholders: a tiny JPEG inlined as a data: URI, around 300 bytes before base64
+PLACEHOLDER_EDGE = 16
+PLACEHOLDER_QUALITY = 40
+
+FORMAT_OPTIONS = {
+    'jpeg': {'optimize': True, 'progressive': True},
+    'webp': {'method': 4},
+    'avif': {'speed': 8},
+}
+
+
+def supported_formats(formats):
+    """Filter formats down to the ones this Pillow build can encode."""
+    from PIL import features
+    return [fmt for fmt in formats if fmt == 'jpeg' or features.check(fmt)]
+
+
+def _exif_text(value):
+    if isinstance(value, bytes):
+        value = value.decode('ascii', 'ignore')
+    return ' '.join(str(value).replace('\x00', ' ').split()) if value else ''
+
+
+def read_image_info(path):
+    """Dimensions and EXIF facts of an image, read from its header only.
+
+    Returns ``{'width', 'height', 'orientation', 'taken_at', 'camera'}``;
+    width and height are as displayed (swapped for 90-degree orientations),
+    ``taken_at`` and ``camera`` are None when the file does not record them.
+    """
+    from PIL import Image
+    # Image.open parses the header lazily; the pixel data is never decoded here
+    with Image.open(path) as image:
+        width, height = image.size
+        exif = image.getexif()
+        details = exif.get_ifd(EXIF_IFD)
+
+    orientation = exif.get(EXIF_ORIENTATION) or 1
+    if orientation in (5, 6, 7, 8):
+        width, height = height, width
+
+    taken_at = None
+    for raw in (details.get(EXIF_DATETIME_ORIGINAL), exif.get(EXIF_DATETIME)):
+        try:
+            taken_at = datetime.strptime(_exif_text(raw)[:19], '%Y:%m:%d %H:%M:%S')
+            break
+        except ValueError:
+            continue  # missing, or a placeholder like 0000:00:00 00:00:00
+
+    make, model = _exif_text(exif.get(EXIF_MAKE)), _exif_text(exif.get(EXIF_MODEL))
+    # Most models already start with the make ("Canon EOS R6")
+    camera = model if model.lower().startswith(make.lower()) else f"{make} {model}".strip()
+
+    return {
+        'width': width,
+        'height': height,
+        'orientation': orientation,
+        'taken_at': taken_at,
+        'camera': camera[:100] or None,
+    }
+
+
+def image_columns(info, uploaded_at):
+    """Media column values for ``read_image_info`` output; capture time falls back to the upload."""
+    return {
+        'width': info.get('width'),
+        'height': info.get('height'),
+        'orientation': info.get('orientation'),
+        'taken_at': info.get('taken_at') or uploaded_at,
+        'camera': info.get('camera'),
+    }
+
+
+def rendition_path(size_name, filename, fmt):
+    """Return the rendition path relative to the rendition folder."""
+    return f"{size_name}/{filename}.{FORMAT_EXTENSIONS[fmt]}"
+
+
+def _flatten(image):
+    """Convert an image to RGB, compositing any transparency onto white."""
+    if image.mode == 'RGB':
+        return image
+    if image.mode in ('RGBA', 'LA') or 'transparency' in image.info:
+        from PIL import Image
+        rgba = image.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def _save_atomic(image, path, fmt, quality):
+    """Encode an image to a temp file and move it into place."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    image.save(tmp_path, format=fmt.upper(), quality=quality, **FORMAT_OPTIONS[fmt])
+    os.replace(tmp_path, path)
+
+
+def generate_renditions(upload_folder, filename, sizes, formats, quality=82):
+    """Write resized copies of an upload and describe them.
+
+    ``sizes`` maps a rendition name to its longest edge in pixels. Returns
+    ``{size_name: {'width': w, 'height': h, 'formats': {fmt: relpath}}}``
+    suitable for storing on ``Media.renditions``.
+    """
+    from PIL import Image, ImageOps
+    source = os.path.join(upload_folder, filename)
+    target_root = os.path.join(upload_folder, RENDITION_DIR)
+    formats = supported_formats(formats)
+    renditions = {}
+
+    with Image.open(source) as original:
+        # Let the JPEG decoder downscale while decoding; far cheaper than a
+        # full-resolution decode of a 12 MP phone photo.
+        largest = max(sizes.values())
+        original.draft('RGB', (largest, largest))
+        image = _flatten(ImageOps.exif_transpose(original))
+
+    # Largest first so each smaller size is resampled from the previous one
+    for size_name, edge in sorted(sizes.items(), key=lambda item: -item[1]):
+        image = image.copy()
+        image.thumbnail((edge, edge), Image.LANCZOS)
+        entry = {'width': image.width, 'height': image.height, 'formats': {}}
+        for fmt in formats:
+            relpath = rendition_path(size_name, filename, fmt)
+            _save_atomic(image, os.path.join(target_root, relpath), fmt, quality)
+            entry['formats'][fmt] = relpath
+        renditions[size_name] = entry
+
+    return renditions
+
+
+def placeholder_source(upload_folder, filename, renditions):
+    """Smallest existing file to draw a placeholder from: the thumb rendition, else the original."""
+    formats = (renditions or {}).get('thumb', {}).get('formats', {})
+    for fmt in ('jpeg', 'webp', 'avif'):
+        if fmt in formats:
+            return os.path.join(upload_folder, RENDITION_DIR, formats[fmt])
+    return os.path.join(upload_folder, filename)
+
+
+def generate_placeholder(path):
+    """Encode an image as a ``data:image/jpeg`` URI of at most ``PLACEHOLDER_EDGE`` pixels."""
+    from PIL import Image, ImageOps
+    with Image.open(path) as original:
+        # JPEG sources decode at 1/8 scale, so even an original costs little
+        original.draft('RGB', (PLACEHOLDER_EDGE, PLACEHOLDER_EDGE))
+        image = _flatten(ImageOps.exif_transpose(original))
+    image.thumbnail((PLACEHOLDER_EDGE, PLACEHOLDER_EDGE), Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format='JPEG', quality=PLACEHOLDER_QUALITY, optimize=True)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def rendition_paths(renditions):
+    """Relative paths of every rendition file recorded for a media item."""
+    return {relpath for entry in (renditions or {}).values() for relpath in entry.get('formats', {}).values()}
+
+
+def delete_renditions(upload_folder, renditions, keep=()):
+    """Remove every rendition file recorded for a media item, except the paths in ``keep``."""
+    target_root = os.path.join(upload_folder, RENDITION_DIR)
+    for relpath in rendition_paths(renditions) - set(keep):
+        path = os.path.join(target_root, relpath)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def build_renditions(filename):
+    """Generate renditions for an upload using the app configuration."""
+    config = current_app.config
+    return generate_renditions(config['UPLOAD_FOLDER'], filename,
+                               config['RENDITION_SIZES'],
+                               config['RENDITION_FORMATS'],
+                               config['RENDITION_QUALITY'])
+
+
+def rendition_url(media, size, fmt='jpeg'):
+    """URL of a rendition, or None when it has not been generated."""
+    relpath = media.rendition(size, fmt)
+    if not relpath:
+        return None
+    size_name, filename = relpath.split('/', 1)
+    return url_for('media.rendition_file', size=size_name, filename=filename,
+                   v=fingerprint(media.content_hash))
+
+
+def upload_url(media):
+    """Fingerprinted URL of an original upload."""
+    return url_for('media.uploaded_file', filename=media.filename, v=fingerprint(media.content_hash))
+
+
+def image_url(item, width, fmt=None):
+    """URL of an on-demand variant of a Media row (or a bare filename)."""
+    return url_for('media.transform_image', filename=getattr(item, 'filename', item), w=width, fmt=fmt,
+                   v=fingerprint(getattr(item, 'content_hash', None)))
@@ -0,0 +1,200 @@
+"""Batch ingest of uploaded files into blob storage and the media table.
+
+A batch costs a fixed number of database round trips whatever its size:
+one IN query for name collisions and known hashes, one bulk INSERT for
+the rows, one IN query to read back their ids and one bulk INSERT for
+their processing jobs. File work (hashing into
+staging, moving blobs, linking public names, reading image headers for
+dimensions and EXIF) runs in a thread pool;
+hashlib and file I/O release the GIL, so large batches use several cores
+and overlap disk waits.
+"""
+import os
+import uuid
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import current_app
+from sqlalchemy import insert, or_
+from werkzeug.utils import secure_filename
+
+from app.extensions import db
+from app.jobs import enqueue_many
+from app.models import Media
+from app.utils.helpers import allowed_file
+from app.utils.images import image_columns, read_image_info
+from app.utils.stats import record_media
+from app.utils.storage import commit_blob, link_blob, remove_blob, stream_to_staging, unique_filename
+
+
+def new_batch_id():
+    """Random id grouping the files of one upload batch."""
+    return uuid.uuid4().hex
+
+
+def public_filename(original_filename):
+    """Filesystem-safe public name for an upload, keeping its extension.
+
+    ``secure_filename`` drops non-ASCII characters, so ``日本.png`` would
+    become ``png``; such names get a generated stem instead.
+    """
+    filename = secure_filename(original_filename)
+    stem, ext = os.path.splitext(filename)
+    if stem and ext:
+        return filename
+    return f"upload_{uuid.uuid4().hex[:12]}.{original_filename.rsplit('.', 1)[-1].lower()}"
+
+
+def _pool():
+    return ThreadPoolExecutor(max_workers=current_app.config['UPLOAD_WRITE_WORKERS'])
+
+
+def stage_uploads(files):
+    """Hash request files into staging concurrently.
+
+    ``files`` are Werkzeug ``FileStorage`` objects. Returns ``(staged,
+    errors)`` where ``staged`` holds the tuples ``store_staged_files``
+    expects and ``errors`` holds ``(original_filename, message)`` pairs.
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    accepted, errors = [], []
+    for file in files:
+        if not file or file.filename == '':
+            continue
+        if allowed_file(file.filename):
+            accepted.append(file)
+        else:
+            errors.append((file.filename, 'Invalid file type'))
+
+    def stage(file):
+        try:
+            return stream_to_staging(file.stream, upload_folder), None
+        except Exception as e:
+            return None, str(e)
+
+    staged = []
+    with _pool() as pool:
+        for file, (result, error) in zip(accepted, pool.map(stage, accepted)):
+            if error:
+                errors.append((file.filename, error))
+                continue
+            staging_path, content_hash, file_size = result
+            staged.append((file.filename, public_filename(file.filename),
+                           staging_path, content_hash, file_size))
+    return staged, errors
+
+
+def store_staged_files(staged, uploaded_by, batch_id=None):
+    """Turn staged, hashed files into blobs, public links and Media rows.
+
+    ``staged`` holds ``(original_filename, secure_name, staging_path,
+    content_hash, size)`` tuples. Rows are bulk-inserted and their
+    processing jobs enqueued; the caller commits. Returns
+    ``(uploaded_files, errors)`` where ``errors`` holds
+    ``(original_filename, message)`` pairs.
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    batch_id = batch_id or new_batch_id()
+    if not staged:
+        return [], []
+
+    # One IN query covers name collisions and duplicate content for the whole batch
+    existing = db.session.query(Media.filename, Media.content_hash, Media.renditions,
+                                Media.placeholder).filter(or_(
+        Media.filename.in_({item[1] for item in staged}),
+        Media.content_hash.in_({item[3] for item in staged})
+    )).all()
+    taken_names = {row.filename for row in existing}
+    stored_hashes = {row.content_hash for row in existing}
+    known_hashes = set(stored_hashes)
+    known_renditions = {row.content_hash: row.renditions for row in existing if row.renditions}
+    known_placeholders = {row.content_hash: row.placeholder for row in existing if row.placeholder}
+
+    # Names are picked in order so files in one batch never collide
+    planned = []
+    for original_filename, filename, staging_path, content_hash, file_size in staged:
+        filename = unique_filename(filename, taken_names, upload_folder)
+        taken_names.add(filename)
+        planned.append((original_filename, filename, staging_path, content_hash, file_size))
+
+    def place(item):
+        _original, filename, staging_path, content_hash, _size = item
+        try:
+            # Identical bytes become another link to the existing blob
+            commit_blob(upload_folder, staging_path, content_hash)
+            link_blob(upload_folder, content_hash, filename)
+        except Exception as e:
+            if os.path.exists(staging_path):
+                os.remove(staging_path)
+            return None, str(e)
+        try:
+            return read_image_info(os.path.join(upload_folder, filename)), None
+        except Exception:
+            # Stored anyway; the renditions job reports files Pillow cannot read
+            return {}, None
+
+    with _pool() as pool:
+        outcomes = list(pool.map(place, planned))
+
+    rows, uploaded_files, errors, failed = [], [], [], []
+    uploaded_at = datetime.utcnow()
+    for (original_filename, filename, _path, content_hash, file_size), (info, error) in zip(planned, outcomes):
+        # A name that failed to link may belong to someone else's upload, so only ours is removed
+        linked = error is None
+        if linked:
+            try:
+                # Duplicates share the original's renditions and placeholder
+                row = {
+                    'filename': filename,
+                    'original_filename': original_filename,
+                    'file_type': filename.rsplit('.', 1)[1].lower(),
+                    'file_size': file_size,
+                    'uploaded_by': uploaded_by,
+                    'content_hash': content_hash,
+                    'renditions': known_renditions.get(content_hash),
+                    'placeholder': known_placeholders.get(content_hash),
+                    'batch_id': batch_id,
+                    'upload_time': uploaded_at,
+                    **image_columns(info, uploaded_at),
+                }
+            except Exception as e:
+                error = str(e) or type(e).__name__
+        if error:
+            errors.append((original_filename, error))
+            failed.append((filename if linked else None, content_hash))
+            continue
+        rows.append(row)
+        uploaded_files.append({
+            'filename': filename,
+            'original_filename': original_filename,
+            'size': file_size,
+            'content_hash': content_hash,
+            'duplicate': content_hash in known_hashes,
+        })
+        known_hashes.add(content_hash)
+
+    # Files that did not become rows leave no public link or unreferenced blob behind
+    kept_hashes = {row['content_hash'] for row in rows}
+    for filename, content_hash in failed:
+        if filename:
+            try:
+                os.remove(os.path.join(upload_folder, filename))
+            except FileNotFoundError:
+                pass
+        if content_hash not in stored_hashes and content_hash not in kept_hashes:
+            remove_blob(upload_folder, content_hash)
+
+    if not rows:
+        return uploaded_files, errors
+
+    db.session.execute(insert(Media), rows)
+    ids = dict(db.session.query(Media.filename, Media.id).filter(
+        Media.filename.in_([row['filename'] for row in rows])))
+    record_media((row['file_type'], row['uploaded_by'], row['file_size']) for row in rows)
+
+    for row, uploaded in zip(rows, uploaded_files):
+        uploaded['id'] = ids[row['filename']]
+    enqueue_many('process_image', [{'media_id': ids[row['filename']]}
+                                   for row in rows if not row['renditions']])
+
+    return uploaded_files, errors
@@ -0,0 +1,343 @@
+"""Per-request instrumentation, exported in Prometheus text format at ``/metrics``.
+
+With ``METRICS_ENABLED`` on, each request records four things:
+
+* its latency, into a histogram per endpoint;
+* the SQL statements it ran and their time, via SQLAlchemy cursor events;
+* the time spent in ``render_template``, via Flask's template signals;
+* the file-system calls it made (opens, listings, renames, removals, ...),
+  via a ``sys.addaudithook`` hook. CPython raises no audit event for
+  ``stat``, so existence checks are not counted.
+
+Every response carries the same breakdown in a ``Server-Timing`` header,
+so the browser's network panel shows it per request.
+
+Each process keeps its totals in memory. A background thread writes them
+to ``METRICS_DIR/<pid>.json`` every ``METRICS_FLUSH_INTERVAL`` seconds
+while requests arrive; gunicorn's exit hooks flush a worker's last totals.
+``/metrics`` sums every file, so a scrape sees the whole gunicorn pool
+whichever worker answers it. Per request the cost is a few
+``perf_counter`` calls and dict updates.
+
+``/metrics`` answers logged-in admins and scrapers sending
+``Authorization: Bearer <METRICS_TOKEN>``; everyone else gets a 404.
+Internal renders (static export, page cache refreshes) set
+``INTERNAL_REQUEST`` in the WSGI environ and are not recorded.
+"""
+import bisect
+import contextvars
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+
+from flask import current_app, g, request, session
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Audit events that touch the file system (see the CPython audit events table)
+FS_EVENTS = frozenset((
+    'open', 'os.listdir', 'os.scandir', 'os.walk', 'os.remove', 'os.rename', 'os.mkdir',
+    'os.rmdir', 'os.link', 'os.symlink', 'os.truncate', 'os.chmod', 'os.utime',
+    'shutil.copyfile', 'shutil.move', 'shutil.rmtree',
+))
+
+RETIRED_FILE = 'retired.json'
+
+# WSGI environ key marking the app's own test-client renders, which are not traffic
+INTERNAL_REQUEST = 'birdyphillips.internal_request'
+
+# Instrumentation of the request being handled in this context, or None
+_current = contextvars.ContextVar('birdyphillips_request_metrics', default=None)
+_audit_hook_installed = False
+
+
+class RequestMetrics:
+    """What one request spent, filled in by the hooks while it runs."""
+    __slots__ = ('started', 'sql_queries', 'sql_seconds', 'template_seconds', 'template_started', 'fs_calls')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_started = []
+        self.fs_calls = 0
+
+
+def _empty_endpoint():
+    return {'buckets': [0] * len(LATENCY_BUCKETS), 'count': 0, 'sum': 0.0, 'statuses': {},
+            'sql_queries': 0, 'sql_seconds': 0.0, 'template_seconds': 0.0, 'fs_calls': 0}
+
+
+def merge(into, snapshot):
+    """Add one process snapshot (``{endpoint: totals}``) into another."""
+    for endpoint, totals in snapshot.items():
+        target = into.setdefault(endpoint, _empty_endpoint())
+        for i, count in enumerate(totals['buckets']):
+            target['buckets'][i] += count
+        for status, count in totals['statuses'].items():
+            target['statuses'][status] = target['statuses'].get(status, 0) + count
+        for name in ('count', 'sum', 'sql_queries', 'sql_seconds', 'template_seconds', 'fs_calls'):
+            target[name] += totals[name]
+    return into
+
+
+class MetricsRegistry:
+    """Totals per endpoint for this process, flushed to a shared directory."""
+
+    def __init__(self, directory, flush_interval):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.endpoints = {}
+        self._dirty = False
+        self._flusher_pid = None  # threads do not survive a fork, so one per process
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, status, state, elapsed):
+        with self._lock:
+            totals = self.endpoints.get(endpoint)
+            if totals is None:
+                totals = self.endpoints[endpoint] = _empty_endpoint()
+            index = bisect.bisect_left(LATENCY_BUCKETS, elapsed)
+            if index < len(LATENCY_BUCKETS):
+                totals['buckets'][index] += 1
+            totals['count'] += 1
+            totals['sum'] += elapsed
+            totals['statuses'][status] = totals['statuses'].get(status, 0) + 1
+            totals['sql_queries'] += state.sql_queries
+            totals['sql_seconds'] += state.sql_seconds
+            totals['template_seconds'] += state.template_seconds
+            totals['fs_calls'] += state.fs_calls
+            self._dirty = True
+            if self.directory and self._flusher_pid != os.getpid():
+                self._flusher_pid = os.getpid()
+                threading.Thread(target=self._flush_periodically, name='metrics-flush', daemon=True).start()
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                try:
+                    self.flush()
+                except OSError:
+                    pass  # a full or read-only disk; the next round tries again
+
+    def snapshot(self):
+        with self._lock:
+            self._dirty = False
+            return json.loads(json.dumps(self.endpoints))
+
+    def flush(self):
+        """Write this process's totals for other workers' ``/metrics`` to read."""
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def collect(self):
+        """Totals of every process that has written to the directory, this one included."""
+        if not self.directory:
+            return self.snapshot()
+        self.flush()
+        combined = {}
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path, 'r', encoding='utf-8') as f:
+                    merge(combined, json.load(f))
+            except (OSError, ValueError):
+                continue  # replaced or removed while we read it
+        return combined
+
+
+def retire_worker(app, pid):
+    """Fold an exited worker's totals into ``retired.json`` so its counters survive it."""
+    registry = app.extensions.get('metrics')
+    if registry is None or not registry.directory:
+        return
+    path = os.path.join(registry.directory, f"{pid}.json")
+    retired_path = os.path.join(registry.directory, RETIRED_FILE)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return
+    try:
+        with open(retired_path, 'r', encoding='utf-8') as f:
+            retired = json.load(f)
+    except (OSError, ValueError):
+        retired = {}
+    tmp_path = f"{retired_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(merge(retired, snapshot), f)
+    os.replace(tmp_path, retired_path)
+    os.remove(path)
+
+
+def reset_metrics(app):
+    """Drop the totals of a previous server run; call once when the server starts."""
+    registry = app.extensions.get('metrics')
+    if registry is None or not registry.directory or not os.path.isdir(registry.directory):
+        return
+    for entry in os.scandir(registry.directory):
+        if entry.name.endswith('.json'):
+            os.remove(entry.path)
+
+
+def _audit(event, args):
+    # Called for every audit event in the process: keep the common path to one set lookup
+    if event in FS_EVENTS:
+        state = _current.get()
+        if state is not None:
+            state.fs_calls += 1
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        conn.info.setdefault('metrics_query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    state = _current.get()
+    started = conn.info.get('metrics_query_started')
+    if state is not None and started:
+        state.sql_queries += 1
+        state.sql_seconds += time.perf_counter() - started.pop()
+
+
+def _before_render(sender, template, context, **extra):
+    state = _current.get()
+    if state is not None:
+        state.template_started.append(time.perf_counter())
+
+
+def _rendered(sender, template, context, **extra):
+    state = _current.get()
+    if state is not None and state.template_started:
+        state.template_seconds += time.perf_counter() - state.template_started.pop()
+
+
+def _start_request():
+    # None also keeps an internal render from adding to an enclosing request's totals
+    internal = request.environ.get(INTERNAL_REQUEST)
+    g._metrics_token = _current.set(None if internal else RequestMetrics())
+
+
+def _finish_request(response):
+    state = _current.get()
+    if state is None:
+        return response
+    elapsed = time.perf_counter() - state.started
+    # Templates nested through render_template count once, at the outermost call
+    response.headers['Server-Timing'] = (
+        f'app;dur={elapsed * 1000:.1f}, '
+        f'db;dur={state.sql_seconds * 1000:.1f};desc="{state.sql_queries} queries", '
+        f'tpl;dur={state.template_seconds * 1000:.1f}, '
+        f'fs;desc="{state.fs_calls} calls"'
+    )
+    current_app.extensions['metrics'].observe(request.endpoint or 'unmatched', str(response.status_code),
+                                              state, elapsed)
+    return response
+
+
+def _end_request(exc):
+    token = g.pop('_metrics_token', None)
+    if token is not None:
+        _current.reset(token)
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def render_prometheus(endpoints):
+    """Format merged totals in the Prometheus text exposition format."""
+    lines = [
+        '# HELP birdyphillips_request_duration_seconds Request latency by endpoint.',
+        '# TYPE birdyphillips_request_duration_seconds histogram',
+    ]
+    for endpoint, totals in sorted(endpoints.items()):
+        label = f'endpoint="{_label(endpoint)}"'
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS, totals['buckets']):
+            cumulative += count
+            lines.append(f'birdyphillips_request_duration_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f'birdyphillips_request_duration_seconds_bucket{{{label},le="+Inf"}} {totals["count"]}')
+        lines.append(f'birdyphillips_request_duration_seconds_sum{{{label}}} {totals["sum"]:.6f}')
+        lines.append(f'birdyphillips_request_duration_seconds_count{{{label}}} {totals["count"]}')
+
+    lines += [
+        '# HELP birdyphillips_responses_total Responses by endpoint and status code.',
+        '# TYPE birdyphillips_responses_total counter',
+    ]
+    for endpoint, totals in sorted(endpoints.items()):
+        for status, count in sorted(totals['statuses'].items()):
+            lines.append(f'birdyphillips_responses_total{{endpoint="{_label(endpoint)}",status="{status}"}} {count}')
+
+    for name, key, description in (
+        ('sql_queries_total', 'sql_queries', 'SQL statements executed.'),
+        ('sql_seconds_total', 'sql_seconds', 'Time spent executing SQL.'),
+        ('template_seconds_total', 'template_seconds', 'Time spent rendering templates.'),
+        ('fs_calls_total', 'fs_calls', 'File-system calls (open, listdir, scandir, rename, remove, ...).'),
+    ):
+        lines += [f'# HELP birdyphillips_{name} {description}', f'# TYPE birdyphillips_{name} counter']
+        for endpoint, totals in sorted(endpoints.items()):
+            value = totals[key]
+            value = f"{value:.6f}" if isinstance(value, float) else value
+            lines.append(f'birdyphillips_{name}{{endpoint="{_label(endpoint)}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def _scrape_allowed():
+    # Not the client address: behind a proxy every request comes from loopback
+    if session.get('logged_in'):
+        return True
+    token = current_app.config['METRICS_TOKEN']
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    return bool(token) and scheme.lower() == 'bearer' and hmac.compare_digest(credentials.encode(), token.encode())
+
+
+def metrics_view():
+    """Prometheus scrape endpoint: admins and scrapers holding ``METRICS_TOKEN`` only."""
+    if not _scrape_allowed():
+        return current_app.response_class('Not Found', status=404)
+    body = render_prometheus(current_app.extensions['metrics'].collect())
+    return current_app.response_class(body, content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_metrics(app):
+    """Hook request, SQL, template and file-system instrumentation into the app."""
+    global _audit_hook_installed
+    if not app.config['METRICS_ENABLED']:
+        return
+    from flask import before_render_template, template_rendered
+    from sqlalchemy import event
+
+    from app.extensions import db
+
+    app.extensions['metrics'] = MetricsRegistry(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_INTERVAL'])
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_rendered, app)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    # Audit hooks cannot be removed, so one serves every app in the process
+    if not _audit_hook_installed:
+        sys.addaudithook(_audit)
+        _audit_hook_installed = True
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
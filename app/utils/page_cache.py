@@ -0,0 +1,308 @@
+"""Full-page cache for anonymous GETs of public pages.
+
+Views opt in with ``@cached_page``. Entries are keyed by path and query
+string and stamped with the global content version: a token in
+``instance/content_version`` that writers replace through
+``bump_content_version()`` after they commit. An entry from an older
+version is never served: the next request renders the page afresh, so a
+write shows up immediately. An entry of the current version is fresh for
+``PAGE_CACHE_TTL``; past that it is still served for up to
+``PAGE_CACHE_STALE_TTL`` seconds while a single background request
+re-renders it. Every response carries an ETag of the body, so browsers
+revalidate with a 304.
+
+Backends (``PAGE_CACHE_BACKEND``): ``memory`` is a per-process LRU,
+``filesystem`` is shared by every worker through the instance folder,
+``redis`` talks to any Redis-protocol server and needs the optional
+``redis`` package, and ``none`` turns the cache off.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import urlencode
+
+from flask import current_app, make_response, request, session
+
+from app.utils.metrics import INTERNAL_REQUEST
+
+# Set on the internal request that refreshes a stale entry
+REVALIDATE_FLAG = 'birdyphillips.page_cache.revalidate'
+
+
+def encode_entry(entry):
+    """Serialize an entry as a JSON header line followed by the raw body."""
+    header = {k: v for k, v in entry.items() if k != 'body'}
+    return json.dumps(header).encode() + b'\n' + entry['body']
+
+
+def decode_entry(raw):
+    header, body = raw.split(b'\n', 1)
+    return dict(json.loads(header), body=body)
+
+
+class MemoryBackend:
+    """LRU of entries in this process, bounded by total body size."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old['body'])
+            self._entries[key] = entry
+            self._size += len(entry['body'])
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted['body'])
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+
+class FilesystemBackend:
+    """One file per entry under a directory shared by all workers."""
+
+    PRUNE_EVERY = 200  # writes between sweeps for expired files
+
+    def __init__(self, directory, max_age):
+        self.directory = directory
+        self.max_age = max_age
+        self._writes = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return decode_entry(f.read())
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, entry):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(encode_entry(entry))
+        os.replace(tmp_path, path)
+
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self._prune()
+
+    def _prune(self):
+        cutoff = time.time() - self.max_age
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for entry in os.scandir(self.directory):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+class RedisBackend:
+    """Entries in a Redis-protocol server, expired by the server itself."""
+
+    PREFIX = 'birdyphillips:page:'
+
+    def __init__(self, url, max_age):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("PAGE_CACHE_BACKEND=redis needs the 'redis' package installed")
+        self.client = redis.Redis.from_url(url)
+        self.max_age = max_age
+
+    def get(self, key):
+        raw = self.client.get(self.PREFIX + key)
+        return decode_entry(raw) if raw else None
+
+    def set(self, key, entry):
+        self.client.set(self.PREFIX + key, encode_entry(entry), ex=int(self.max_age))
+
+    def clear(self):
+        for name in self.client.scan_iter(match=self.PREFIX + '*'):
+            self.client.delete(name)
+
+
+class PageCache:
+    """A backend plus freshness rules, hit counters and revalidation bookkeeping."""
+
+    def __init__(self, backend, ttl, stale_ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.counters = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'revalidations': 0}
+        self._inflight = set()
+        self._lock = threading.Lock()
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def revalidate(self, app, key):
+        """Re-render ``key`` in a background thread unless one is already running."""
+        with self._lock:
+            if key in self._inflight:
+                return
+            self._inflight.add(key)
+            self.counters['revalidations'] += 1
+
+        def run():
+            try:
+                app.test_client().get(key, environ_overrides={REVALIDATE_FLAG: True, INTERNAL_REQUEST: True})
+            except Exception:
+                app.logger.exception("Page cache revalidation failed for %s", key)
+            finally:
+                with self._lock:
+                    self._inflight.discard(key)
+
+        threading.Thread(target=run, name='page-cache-revalidate', daemon=True).start()
+
+    def stats(self):
+        """Hit/miss counters for this process."""
+        lookups = self.counters['hits'] + self.counters['stale_hits'] + self.counters['misses']
+        hits = self.counters['hits'] + self.counters['stale_hits']
+        return dict(self.counters,
+                    backend=type(self.backend).__name__,
+                    hit_ratio=round(hits / lookups, 3) if lookups else None)
+
+
+def init_page_cache(app):
+    """Create the configured backend; ``none`` leaves caching off."""
+    name = app.config['PAGE_CACHE_BACKEND']
+    ttl, stale_ttl = app.config['PAGE_CACHE_TTL'], app.config['PAGE_CACHE_STALE_TTL']
+    if name == 'none':
+        return
+    if name == 'memory':
+        backend = MemoryBackend(app.config['PAGE_CACHE_MAX_BYTES'])
+    elif name == 'filesystem':
+        backend = FilesystemBackend(os.path.join(app.instance_path, 'page_cache'), ttl + stale_ttl)
+    elif name == 'redis':
+        backend = RedisBackend(app.config['PAGE_CACHE_URL'], ttl + stale_ttl)
+    else:
+        raise ValueError(f"Unknown PAGE_CACHE_BACKEND {name!r}; choose memory, filesystem, redis or none")
+    app.extensions['page_cache'] = PageCache(backend, ttl, stale_ttl)
+
+
+def _version_path():
+    return os.path.join(current_app.instance_path, 'content_version')
+
+
+def content_version():
+    """The current content version token ('0' before the first write)."""
+    try:
+        with open(_version_path(), 'r', encoding='utf-8') as f:
+            return f.read().strip() or '0'
+    except FileNotFoundError:
+        return '0'
+
+
+def bump_content_version():
+    """Invalidate every cached page; call after committing a content change.
+
+    Entries stamped with the previous version are treated as misses, so the
+    next request for each page renders it with the new content.
+
+    Also queues a static export when ``STATIC_EXPORT_ON_WRITE`` is set.
+    """
+    path = _version_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(f"{time.time_ns():x}-{os.getpid()}")
+    os.replace(tmp_path, path)
+
+    from app.utils.static_export import schedule_static_export
+    schedule_static_export()
+
+
+def _cacheable():
+    # Logged-in pages show admin controls and flashes are one-shot
+    return (request.method in ('GET', 'HEAD')
+            and not session.get('logged_in')
+            and '_flashes' not in session)
+
+
+def _finish(response, etag, state):
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Page-Cache'] = state
+    return response.make_conditional(request)
+
+
+def cached_page(view):
+    """Serve a view from the page cache for anonymous visitors."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cache = current_app.extensions.get('page_cache')
+        if cache is None or not _cacheable():
+            return view(*args, **kwargs)
+
+        key = request.path
+        if request.args:
+            key += '?' + urlencode(sorted(request.args.items(multi=True)))
+        version = content_version()
+
+        if not request.environ.get(REVALIDATE_FLAG):
+            entry = cache.backend.get(key)
+            if entry is not None:
+                age = time.time() - entry['stored_at']
+                state = None
+                if entry['version'] != version:
+                    pass  # written since: a miss, never served stale
+                elif age < cache.ttl:
+                    state = 'HIT'
+                    cache.count('hits')
+                elif age < cache.ttl + cache.stale_ttl:
+                    state = 'STALE'
+                    cache.count('stale_hits')
+                    cache.revalidate(current_app._get_current_object(), key)
+                if state:
+                    response = current_app.response_class(entry['body'], status=entry['status'],
+                                                          content_type=entry['content_type'])
+                    return _finish(response, entry['etag'], state)
+
+        cache.count('misses')
+        response = make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.is_streamed:
+            return response
+        body = response.get_data()
+        entry = {
+            'version': version,
+            'stored_at': time.time(),
+            'etag': hashlib.sha256(body).hexdigest()[:32],
+            'status': response.status_code,
+            'content_type': response.content_type,
+            'body': body,
+        }
+        cache.backend.set(key, entry)
+        return _finish(response, entry['etag'], 'MISS')
+    return wrapper
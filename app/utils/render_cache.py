@@ -0,0 +1,96 @@
+"""Two-tier cache for rendered content files.
+
+Entries are keyed by the source path plus its mtime and size, so any
+write to the file invalidates them. Tier one is an in-process LRU; tier
+two is a JSON sidecar per file that survives restarts and is shared by
+every worker process.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+class RenderCache:
+    """Memory + disk cache of JSON-serializable render results."""
+
+    def __init__(self, sidecar_dir, max_entries=128):
+        self.sidecar_dir = sidecar_dir
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # path -> (key, data)
+        self._lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0}
+
+    @staticmethod
+    def _key(path):
+        st = os.stat(path)
+        return [st.st_mtime_ns, st.st_size]
+
+    def _sidecar_path(self, path):
+        return os.path.join(self.sidecar_dir, os.path.basename(path) + '.json')
+
+    def _remember(self, path, key, data):
+        with self._lock:
+            self._entries[path] = (key, data)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _read_sidecar(self, path, key):
+        try:
+            with open(self._sidecar_path(path), 'r', encoding='utf-8') as f:
+                sidecar = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if sidecar.get('key') != key:
+            return None
+        return sidecar['data']
+
+    def _write_sidecar(self, path, key, data):
+        os.makedirs(self.sidecar_dir, exist_ok=True)
+        sidecar_path = self._sidecar_path(path)
+        tmp_path = f"{sidecar_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'data': data}, f)
+        os.replace(tmp_path, sidecar_path)
+
+    def get(self, path, render):
+        """Return cached data for ``path``, calling ``render(path)`` on a miss.
+
+        Raises FileNotFoundError if the source file does not exist.
+        """
+        key = self._key(path)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[0] == key:
+                self._entries.move_to_end(path)
+                self.counters['memory_hits'] += 1
+                return entry[1]
+
+        data = self._read_sidecar(path, key)
+        hit = data is not None
+        if not hit:
+            data = render(path)
+            self._write_sidecar(path, key, data)
+        with self._lock:
+            self.counters['disk_hits' if hit else 'misses'] += 1
+
+        self._remember(path, key, data)
+        return data
+
+    def store(self, path, render):
+        """Render ``path`` now and write both tiers (used right after a save)."""
+        key = self._key(path)
+        data = render(path)
+        self._write_sidecar(path, key, data)
+        self._remember(path, key, data)
+        return data
+
+    def stats(self):
+        """Hit/miss counters for this process."""
+        lookups = sum(self.counters.values())
+        hits = self.counters['memory_hits'] + self.counters['disk_hits']
+        return dict(self.counters,
+                    entries=len(self._entries),
+                    hit_ratio=round(hits / lookups, 3) if lookups else None)
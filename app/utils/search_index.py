@@ -0,0 +1,137 @@
+"""Inverted index for blog search.
+
+Extends the post manifest with postings (term -> {filename: weighted
+term frequency}) and a tag map. Both are kept up to date incrementally as
+posts are added, rewritten or removed. Title terms count three times and
+tags twice, so a match in the title outranks one in the body. Queries
+are ranked with BM25. Each query term also matches vocabulary words that
+start with it, so ``photo`` finds ``photography`` at a discount. Listing
+metadata is stored alongside, so results render from the index alone.
+"""
+import bisect
+import math
+import re
+from collections import Counter
+
+from app.utils.blog_index import BlogIndex
+
+SEARCH_INDEX_VERSION = 1
+
+FIELD_WEIGHTS = {'title': 3, 'tags': 2, 'body': 1}
+
+# BM25 parameters (the usual defaults)
+K1 = 1.2
+B = 0.75
+
+# Prefix expansions score less than an exact term and are capped per query term
+PREFIX_WEIGHT = 0.7
+MAX_EXPANSIONS = 50
+
+STOPWORDS = frozenset(
+    'a an and are as at be by for from has have in is it its of on or that the this to was were with'.split()
+)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """Lowercase word tokens without stopwords."""
+    return [token for token in _TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+def tag_keys(tags):
+    """Distinct lowercase tags (frontmatter may give a single string)."""
+    if isinstance(tags, str):
+        tags = [tags]
+    return sorted({str(tag).strip().lower() for tag in tags or [] if str(tag).strip()})
+
+
+class SearchIndex(BlogIndex):
+    """Post manifest plus BM25 postings and a tag map.
+
+    ``extract(filepath)`` must return the listing metadata plus a
+    ``fields`` dict with ``title``, ``tags`` and ``body`` text. The fields
+    are tokenized and dropped, so post bodies are never stored.
+    """
+
+    def __init__(self, content_dir, index_path, extract):
+        super().__init__(content_dir, index_path, extract)
+        self._vocabulary = []
+        self._vocabulary_source = None
+
+    @staticmethod
+    def _empty():
+        return dict(BlogIndex._empty(), version=SEARCH_INDEX_VERSION,
+                    postings={}, tags={}, total_length=0)
+
+    def _changed(self, filename, old, new):
+        postings, tags = self._data['postings'], self._data['tags']
+        if old:
+            for term in old['terms']:
+                postings[term].pop(filename, None)
+                if not postings[term]:
+                    del postings[term]
+            for tag in tag_keys(old['tags']):
+                tags[tag].remove(filename)
+                if not tags[tag]:
+                    del tags[tag]
+            self._data['total_length'] -= old['length']
+
+        if new:
+            fields = new.pop('fields')
+            terms = Counter()
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(fields[field]):
+                    terms[token] += weight
+            new['terms'] = dict(terms)
+            new['length'] = sum(terms.values())
+            for term, frequency in terms.items():
+                postings.setdefault(term, {})[filename] = frequency
+            for tag in tag_keys(new['tags']):
+                tags.setdefault(tag, []).append(filename)
+            self._data['total_length'] += new['length']
+
+    def _expand(self, postings, query_term):
+        """Vocabulary terms matching ``query_term`` exactly or by prefix, with weights."""
+        # The sorted vocabulary is rebuilt once per index write or reload
+        if self._vocabulary_source != self._loaded_key:
+            self._vocabulary = sorted(postings)
+            self._vocabulary_source = self._loaded_key
+        matches = []
+        start = bisect.bisect_left(self._vocabulary, query_term)
+        for term in self._vocabulary[start:start + MAX_EXPANSIONS]:
+            if not term.startswith(query_term):
+                break
+            matches.append((term, 1.0 if term == query_term else PREFIX_WEIGHT))
+        return matches
+
+    def search(self, query, include_drafts=False):
+        """Return ``[(filename, metadata, score)]`` best first."""
+        data = self.refresh()
+        postings, posts = data['postings'], data['posts']
+        if not posts:
+            return []
+        count = len(posts)
+        average_length = data['total_length'] / count or 1
+
+        scores = Counter()
+        for query_term in dict.fromkeys(tokenize(query)):
+            # A document scores once per query term, through its best-matching expansion
+            best = {}
+            for term, weight in self._expand(postings, query_term):
+                documents = postings[term]
+                idf = math.log(1 + (count - len(documents) + 0.5) / (len(documents) + 0.5))
+                for filename, frequency in documents.items():
+                    length_norm = 1 - B + B * posts[filename]['length'] / average_length
+                    score = weight * idf * frequency * (K1 + 1) / (frequency + K1 * length_norm)
+                    best[filename] = max(best.get(filename, 0), score)
+            scores.update(best)
+
+        return [(filename, posts[filename], score) for filename, score in scores.most_common()
+                if include_drafts or posts[filename]['published']]
+
+    def tagged(self, tag, include_drafts=False):
+        """Return ``[(filename, metadata)]`` for posts carrying ``tag`` (case-insensitive)."""
+        data = self.refresh()
+        return [(filename, data['posts'][filename]) for filename in data['tags'].get(tag.strip().lower(), [])
+                if include_drafts or data['posts'][filename]['published']]
@@ -0,0 +1,63 @@
+"""Cache-friendly file responses for uploads and renditions.
+
+Responses carry a strong ETag (the upload's content hash when it is known)
+and honour If-None-Match and Range. URLs fingerprinted with ``?v=<hash>``
+are cached as immutable for a year. With ``UPLOADS_ACCEL_REDIRECT`` set,
+Flask only answers the headers and hands the body to nginx through an
+``X-Accel-Redirect`` to an internal location.
+"""
+import mimetypes
+import os
+from urllib.parse import quote
+
+from flask import abort, current_app, request, send_from_directory
+from werkzeug.security import safe_join
+
+FINGERPRINT_LENGTH = 16
+
+
+def fingerprint(content_hash):
+    """Short version token for a content hash, used as ``?v=`` in URLs."""
+    return content_hash[:FINGERPRINT_LENGTH] if content_hash else None
+
+
+def _is_fingerprinted(version):
+    """True when the request's ``?v=`` matches the current content."""
+    return bool(version) and request.args.get('v') == version
+
+
+def send_upload(relpath, etag=None, version=None):
+    """Send a file under ``UPLOAD_FOLDER`` with validators and cache headers.
+
+    ``etag`` replaces Werkzeug's mtime/size tag; ``version`` is the
+    fingerprint that earns the immutable policy.
+    """
+    config = current_app.config
+    folder = config['UPLOAD_FOLDER']
+    immutable = _is_fingerprinted(version)
+    max_age = config['UPLOADS_IMMUTABLE_MAX_AGE'] if immutable else config['UPLOADS_MAX_AGE']
+
+    if not config['UPLOADS_ACCEL_REDIRECT']:
+        response = send_from_directory(folder, relpath, etag=etag or True, max_age=max_age)
+        response.cache_control.immutable = immutable
+        return response
+
+    path = safe_join(folder, relpath)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    # Empty body; nginx serves the file, including Range requests
+    response = current_app.response_class(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+    if etag:
+        response.set_etag(etag)
+    else:
+        st = os.stat(path)
+        response.set_etag(f"{st.st_mtime_ns:x}-{st.st_size:x}")
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    response.cache_control.immutable = immutable
+    response = response.make_conditional(request)
+    # nginx follows the redirect whatever the status, so a 304/412 must not carry it
+    if response.status_code in (200, 206):
+        response.headers['X-Accel-Redirect'] = config['UPLOADS_ACCEL_REDIRECT'].rstrip('/') + '/' + quote(relpath)
+    return response
@@ -0,0 +1,62 @@
+"""Cold-start measurement for ``flask startup-report``.
+
+The application is built in a fresh interpreter started with
+``-X importtime``, so the numbers match what a gunicorn worker or a
+``flask`` command pays on boot rather than the already-warm CLI process.
+"""
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROBE = (
+    "import sys, time\n"
+    "started = time.perf_counter()\n"
+    "from app import create_app\n"
+    "imported = time.perf_counter()\n"
+    "create_app(sys.argv[1])\n"
+    "done = time.perf_counter()\n"
+    "print(imported - started, done - imported)\n"
+)
+
+
+def parse_importtime(output):
+    """Turn ``-X importtime`` stderr into ``[(module, self_us, cumulative_us)]``."""
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+def measure_startup(config_name):
+    """Build the app in a child interpreter and report where the time went.
+
+    Returns a dict with ``import_seconds`` (importing ``app``),
+    ``create_seconds`` (running ``create_app``), ``modules`` as parsed by
+    ``parse_importtime`` and ``packages`` mapping each top-level package to
+    the summed self time of its modules in microseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE, config_name],
+        cwd=PROJECT_ROOT, capture_output=True, text=True, check=False
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else 'startup probe failed')
+
+    import_seconds, create_seconds = (float(value) for value in result.stdout.split()[-2:])
+    modules = parse_importtime(result.stderr)
+    packages = defaultdict(int)
+    for name, self_us, _ in modules:
+        packages[name.split('.')[0]] += self_us
+
+    return {
+        'import_seconds': import_seconds,
+        'create_seconds': create_seconds,
+        'modules': modules,
+        'packages': dict(packages),
+    }
@@ -0,0 +1,198 @@
+"""Static export of the public pages for nginx to serve directly.
+
+``export_static`` renders the home page, the gallery (with every page of
+its ``/api/media`` feed), the blog index and each published post through
+the normal blueprints into ``STATIC_EXPORT_DIR``. A manifest records
+which inputs each page was built from: the templates, the media table,
+the blog listing and each post file. A later run re-renders only pages
+whose inputs changed. Editing one post rebuilds that post and the
+index; an upload rebuilds the gallery and its feed.
+
+Files are replaced atomically and only when their bytes change, so nginx
+never serves a half-written page and unchanged pages keep their ETags.
+"""
+import hashlib
+import json
+import os
+
+from flask import current_app
+from sqlalchemy import func
+
+from app.extensions import db
+from app.models import Job, Media
+from app.utils.metrics import INTERNAL_REQUEST
+from app.utils.page_cache import REVALIDATE_FLAG
+from app.utils.stats import get_totals
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+MANIFEST = '.manifest.json'
+FEED_DIR = os.path.join('api', 'media')
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates')
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def page_file(url):
+    """Relative output path of a page: ``/blog/x`` -> ``blog/x/index.html``."""
+    return os.path.join(url.strip('/'), 'index.html')
+
+
+def templates_signature():
+    """Changes whenever any template file is edited, added or removed."""
+    stamps = []
+    for root, _dirs, files in os.walk(TEMPLATES_DIR):
+        for name in files:
+            st = os.stat(os.path.join(root, name))
+            stamps.append((os.path.relpath(os.path.join(root, name), TEMPLATES_DIR), st.st_mtime_ns, st.st_size))
+    return _digest(sorted(stamps))
+
+
+def media_signature():
+    """Changes whenever the gallery or its feed could render differently."""
+    totals = get_totals()
+    visible = db.session.query(
+        func.count(Media.id), func.max(Media.id),
+        func.count(Media.renditions), func.count(Media.content_hash),
+        func.count(Media.width), func.count(Media.placeholder)
+    ).filter(Media.is_missing.is_(False)).one()
+    return _digest([totals.version, totals.count, totals.bytes, list(visible)])
+
+
+def public_pages():
+    """Map every exported page URL to the inputs it depends on, with their signatures."""
+    from app.routes.blog import CONTENT_DIR, get_all_blogs
+
+    posts = get_all_blogs()
+    signatures = {
+        'templates': templates_signature(),
+        'media': media_signature(),
+        'blog-index': _digest(posts),
+    }
+    pages = {
+        '/': ['templates'],
+        '/gallery': ['templates', 'media'],
+        '/blog': ['templates', 'blog-index'],
+    }
+    for post in posts:
+        st = os.stat(os.path.join(CONTENT_DIR, post['filename']))
+        dependency = f"post:{post['filename']}"
+        signatures[dependency] = _digest([st.st_mtime_ns, st.st_size])
+        pages[f"/blog/{post['slug']}"] = ['templates', dependency]
+    return pages, signatures
+
+
+def _write(export_dir, relpath, body):
+    """Atomically write ``body`` unless the file already holds it; returns True if written."""
+    path = os.path.join(export_dir, relpath)
+    try:
+        with open(path, 'rb') as f:
+            if f.read() == body:
+                return False
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+    return True
+
+
+def _remove(export_dir, relpath):
+    path = os.path.join(export_dir, relpath)
+    try:
+        os.remove(path)
+        os.removedirs(os.path.dirname(path))
+    except OSError:
+        pass  # already gone, or the directory still holds other pages
+
+
+def _render(client, url):
+    # The revalidation flag makes cached views render fresh instead of replaying the page cache;
+    # the internal one keeps the render out of the request metrics
+    response = client.get(url, environ_overrides={REVALIDATE_FLAG: True, INTERNAL_REQUEST: True})
+    if response.status_code != 200:
+        raise RuntimeError(f"{url} returned HTTP {response.status_code}")
+    return response.get_data()
+
+
+def _load_manifest(export_dir):
+    try:
+        with open(os.path.join(export_dir, MANIFEST), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'signatures': {}, 'pages': {}, 'feed': []}
+
+
+def export_static(app, export_dir=None, full=False):
+    """Bring the export directory up to date and return counts of what happened.
+
+    Only pages whose dependencies changed since the last run are rendered;
+    ``full`` re-renders everything.
+    """
+    export_dir = export_dir or app.config['STATIC_EXPORT_DIR']
+    os.makedirs(export_dir, exist_ok=True)
+
+    with open(os.path.join(export_dir, '.lock'), 'w') as lock:
+        # One export at a time across CLI runs and worker processes
+        if fcntl:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+        manifest = _load_manifest(export_dir)
+        pages, signatures = public_pages()
+        dirty = {name for name, value in signatures.items()
+                 if full or manifest['signatures'].get(name) != value}
+        result = {'rendered': 0, 'written': 0, 'skipped': 0, 'removed': 0}
+        client = app.test_client()
+
+        for url, dependencies in pages.items():
+            relpath = page_file(url)
+            if (url in manifest['pages'] and not dirty.intersection(dependencies)
+                    and os.path.exists(os.path.join(export_dir, relpath))):
+                result['skipped'] += 1
+                continue
+            result['written'] += _write(export_dir, relpath, _render(client, url))
+            result['rendered'] += 1
+
+        # Feed pages follow the gallery: walk every cursor when the media changed
+        feed = manifest['feed']
+        if 'media' in dirty or not feed:
+            feed = []
+            cursor = json.loads(_render(client, '/api/media'))['next_cursor']
+            while cursor:
+                body = _render(client, f"/api/media?cursor={cursor}")
+                result['written'] += _write(export_dir, os.path.join(FEED_DIR, f"{cursor}.json"), body)
+                result['rendered'] += 1
+                feed.append(cursor)
+                cursor = json.loads(body)['next_cursor']
+            for old_cursor in set(manifest['feed']) - set(feed):
+                _remove(export_dir, os.path.join(FEED_DIR, f"{old_cursor}.json"))
+                result['removed'] += 1
+
+        for url in set(manifest['pages']) - set(pages):
+            _remove(export_dir, page_file(url))
+            result['removed'] += 1
+
+        manifest = {'signatures': signatures, 'pages': pages, 'feed': feed}
+        tmp_path = os.path.join(export_dir, f"{MANIFEST}.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, os.path.join(export_dir, MANIFEST))
+    return result
+
+
+def schedule_static_export():
+    """Queue an incremental export after a write, unless one is already waiting."""
+    if not current_app.config['STATIC_EXPORT_ON_WRITE']:
+        return
+    from app.jobs import enqueue
+    pending = db.session.query(Job.id).filter_by(kind='export_static', status='queued').first()
+    if pending is None:
+        # The short delay folds a burst of writes (a batch upload) into one export
+        enqueue('export_static', delay=current_app.config['STATIC_EXPORT_DELAY'])
+        db.session.commit()
@@ -0,0 +1,128 @@
+"""Materialized media statistics.
+
+Writers call ``record_media`` in the same transaction as their media
+change, so counters and rows commit (or roll back) together. Counters are
+updated with ``SET count = count + :delta`` statements, which are atomic
+under concurrent writers. Readers get every number from one small table
+instead of scanning ``media``.
+"""
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import bindparam, delete, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from app.extensions import db
+from app.models import Media, MediaStat
+
+UNKNOWN_UPLOADER = 'Unknown'
+
+
+def _stat_keys(file_type, uploaded_by):
+    return [('total', ''), ('type', file_type), ('uploader', uploaded_by or UNKNOWN_UPLOADER)]
+
+
+def record_media(rows, sign=1):
+    """Add (``sign=1``) or subtract (``sign=-1``) media rows from the stats.
+
+    ``rows`` yields ``(file_type, uploaded_by, file_size)``. A size change
+    is recorded as the old row removed and the new one added. The caller
+    commits.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    for file_type, uploaded_by, file_size in rows:
+        for key in _stat_keys(file_type, uploaded_by):
+            deltas[key][0] += sign
+            deltas[key][1] += sign * (file_size or 0)
+    apply_deltas(deltas)
+
+
+def apply_deltas(deltas):
+    """Apply ``{(scope, name): [count_delta, bytes_delta]}`` and bump the version."""
+    if not deltas:
+        return
+    deltas.setdefault(('total', ''), [0, 0])
+    table = MediaStat.__table__
+    now = datetime.utcnow()
+
+    # Rows that do not exist yet (a new type or uploader) are inserted first
+    existing = set(db.session.query(MediaStat.scope, MediaStat.name).filter(
+        db.tuple_(MediaStat.scope, MediaStat.name).in_(list(deltas))))
+    for scope, name in deltas:
+        if (scope, name) in existing:
+            continue
+        try:
+            with db.session.begin_nested():
+                db.session.execute(insert(table).values(
+                    scope=scope, name=name, count=0, bytes=0, version=0, updated_at=now))
+        except IntegrityError:
+            pass  # a concurrent writer created it first
+
+    db.session.execute(
+        update(table)
+        .where(table.c.scope == bindparam('k_scope'), table.c.name == bindparam('k_name'))
+        .values(count=table.c.count + bindparam('d_count'),
+                bytes=table.c.bytes + bindparam('d_bytes'),
+                version=table.c.version + bindparam('d_version'),
+                updated_at=now),
+        [{'k_scope': scope, 'k_name': name, 'd_count': count, 'd_bytes': size,
+          'd_version': 1 if scope == 'total' else 0}
+         for (scope, name), (count, size) in deltas.items()]
+    )
+
+
+def rebuild_stats():
+    """Recompute every counter from the media table; returns the new version."""
+    present = Media.is_missing.is_(False)
+    totals = db.session.query(db.func.count(Media.id), db.func.coalesce(db.func.sum(Media.file_size), 0)).filter(present)
+    by_type = db.session.query(Media.file_type, db.func.count(Media.id), db.func.coalesce(db.func.sum(Media.file_size), 0)
+                               ).filter(present).group_by(Media.file_type)
+    by_uploader = db.session.query(Media.uploaded_by, db.func.count(Media.id), db.func.coalesce(db.func.sum(Media.file_size), 0)
+                                   ).filter(present).group_by(Media.uploaded_by)
+
+    # Keep the version monotonic so cached ETags are never reused
+    version = (db.session.query(MediaStat.version).filter_by(scope='total', name='').scalar() or 0) + 1
+    now = datetime.utcnow()
+
+    rows = {}
+    count, size = totals.one()
+    rows[('total', '')] = (count, size)
+    for file_type, count, size in by_type:
+        rows[('type', file_type)] = (count, size)
+    for uploaded_by, count, size in by_uploader:
+        key = ('uploader', uploaded_by or UNKNOWN_UPLOADER)
+        previous = rows.get(key, (0, 0))
+        rows[key] = (previous[0] + count, previous[1] + size)
+
+    db.session.execute(delete(MediaStat.__table__))
+    db.session.execute(insert(MediaStat.__table__), [
+        {'scope': scope, 'name': name, 'count': count, 'bytes': size,
+         'version': version if scope == 'total' else 0, 'updated_at': now}
+        for (scope, name), (count, size) in rows.items()])
+    return version
+
+
+def _ensure_built():
+    if db.session.get(MediaStat, ('total', '')) is None:
+        rebuild_stats()
+        db.session.commit()
+
+
+def get_totals():
+    """The total row (count, bytes, version): a single primary-key read.
+
+    Builds the table on first use, e.g. right after it was created on an
+    existing install.
+    """
+    total = db.session.get(MediaStat, ('total', ''))
+    if total is None:
+        _ensure_built()
+        total = db.session.get(MediaStat, ('total', ''))
+    return total
+
+
+def get_breakdown(scope):
+    """Non-empty ``(name, count, bytes)`` rows of one scope, largest first."""
+    _ensure_built()
+    return db.session.query(MediaStat.name, MediaStat.count, MediaStat.bytes).filter(
+        MediaStat.scope == scope, MediaStat.count > 0).order_by(MediaStat.count.desc()).all()
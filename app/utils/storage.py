@@ -0,0 +1,130 @@
+"""Content-addressed blob storage for uploads.
+
+Bytes are stored once under ``UPLOAD_FOLDER/objects/<ab>/<sha256>``. Each
+public filename in ``UPLOAD_FOLDER`` is a hard link to its blob, so the
+nginx ``/uploads/`` alias, renditions and the sync engine keep working on
+plain names while identical uploads share a single copy on disk.
+"""
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+OBJECTS_DIR = 'objects'
+CHUNK_SIZE = 64 * 1024
+
+# os.link errors that mean "no hard links here", as opposed to a name clash
+_NO_HARD_LINK = {errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EMLINK}
+
+
+def objects_root(upload_folder):
+    """Directory holding the content-addressed blobs."""
+    return os.path.join(upload_folder, OBJECTS_DIR)
+
+
+def blob_path(upload_folder, content_hash):
+    """Path of the blob for a SHA-256 hex digest."""
+    return os.path.join(objects_root(upload_folder), content_hash[:2], content_hash)
+
+
+def stream_to_staging(stream, upload_folder):
+    """Copy a stream into a staging file while hashing it.
+
+    Returns ``(staging_path, sha256_hex, size)``. The staging file lives on
+    the same filesystem as the blobs so it can be renamed into place.
+    """
+    staging_dir = os.path.join(objects_root(upload_folder), 'tmp')
+    os.makedirs(staging_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(dir=staging_dir, delete=False) as staging:
+        while True:
+            chunk = stream.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            staging.write(chunk)
+            size += len(chunk)
+    return staging.name, digest.hexdigest(), size
+
+
+def hash_file(path):
+    """SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def commit_blob(upload_folder, staging_path, content_hash):
+    """Move a staging file into the blob store.
+
+    Returns False (and discards the staging file) when the blob already
+    existed, i.e. the upload was a duplicate.
+    """
+    path = blob_path(upload_folder, content_hash)
+    if os.path.exists(path):
+        os.remove(staging_path)
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(staging_path, path)
+    return True
+
+
+def unique_filename(filename, taken, upload_folder):
+    """Pick a public name not used by the batch, the database or the folder."""
+    name, ext = os.path.splitext(filename)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    candidate, n = filename, 1
+    while candidate in taken or os.path.exists(os.path.join(upload_folder, candidate)):
+        suffix = timestamp if n == 1 else f"{timestamp}_{n}"
+        candidate = f"{name}_{suffix}{ext}"
+        n += 1
+    return candidate
+
+
+def link_blob(upload_folder, content_hash, filename):
+    """Expose a blob under a public filename (hard link, copy as fallback).
+
+    Raises FileExistsError rather than replacing a file that is already
+    there, e.g. when two uploads race for the same name.
+    """
+    source = blob_path(upload_folder, content_hash)
+    target = os.path.join(upload_folder, filename)
+    try:
+        os.link(source, target)
+    except OSError as e:
+        if e.errno not in _NO_HARD_LINK:
+            raise
+        # Filesystems without hard links (some FAT/SMB mounts) get a copy, created exclusively
+        with open(source, 'rb') as src, open(target, 'xb') as dst:
+            shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+
+def adopt_file(upload_folder, filename, content_hash):
+    """Move an existing public file into the blob store and link it back.
+
+    If an identical blob already exists the public file is replaced by a
+    link to it, reclaiming the duplicate's space.
+    """
+    public_path = os.path.join(upload_folder, filename)
+    path = blob_path(upload_folder, content_hash)
+    if os.path.exists(path):
+        if os.path.samefile(path, public_path):
+            return
+        tmp_path = f"{public_path}.tmp"
+        os.link(path, tmp_path)
+        os.replace(tmp_path, public_path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.link(public_path, path)
+
+
+def remove_blob(upload_folder, content_hash):
+    """Delete a blob once nothing references it any more."""
+    path = blob_path(upload_folder, content_hash)
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,290 @@
+"""Incremental synchronization of the uploads folder with the media table.
+
+``reconcile`` diffs the folder against a cached directory snapshot, so a
+run only touches the database for names that actually changed. ``watch``
+applies changes as they happen using inotify when the optional
+``inotify_simple`` package is installed, and falls back to polling
+``reconcile`` otherwise. Both write in batches: one IN query per chunk of
+names, one bulk INSERT for new files, one UPDATE to flag missing ones.
+"""
+import json
+import os
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import bindparam, insert, update
+
+from app.extensions import db
+from app.jobs import enqueue_many
+from app.models import Media
+from app.utils.helpers import allowed_file
+from app.utils.page_cache import bump_content_version
+from app.utils.stats import record_media
+from app.utils.storage import blob_path, remove_blob
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags
+except ImportError:  # pragma: no cover - optional dependency
+    INotify = None
+
+# Keep IN lists well below SQLite's bound-parameter limit
+CHUNK_SIZE = 500
+
+
+def _chunks(items):
+    items = list(items)
+    for start in range(0, len(items), CHUNK_SIZE):
+        yield items[start:start + CHUNK_SIZE]
+
+
+def snapshot_path():
+    """Location of the cached directory snapshot."""
+    return os.path.join(current_app.instance_path, 'uploads_snapshot.json')
+
+
+def load_snapshot():
+    """Return the last saved snapshot, or None if there is none."""
+    try:
+        with open(snapshot_path(), 'r', encoding='utf-8') as f:
+            return {name: tuple(stat) for name, stat in json.load(f).items()}
+    except (OSError, ValueError):
+        return None
+
+
+def save_snapshot(snapshot):
+    """Atomically persist a snapshot."""
+    path = snapshot_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+def scan_uploads(folder):
+    """Map every allowed file in the uploads folder to ``(size, mtime_ns)``."""
+    snapshot = {}
+    for entry in os.scandir(folder):
+        if entry.is_file() and allowed_file(entry.name):
+            st = entry.stat()
+            snapshot[entry.name] = (st.st_size, st.st_mtime_ns)
+    return snapshot
+
+
+def diff_snapshots(old, new):
+    """Return ``(added, removed, changed)`` name sets between two snapshots."""
+    added = new.keys() - old.keys()
+    removed = old.keys() - new.keys()
+    changed = {name for name in new.keys() & old.keys() if new[name] != old[name]}
+    return added, removed, changed
+
+
+def _rewritten_siblings(changed, sizes):
+    """Other names whose bytes changed along with ``changed``.
+
+    Writing a file in place writes through its hard link, so the shared blob
+    and every other name linked to it hold the new bytes too. Their sizes
+    are added to ``sizes``.
+    """
+    upload_folder = current_app.config['UPLOAD_FOLDER']
+    names_by_hash = {}
+    for chunk in _chunks(changed):
+        names_by_hash.update(db.session.query(Media.content_hash, Media.filename).filter(
+            Media.filename.in_(chunk), Media.content_hash.isnot(None)))
+
+    rewritten = []
+    for content_hash, name in names_by_hash.items():
+        try:
+            if os.path.samefile(blob_path(upload_folder, content_hash), os.path.join(upload_folder, name)):
+                rewritten.append(content_hash)
+        except OSError:
+            pass  # blob or file already gone; a rename-style rewrite leaves the blob alone
+
+    siblings = set()
+    for chunk in _chunks(rewritten):
+        rows = db.session.query(Media.filename).filter(
+            Media.content_hash.in_(chunk), Media.is_missing.is_(False))
+        for (name,) in rows:
+            if name in changed:
+                continue
+            try:
+                sizes[name] = os.path.getsize(os.path.join(upload_folder, name))
+            except OSError:
+                continue
+            siblings.add(name)
+    return siblings
+
+
+def apply_changes(added=(), removed=(), changed=(), sizes=None):
+    """Write a batch of filesystem changes to the database and commit.
+
+    ``sizes`` maps filename -> size for added and changed files. Returns a
+    dict of counts.
+    """
+    sizes = sizes or {}
+    result = {'added': 0, 'restored': 0, 'missing': 0, 'updated': 0}
+    stat_columns = (Media.file_type, Media.uploaded_by, Media.file_size)
+
+    # Names that already have rows are restored rather than inserted
+    known = {}
+    for chunk in _chunks(added):
+        rows = db.session.query(Media.filename, Media.is_missing).filter(Media.filename.in_(chunk))
+        known.update(dict(rows.all()))
+
+    new_rows = [{
+        'filename': name,
+        'original_filename': name,
+        'file_type': name.rsplit('.', 1)[1].lower(),
+        'file_size': sizes[name],
+        'uploaded_by': 'system'
+    } for name in added if name not in known]
+    if new_rows:
+        db.session.execute(insert(Media), new_rows)
+        record_media((row['file_type'], row['uploaded_by'], row['file_size']) for row in new_rows)
+        result['added'] = len(new_rows)
+
+    restored = [name for name, missing in known.items() if missing]
+    for chunk in _chunks(restored):
+        record_media(db.session.query(*stat_columns).filter(Media.filename.in_(chunk)))
+        db.session.query(Media).filter(Media.filename.in_(chunk)).update(
+            {'is_missing': False}, synchronize_session=False)
+    result['restored'] = len(restored)
+
+    for chunk in _chunks(removed):
+        present = Media.filename.in_(chunk), Media.is_missing.is_(False)
+        record_media(db.session.query(*stat_columns).filter(*present), sign=-1)
+        result['missing'] += db.session.query(Media).filter(*present).update(
+            {'is_missing': True}, synchronize_session=False)
+
+    if changed:
+        changed = set(changed) | _rewritten_siblings(changed, sizes)
+
+        # Stats move by the size difference: old rows out, new sizes in
+        old_hashes = set()
+        for chunk in _chunks(changed):
+            old_rows = db.session.query(Media.filename, Media.content_hash, *stat_columns).filter(
+                Media.filename.in_(chunk), Media.is_missing.is_(False)).all()
+            record_media(((row.file_type, row.uploaded_by, row.file_size) for row in old_rows), sign=-1)
+            record_media((row.file_type, row.uploaded_by, sizes[row.filename]) for row in old_rows)
+            old_hashes.update(row.content_hash for row in old_rows if row.content_hash)
+
+        # Core statement so the parameter list runs as a single executemany. The
+        # cleared hash and dimensions make process_image re-hash, re-link and
+        # re-read the new bytes, so fingerprinted URLs and ETags change with them.
+        table = Media.__table__
+        db.session.execute(
+            update(table).where(table.c.filename == bindparam('name')).values(
+                file_size=bindparam('size'), content_hash=None, width=None, height=None),
+            [{'name': name, 'size': sizes[name]} for name in changed]
+        )
+        result['updated'] = len(changed)
+
+        # Blobs no row points at any more, including any rewritten in place
+        upload_folder = current_app.config['UPLOAD_FOLDER']
+        for chunk in _chunks(old_hashes):
+            in_use = {content_hash for (content_hash,) in db.session.query(Media.content_hash).filter(
+                Media.content_hash.in_(chunk)).distinct()}
+            for content_hash in set(chunk) - in_use:
+                remove_blob(upload_folder, content_hash)
+
+    # New, restored and rewritten files need fresh renditions
+    needs_processing = [row['filename'] for row in new_rows] + restored + list(changed)
+    for chunk in _chunks(needs_processing):
+        enqueue_many('process_image', [{'media_id': media_id} for (media_id,) in
+                                       db.session.query(Media.id).filter(Media.filename.in_(chunk))])
+
+    db.session.commit()
+    if any(result.values()):
+        bump_content_version()
+    return result
+
+
+def reconcile(full=False):
+    """Bring the media table in line with the uploads folder.
+
+    With a snapshot, only names that differ from it are sent to the
+    database. Without one (first run) or with ``full``, the folder is
+    compared against every filename in the table in a single query.
+    """
+    current = scan_uploads(current_app.config['UPLOAD_FOLDER'])
+    previous = None if full else load_snapshot()
+
+    if previous is None:
+        in_db = dict(db.session.query(Media.filename, Media.is_missing).all())
+        added = {name for name in current if name not in in_db or in_db[name]}
+        removed = {name for name, missing in in_db.items() if name not in current and not missing}
+        changed = set()
+    else:
+        added, removed, changed = diff_snapshots(previous, current)
+
+    sizes = {name: current[name][0] for name in added | changed}
+    result = apply_changes(added, removed, changed, sizes)
+    save_snapshot(current)
+    return result
+
+
+def _watch_inotify(folder, on_batch, debounce):
+    """Feed batched inotify events for ``folder`` to ``on_batch``."""
+    inotify = INotify()
+    watch_flags = (inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO
+                   | inotify_flags.DELETE | inotify_flags.MOVED_FROM)
+    inotify.add_watch(folder, watch_flags)
+
+    while True:
+        events = inotify.read()  # blocks until something happens
+        time.sleep(debounce)
+        events += inotify.read(timeout=0)
+        added, removed = set(), set()
+        for event in events:
+            if not event.name or not allowed_file(event.name):
+                continue
+            if event.mask & (inotify_flags.CLOSE_WRITE | inotify_flags.MOVED_TO):
+                added.add(event.name)
+                removed.discard(event.name)
+            else:
+                removed.add(event.name)
+                added.discard(event.name)
+        if added or removed:
+            on_batch(added, removed)
+
+
+def watch(interval=5.0, debounce=1.0, log=print):
+    """Run forever, applying upload folder changes as they happen."""
+    folder = current_app.config['UPLOAD_FOLDER']
+    log(f"Initial reconcile: {reconcile()}")
+
+    if INotify is None:
+        log(f"inotify_simple not installed; polling every {interval:.0f}s.")
+        while True:
+            time.sleep(interval)
+            result = reconcile()
+            if any(result.values()):
+                log(f"{datetime.now():%H:%M:%S} {result}")
+
+    log(f"Watching {folder} with inotify.")
+
+    def on_batch(added, removed):
+        # A file may be gone again by the time the batch is applied
+        present = {}
+        for name in added:
+            try:
+                st = os.stat(os.path.join(folder, name))
+            except FileNotFoundError:
+                removed.add(name)
+                continue
+            present[name] = (st.st_size, st.st_mtime_ns)
+
+        # Names already in the snapshot with a new size/mtime were rewritten
+        snapshot = load_snapshot() or {}
+        changed = {name for name in present if name in snapshot and snapshot[name] != present[name]}
+        result = apply_changes(set(present) - changed, removed, changed,
+                               {name: stat[0] for name, stat in present.items()})
+        log(f"{datetime.now():%H:%M:%S} {result}")
+
+        snapshot.update(present)
+        for name in removed:
+            snapshot.pop(name, None)
+        save_snapshot(snapshot)
+
+    _watch_inotify(folder, on_batch, debounce)
@@ -0,0 +1,160 @@
+"""On-demand resized and transcoded variants of uploads.
+
+Variants are rendered once with Pillow and kept under
+``UPLOAD_FOLDER/derived/<ab>/<key>.<ext>``, where the key covers the source
+content, width, format and quality. The cache is bounded by
+``IMAGE_CACHE_MAX_BYTES``: each hit refreshes the file's mtime and, once
+the budget is exceeded, the least recently used variants are evicted. The
+running total lives in ``derived/.size``, updated under a ``flock`` so all
+workers share one budget; eviction re-measures the directory.
+Concurrent requests for the same missing variant wait on a striped lock
+(threads in-process, ``flock`` across workers) so it renders once.
+"""
+import hashlib
+import os
+import threading
+
+from app.utils.images import FORMAT_EXTENSIONS, _flatten, _save_atomic, supported_formats
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+DERIVED_DIR = 'derived'
+LOCK_DIR = '.locks'
+LOCK_STRIPES = 256
+
+# Preference order when negotiating from the Accept header
+NEGOTIATED_FORMATS = ('avif', 'webp')
+
+# Evict down to this fraction of the budget so eviction does not run every render
+EVICT_TARGET = 0.9
+
+SIZE_FILE = '.size'
+
+_thread_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+_size_lock = threading.Lock()
+
+
+def clamp_width(width, widths):
+    """Round a requested width up to the nearest allowed width."""
+    for allowed in sorted(widths):
+        if allowed >= width:
+            return allowed
+    return max(widths)
+
+
+def negotiate_format(accept_mimetypes, requested=None):
+    """Pick an output format from ``fmt=`` or the Accept header.
+
+    Returns ``(fmt, negotiated)``; ``negotiated`` means the response must
+    carry ``Vary: Accept``. Returns ``(None, False)`` for an unknown ``fmt``.
+    """
+    if requested:
+        requested = 'jpeg' if requested == 'jpg' else requested
+        if requested in FORMAT_EXTENSIONS and supported_formats([requested]):
+            return requested, False
+        return None, False
+    # Only explicitly listed types count: */* from clients that cannot decode
+    # AVIF must not select it, and q=0 means "not acceptable"
+    listed = {value for value, quality in accept_mimetypes if quality > 0}
+    for fmt in supported_formats(NEGOTIATED_FORMATS):
+        if f"image/{fmt}" in listed:
+            return fmt, True
+    return 'jpeg', True
+
+
+def variant_relpath(filename, version, width, fmt, quality):
+    """Cache path, relative to ``UPLOAD_FOLDER``, of one variant."""
+    key = hashlib.sha256(f"{filename}|{version}|{width}|{fmt}|{quality}".encode()).hexdigest()
+    return f"{DERIVED_DIR}/{key[:2]}/{key}.{FORMAT_EXTENSIONS[fmt]}"
+
+
+def _render(source, target, width, fmt, quality):
+    from PIL import Image, ImageOps
+    with Image.open(source) as original:
+        original.draft('RGB', (width, width))
+        image = ImageOps.exif_transpose(original)
+        if fmt == 'jpeg':
+            image = _flatten(image)
+        elif image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        # Never upscale: a width beyond the original keeps the original size
+        image.thumbnail((width, width * 10), Image.LANCZOS)
+    _save_atomic(image, target, fmt, quality)
+
+
+def _evict(derived_dir, budget, keep):
+    """Delete least recently used variants (never ``keep``) until under the budget; returns the new total."""
+    entries = []
+    for root, dirs, files in os.walk(derived_dir):
+        if LOCK_DIR in dirs:
+            dirs.remove(LOCK_DIR)
+        for name in files:
+            path = os.path.join(root, name)
+            if name.endswith('.tmp') or name == SIZE_FILE or path == keep:
+                continue
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+
+    total = sum(size for _mtime, size, _path in entries) + os.path.getsize(keep)
+    if total > budget:
+        for _mtime, size, path in sorted(entries):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            if total <= budget * EVICT_TARGET:
+                break
+    return total
+
+
+def _account(derived_dir, added, budget, keep):
+    """Add a new variant to the cache total shared by all workers, evicting when over budget."""
+    size_path = os.path.join(derived_dir, SIZE_FILE)
+    with _size_lock, open(os.path.join(derived_dir, LOCK_DIR, 'size'), 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            with open(size_path, 'r') as f:
+                total = int(f.read()) + added
+        except (OSError, ValueError):
+            total = None  # first render, or the total was lost: measure
+        if total is None or total > budget:
+            total = _evict(derived_dir, budget, keep)
+        tmp_path = f"{size_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(str(total))
+        os.replace(tmp_path, size_path)
+
+
+def get_variant(upload_folder, filename, version, width, fmt, quality, budget):
+    """Return the relpath of a variant, rendering it on first request."""
+    relpath = variant_relpath(filename, version, width, fmt, quality)
+    path = os.path.join(upload_folder, relpath)
+
+    try:
+        os.utime(path)  # mark as recently used
+        return relpath
+    except FileNotFoundError:
+        pass
+
+    # Variants sharing a stripe serialize; a variant never renders twice
+    stripe = int(relpath.rsplit('/', 1)[1][:2], 16) % LOCK_STRIPES
+    derived_dir = os.path.join(upload_folder, DERIVED_DIR)
+    lock_path = os.path.join(derived_dir, LOCK_DIR, f"{stripe:02x}")
+    os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+
+    with _thread_locks[stripe], open(lock_path, 'w') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # Another thread or worker may have rendered it while we waited
+        if not os.path.exists(path):
+            _render(os.path.join(upload_folder, filename), path, width, fmt, quality)
+            _account(derived_dir, os.path.getsize(path), budget, path)
+    return relpath
@@ -0,0 +1,196 @@
+"""Compare database engine profiles on the gallery and upload paths.
+
+Each profile gets a fresh app (temporary upload folder and, for SQLite, a
+temporary database file) seeded with ``--rows`` media rows. The benchmark
+then drives the WSGI app from several threads at once:
+
+* ``gallery``: GET /gallery, the first keyset page plus materialized stats
+* ``feed``: GET /api/media with a cursor a few pages deep
+* ``upload``: POST /api/media/batch with a few small images
+
+Usage::
+
+    python benchmarks/db_profiles.py --rows 5000 --requests 300 --threads 4
+    python benchmarks/db_profiles.py --mysql-url mysql+pymysql://user:pw@localhost/bench
+
+MySQL profiles only run when ``--mysql-url`` points at a scratch database;
+its tables are created and dropped by the benchmark.
+"""
+import argparse
+import io
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ADMIN = {'username': 'admin', 'password': 'Andre4301$$'}
+
+
+def build_app(profile, database_uri, upload_folder, **overrides):
+    """Create an app for one engine profile, database and upload folder.
+
+    ``overrides`` are extra config values. The profile's settings are
+    applied explicitly rather than by re-importing ``config``, so several
+    apps can be built in one process. The instance folder (content version,
+    sync snapshot, caches) and metrics go next to the upload folder, so a
+    run never writes into the checkout.
+    """
+    from config import config
+    from config.config import engine_profile
+    from app import create_app
+
+    settings = engine_profile(profile)
+    workdir = os.path.dirname(os.path.abspath(upload_folder))
+
+    class BenchConfig(config['production']):
+        DB_PROFILE = profile
+        SQLALCHEMY_DATABASE_URI = database_uri
+        SQLALCHEMY_ENGINE_OPTIONS = settings['engine_options']
+        SQLITE_PRAGMAS = settings.get('sqlite_pragmas', {})
+        UPLOAD_FOLDER = upload_folder
+        METRICS_DIR = os.path.join(workdir, 'metrics')
+        STATIC_EXPORT_DIR = os.path.join(workdir, 'static_site')
+        SESSION_COOKIE_SECURE = False
+
+    for name, value in overrides.items():
+        setattr(BenchConfig, name, value)
+
+    config['bench'] = BenchConfig
+    # Read by create_app, which sets up the filesystem page cache under it
+    os.environ['INSTANCE_PATH'] = os.path.join(workdir, 'instance')
+    return create_app('bench')
+
+
+def seed(app, rows):
+    """Create the schema and admin, then insert ``rows`` media rows (no files)."""
+    from sqlalchemy import insert
+    from app.extensions import db
+    from app.models import Media, User
+    from app.utils.stats import rebuild_stats
+
+    start = datetime.utcnow() - timedelta(days=365)
+    with app.app_context():
+        db.create_all()
+        admin = User(username=ADMIN['username'], is_admin=True)
+        admin.set_password(ADMIN['password'])
+        db.session.add(admin)
+        batch = []
+        for i in range(rows):
+            batch.append({
+                'filename': f"seed_{i:07d}.jpg",
+                'original_filename': f"seed_{i:07d}.jpg",
+                'file_type': 'jpg',
+                'file_size': 100_000 + i,
+                'upload_time': start + timedelta(minutes=i),
+                'uploaded_by': 'bench',
+            })
+            if len(batch) == 1000:
+                db.session.execute(insert(Media), batch)
+                batch = []
+        if batch:
+            db.session.execute(insert(Media), batch)
+        rebuild_stats()
+        db.session.commit()
+
+
+def tiny_jpeg(seed_value):
+    from PIL import Image
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 48), (seed_value % 256, (seed_value * 7) % 256, 90)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def run_scenario(app, name, requests, threads):
+    """Issue ``requests`` calls of one scenario from ``threads`` threads; returns latencies in ms."""
+    local = threading.local()
+    counter = iter(range(10 ** 9))
+    lock = threading.Lock()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+            local.client.post('/login', data=ADMIN)
+        return local.client
+
+    cursor = None
+    if name == 'feed':
+        with app.test_client() as c:
+            for _ in range(3):
+                cursor = c.get('/api/media', query_string={'cursor': cursor} if cursor else {}).json['next_cursor']
+
+    def one(_):
+        c = client()
+        with lock:
+            n = next(counter)
+        started = time.perf_counter()
+        if name == 'gallery':
+            response = c.get('/gallery')
+        elif name == 'feed':
+            response = c.get('/api/media', query_string={'cursor': cursor})
+        else:
+            files = [(io.BytesIO(tiny_jpeg(n * 3 + k)), f"bench_{n}_{k}.jpg") for k in range(3)]
+            response = c.post('/api/media/batch', data={'files': files}, content_type='multipart/form-data')
+        elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code >= 400:
+            raise RuntimeError(f"{name}: HTTP {response.status_code}")
+        return elapsed
+
+    with ThreadPoolExecutor(threads) as pool:
+        wall = time.perf_counter()
+        latencies = list(pool.map(one, range(requests)))
+        wall = time.perf_counter() - wall
+    return latencies, wall
+
+
+def summarize(latencies, wall):
+    ordered = sorted(latencies)
+    return {
+        'rps': len(ordered) / wall,
+        'p50': statistics.median(ordered),
+        'p95': ordered[int(len(ordered) * 0.95) - 1],
+        'max': ordered[-1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--mysql-url', help='scratch MySQL database for the MySQL profiles')
+    args = parser.parse_args()
+
+    targets = [('default', 'sqlite'), ('sqlite-wal', 'sqlite')]
+    if args.mysql_url:
+        targets += [('default', args.mysql_url), ('mysql-pooled', args.mysql_url)]
+
+    print(f"{args.rows} rows, {args.requests} requests per scenario, {args.threads} threads\n")
+    print(f"{'profile':<14}{'database':<9}{'scenario':<10}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+    for profile, database in targets:
+        workdir = tempfile.mkdtemp(prefix='bench_db_')
+        uri = f"sqlite:///{os.path.join(workdir, 'bench.sqlite')}" if database == 'sqlite' else database
+        app = build_app(profile, uri, os.path.join(workdir, 'uploads'))
+        try:
+            seed(app, args.rows)
+            for scenario in ('gallery', 'feed', 'upload'):
+                result = summarize(*run_scenario(app, scenario, args.requests, args.threads))
+                print(f"{profile:<14}{database.split(':')[0]:<9}{scenario:<10}"
+                      f"{result['rps']:>9.1f}{result['p50']:>9.1f}{result['p95']:>9.1f}{result['max']:>9.1f}")
+        finally:
+            from app.extensions import db
+            with app.app_context():
+                if database != 'sqlite':
+                    db.drop_all()
+                db.engine.dispose()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,480 @@
+"""Load test: how many concurrent visitors a serving setup can handle.
+
+The harness seeds a scratch install and starts the app on it. The
+install is a SQLite (WAL) database with ``--media`` rows, real JPEGs in
+its uploads folder and ``--posts`` Markdown posts. The app runs under
+the Werkzeug server (``run.py``) or the shipped gunicorn config, with the
+chosen page cache backend. ``--url`` skips all of that and targets a
+server that is already running, e.g. nginx in front of gunicorn.
+
+``--concurrency`` virtual visitors each replay a weighted traffic mix for
+``--duration`` seconds. Each visitor keeps one connection alive, as a
+browser does, and uses a small asyncio HTTP/1.1 client. No third-party
+packages are needed. The mix:
+
+* ``gallery``: GET /gallery
+* ``feed``: GET /api/media?cursor=..., a later gallery page
+* ``image``: GET one of the image URLs the gallery and feed reference
+* ``blog``: GET /blog
+* ``post``: GET /blog/<slug>
+* ``stats``: GET /api/stats
+* ``upload``: an admin POST /api/media/batch with two JPEGs (rare)
+
+Requests during the first ``--warmup`` seconds are not recorded. The
+report gives throughput and p50/p95/p99 latency per route. Every random
+choice is seeded, so runs with the same arguments replay the same
+traffic and results stay comparable across serving modes and cache
+settings. ``--output`` saves a run as JSON. ``--compare`` prints saved
+runs side by side.
+
+Usage::
+
+    python benchmarks/load.py --server gunicorn --page-cache memory --concurrency 32 --output gunicorn-memory.json
+    python benchmarks/load.py --server werkzeug --page-cache none --output werkzeug-none.json
+    python benchmarks/load.py --url http://127.0.0.1:80 --concurrency 64
+    python benchmarks/load.py --compare werkzeug-none.json gunicorn-memory.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import urlencode, urlsplit
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db_profiles import ADMIN, build_app, seed  # noqa: E402
+from serving import ROOT, free_port, start_server  # noqa: E402
+from suite import SEED, write_posts  # noqa: E402
+
+MIX = {
+    'gallery': 20,
+    'feed': 10,
+    'image': 40,
+    'blog': 10,
+    'post': 14,
+    'stats': 5,
+    'upload': 1,
+}
+
+_IMAGE_ATTR_RE = re.compile(r'(?:src|srcset)="(/(?:img|uploads)/[^"]+)"')
+_POST_LINK_RE = re.compile(r'href="(/blog/[^"/?#]+)"')
+
+
+class HTTPClient:
+    """A keep-alive HTTP/1.1 connection to one host, reopened whenever the server closes it."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers=None, body=b''):
+        """Send one request; returns ``(status, headers, body)``."""
+        for attempt in (1, 2):
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                return await self._exchange(method, path, headers or {}, body)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                await self.close()
+                # A kept-alive connection may have been closed by the server while idle
+                if not reused or attempt == 2:
+                    raise
+
+    async def _exchange(self, method, path, headers, body):
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}", 'Connection: keep-alive']
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        if body or method == 'POST':
+            lines.append(f"Content-Length: {len(body)}")
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readuntil(b'\r\n')
+        version, status = status_line.split(b' ', 2)[:2]
+        response_headers = {}
+        while True:
+            line = await self.reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            value = value.strip()
+            # Repeated headers (Set-Cookie) are joined; the harness only needs the session cookie
+            response_headers[name] = f"{response_headers[name]}, {value}" if name in response_headers else value
+
+        if method == 'HEAD' or int(status) in (204, 304):
+            data = b''
+        elif response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                chunk = await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+                chunks.append(chunk[:-2])
+            data = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            data = await self.reader.readexactly(int(response_headers['content-length']))
+        else:
+            data = await self.reader.read()
+            response_headers['connection'] = 'close'
+
+        connection = response_headers.get('connection', '').lower()
+        if connection == 'close' or (version == b'HTTP/1.0' and connection != 'keep-alive'):
+            await self.close()
+        return int(status), response_headers, data
+
+
+def multipart(files):
+    """Encode ``[(filename, bytes)]`` as a multipart/form-data body under the ``files`` field."""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for filename, data in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="files"; filename="{filename}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n'.encode() + data + b'\r\n'
+        )
+    body = b''.join(parts) + f'--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def sample_jpeg(rng, size=(1200, 900)):
+    """A photo-sized JPEG with enough detail to compress like a real one (~100 KB)."""
+    from PIL import Image
+    x0 = rng.uniform(-2.2, -0.8)
+    y0 = rng.uniform(-1.2, 0.2)
+    image = Image.effect_mandelbrot(size, (x0, y0, x0 + 1.5, y0 + 1.1), 60).convert('RGB')
+    tint = Image.new('RGB', size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    buffer = io.BytesIO()
+    Image.blend(image, tint, 0.35).save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def prepare_install(workdir, media, posts, images):
+    """Seed the database, uploads folder and blog posts; returns the server environment."""
+    upload_folder = os.path.join(workdir, 'uploads')
+    database_uri = f"sqlite:///{os.path.join(workdir, 'load.sqlite')}"
+    app = build_app('sqlite-wal', database_uri, upload_folder, METRICS_ENABLED=False)
+    seed(app, media)
+
+    # Rows share a few distinct photos through hard links, so the uploads folder stays small
+    rng = random.Random(SEED)
+    os.makedirs(upload_folder, exist_ok=True)
+    sources = []
+    for i in range(images):
+        path = os.path.join(workdir, f"source_{i}.jpg")
+        with open(path, 'wb') as f:
+            f.write(sample_jpeg(rng))
+        sources.append(path)
+    for i in range(media):
+        os.link(sources[i % images], os.path.join(upload_folder, f"seed_{i:07d}.jpg"))
+
+    content_dir = os.path.join(workdir, 'blogs')
+    write_posts(content_dir, posts)
+    from app.extensions import db
+    with app.app_context():
+        db.engine.dispose()
+
+    return dict(
+        os.environ,
+        FLASK_ENV='production',
+        FLASK_SECRET='load-test',
+        DB_PROFILE='sqlite-wal',
+        DATABASE_URL=database_uri,
+        UPLOAD_FOLDER=upload_folder,
+        BLOG_CONTENT_DIR=content_dir,
+        INSTANCE_PATH=os.path.join(workdir, 'instance'),
+        METRICS_DIR=os.path.join(workdir, 'metrics'),
+    )
+
+
+def start_processes(args, env, port):
+    """Start the web server (and the job worker) on the seeded install."""
+    env = dict(env, PAGE_CACHE_BACKEND=args.page_cache, METRICS_ENABLED='1' if args.metrics else '0')
+    processes = [start_server(args.server, port, env, args.workers, args.threads)]
+    if args.job_worker:
+        # Uploads queue rendition jobs; in production the worker competes for the same CPUs
+        processes.append(subprocess.Popen([sys.executable, '-m', 'flask', '--app', 'wsgi', 'worker', '--workers', '1'],
+                                          cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+    return processes
+
+
+async def discover(host, port, feed_pages):
+    """Collect the URLs the mix picks from: feed cursors, image URLs and post links."""
+    client = HTTPClient(host, port)
+    try:
+        status, _, body = await client.request('GET', '/gallery')
+        if status != 200:
+            raise RuntimeError(f"/gallery returned HTTP {status}")
+        images = set()
+        for value in _IMAGE_ATTR_RE.findall(body.decode('utf-8', 'replace')):
+            # A srcset may list several candidates ("url 400w, url 800w")
+            images.update(candidate.split()[0] for candidate in value.split(',') if candidate.strip())
+
+        cursors, cursor = [], None
+        for _ in range(feed_pages):
+            path = '/api/media' + (f"?{urlencode({'cursor': cursor})}" if cursor else '')
+            _, _, body = await client.request('GET', path)
+            page = json.loads(body)
+            for item in page['items']:
+                images.add(item['url'])
+                for size in ('thumb', 'slide'):
+                    if item.get(size):
+                        images.update(item[size]['sources'].values())
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+            cursors.append(cursor)
+
+        _, _, body = await client.request('GET', '/blog')
+        posts = sorted({link for link in _POST_LINK_RE.findall(body.decode('utf-8', 'replace'))
+                        if link.split('/')[2] not in ('new', 'search', 'tag')})
+
+        body, content_type = urlencode(ADMIN).encode(), 'application/x-www-form-urlencoded'
+        status, headers, _ = await client.request('POST', '/login', {'Content-Type': content_type}, body)
+        match = re.search(r'session=([^;,\s]+)', headers.get('set-cookie', ''))
+        if status != 302 or not match:
+            raise RuntimeError('admin login failed')
+    finally:
+        await client.close()
+    return {
+        'cursors': cursors,
+        'images': sorted(images),
+        'posts': posts,
+        'admin_cookie': f"session={match.group(1)}",
+    }
+
+
+async def visitor(number, host, port, targets, uploads, started, warmup_end, deadline, samples):
+    """One virtual visitor replaying the mix until the deadline."""
+    rng = random.Random(SEED * 1000 + number)
+    routes, weights = zip(*[(route, weight) for route, weight in MIX.items()
+                            if route not in ('feed', 'image', 'post') or targets[f"{route}_pool"]])
+    client = HTTPClient(host, port)
+    try:
+        while time.monotonic() < deadline:
+            route = rng.choices(routes, weights)[0]
+            method, headers, body = 'GET', {}, b''
+            if route == 'gallery':
+                path = '/gallery'
+            elif route == 'feed':
+                path = f"/api/media?{urlencode({'cursor': rng.choice(targets['feed_pool'])})}"
+            elif route == 'image':
+                path = rng.choice(targets['image_pool'])
+            elif route == 'blog':
+                path = '/blog'
+            elif route == 'post':
+                path = rng.choice(targets['post_pool'])
+            elif route == 'stats':
+                path = '/api/stats'
+            else:
+                method, path = 'POST', '/api/media/batch'
+                n = next(uploads)
+                body, content_type = multipart([(f"load_{n}_{k}.jpg", uploads.photo(n, k)) for k in range(2)])
+                headers = {'Content-Type': content_type, 'Cookie': targets['admin_cookie']}
+
+            request_started = time.monotonic()
+            try:
+                status, _, _ = await client.request(method, path, headers, body)
+            except (OSError, asyncio.IncompleteReadError, ValueError):
+                status = None
+                await client.close()
+            finished = time.monotonic()
+            if request_started >= warmup_end:
+                samples.append((route, finished - request_started, status, finished - started))
+    finally:
+        await client.close()
+
+
+class Uploads:
+    """Distinct upload payloads: each photo gets a unique trailer so none dedupes."""
+
+    def __init__(self, photos):
+        self.photos = photos
+        self.counter = 0
+
+    def __next__(self):
+        self.counter += 1
+        return self.counter
+
+    def photo(self, n, k):
+        return self.photos[(n + k) % len(self.photos)] + f"{n}-{k}".encode()
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list."""
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def summarize(samples, measured_seconds):
+    """Per-route and overall throughput, error counts and latency percentiles in ms."""
+    by_route = {}
+    for route, latency, status, _ in samples:
+        by_route.setdefault(route, []).append((latency, status))
+    by_route['all'] = [(latency, status) for _, latency, status, _ in samples]
+
+    summary = {}
+    for route, entries in by_route.items():
+        ordered = sorted(latency * 1000 for latency, _ in entries)
+        errors = sum(1 for _, status in entries if status is None or status >= 400)
+        summary[route] = {
+            'requests': len(entries),
+            'errors': errors,
+            'rps': len(entries) / measured_seconds,
+            'p50': percentile(ordered, 0.50),
+            'p95': percentile(ordered, 0.95),
+            'p99': percentile(ordered, 0.99),
+            'max': ordered[-1],
+        }
+    return summary
+
+
+def print_summary(summary):
+    print(f"{'route':<10}{'requests':>10}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    for route in [r for r in MIX if r in summary] + ['all']:
+        s = summary[route]
+        print(f"{route:<10}{s['requests']:>10}{s['errors']:>8}{s['rps']:>9.1f}{s['p50']:>9.1f}"
+              f"{s['p95']:>9.1f}{s['p99']:>9.1f}{s['max']:>9.1f}")
+
+
+def print_comparison(paths):
+    """Side-by-side throughput and tail latency of saved runs."""
+    runs = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            runs.append((os.path.splitext(os.path.basename(path))[0], json.load(f)))
+    for name, run in runs:
+        setup = run['setup']
+        print(f"{name}: {setup['server']} page-cache={setup['page_cache']} concurrency={setup['concurrency']} "
+              f"duration={setup['duration']}s media={setup['media']}")
+    print()
+    print(f"{'route':<10}" + ''.join(f"{name[:22]:>24}" for name, _ in runs))
+    for route in list(MIX) + ['all']:
+        cells = []
+        for _, run in runs:
+            s = run['summary'].get(route)
+            cells.append(f"{s['rps']:>7.1f}/s p95 {s['p95']:>6.0f}ms" if s else '-')
+        print(f"{route:<10}" + ''.join(f"{cell:>24}" for cell in cells))
+
+
+async def run_load(host, port, targets, args, photos):
+    samples = []
+    uploads = Uploads(photos)
+    started = time.monotonic()
+    warmup_end = started + args.warmup
+    deadline = warmup_end + args.duration
+    await asyncio.gather(*(visitor(n, host, port, targets, uploads, started, warmup_end, deadline, samples)
+                           for n in range(args.concurrency)))
+    # Requests still in flight at the deadline count toward the measured window
+    measured = max(args.duration, max((elapsed for *_, elapsed in samples), default=0) - args.warmup)
+    return samples, measured
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--server', choices=('werkzeug', 'gunicorn'), default='gunicorn')
+    parser.add_argument('--url', help='target an already running server instead (no seeding)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=4, help='threads per gunicorn worker')
+    parser.add_argument('--page-cache', choices=('none', 'memory', 'filesystem'), default='memory')
+    parser.add_argument('--metrics', action='store_true', help='leave request instrumentation on')
+    parser.add_argument('--no-job-worker', dest='job_worker', action='store_false',
+                        help='do not run the background job worker alongside')
+    parser.add_argument('--media', type=int, default=2000, help='seeded Media rows')
+    parser.add_argument('--images', type=int, default=24, help='distinct photos behind the rows')
+    parser.add_argument('--posts', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16, help='virtual visitors')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=5, help='unrecorded seconds before measuring')
+    parser.add_argument('--feed-pages', type=int, default=10, help='gallery feed pages visitors browse')
+    parser.add_argument('--output', help='save the run as JSON')
+    parser.add_argument('--compare', nargs='+', metavar='RESULTS', help='print saved runs side by side')
+    args = parser.parse_args()
+
+    if args.compare:
+        print_comparison(args.compare)
+        return
+
+    workdir = None if args.url else tempfile.mkdtemp(prefix='bench_load_')
+    processes = []
+    try:
+        if args.url:
+            target = urlsplit(args.url)
+            host, port = target.hostname, target.port or 80
+        else:
+            print(f"Seeding {args.media} media rows and {args.posts} posts...", file=sys.stderr)
+            env = prepare_install(workdir, args.media, args.posts, args.images)
+            host, port = '127.0.0.1', free_port()
+            processes = start_processes(args, env, port)
+
+        targets = asyncio.run(discover(host, port, args.feed_pages))
+        targets.update(feed_pool=targets['cursors'], image_pool=targets['images'], post_pool=targets['posts'])
+        rng = random.Random(SEED)
+        photos = [sample_jpeg(rng, (800, 600)) for _ in range(4)]
+
+        print(f"{args.concurrency} visitors for {args.duration:.0f}s after {args.warmup:.0f}s warm-up; "
+              f"{len(targets['images'])} image URLs, {len(targets['cursors'])} feed pages, "
+              f"{len(targets['posts'])} posts\n", file=sys.stderr)
+        samples, measured = asyncio.run(run_load(host, port, targets, args, photos))
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    summary = summarize(samples, measured)
+    print_summary(summary)
+    if args.output:
+        report = {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'setup': {
+                'server': args.url or args.server,
+                'workers': None if args.url or args.server == 'werkzeug' else args.workers,
+                'threads': None if args.url or args.server == 'werkzeug' else args.threads,
+                'page_cache': None if args.url else args.page_cache,
+                'metrics': args.metrics,
+                'job_worker': args.job_worker,
+                'media': args.media,
+                'posts': args.posts,
+                'concurrency': args.concurrency,
+                'duration': args.duration,
+                'warmup': args.warmup,
+                'mix': MIX,
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+            },
+            'summary': summary,
+        }
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
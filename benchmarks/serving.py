@@ -0,0 +1,152 @@
+"""Compare the Werkzeug development server with the gunicorn setup.
+
+Both servers run as real processes against the same seeded SQLite
+database: ``run.py`` the way the old systemd unit started it, and
+``gunicorn -c gunicorn.conf.py wsgi:app`` as shipped. Each route is then
+hit over HTTP from ``--threads`` client threads, one connection per request
+like nginx's upstream proxying:
+
+* ``gallery``: GET /gallery
+* ``feed``: GET /api/media
+* ``stats``: GET /api/stats
+* ``blog``: GET /blog
+
+Usage::
+
+    python benchmarks/serving.py --rows 5000 --requests 500 --threads 16
+    python benchmarks/serving.py --workers 4 --worker-threads 4
+"""
+import argparse
+import http.client
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db_profiles import build_app, seed, summarize  # noqa: E402
+
+ROUTES = {
+    'gallery': '/gallery',
+    'feed': '/api/media',
+    'stats': '/api/stats',
+    'blog': '/blog',
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port, process, timeout=30):
+    """Block until the server accepts connections."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def start_server(kind, port, env, workers, worker_threads):
+    if kind == 'werkzeug':
+        command = [sys.executable, 'run.py']
+        env = dict(env, PORT=str(port))
+    else:
+        command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+                   '--bind', f"127.0.0.1:{port}", 'wsgi:app']
+        env = dict(env, WEB_CONCURRENCY=str(workers), GUNICORN_THREADS=str(worker_threads),
+                   GUNICORN_ACCESS_LOG='')
+    process = subprocess.Popen(command, cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    wait_ready(port, process)
+    return process
+
+
+def run_route(port, path, requests, threads):
+    """Issue ``requests`` GETs from ``threads`` threads; returns latencies in ms and wall time."""
+    def one(_):
+        started = time.perf_counter()
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+        finally:
+            conn.close()
+        if response.status >= 400:
+            raise RuntimeError(f"{path}: HTTP {response.status}")
+        return (time.perf_counter() - started) * 1000
+
+    with ThreadPoolExecutor(threads) as pool:
+        list(pool.map(one, range(threads)))  # warm up every worker
+        wall = time.perf_counter()
+        latencies = list(pool.map(one, range(requests)))
+        wall = time.perf_counter() - wall
+    return latencies, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--threads', type=int, default=16, help='concurrent client threads')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='gunicorn workers')
+    parser.add_argument('--worker-threads', type=int, default=4, help='threads per gunicorn worker')
+    args = parser.parse_args()
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        sys.exit("gunicorn is not installed (pip install -r requirements.txt)")
+
+    workdir = tempfile.mkdtemp(prefix='bench_serving_')
+    uri = f"sqlite:///{os.path.join(workdir, 'bench.sqlite')}"
+    app = build_app('sqlite-wal', uri, os.path.join(workdir, 'uploads'))
+    seed(app, args.rows)
+    from app.extensions import db
+    with app.app_context():
+        db.engine.dispose()
+
+    # The shipped posts, copied so the servers' post caches land in the workdir
+    content_dir = os.path.join(workdir, 'blogs')
+    shutil.copytree(os.path.join(ROOT, 'content', 'blogs'), content_dir, ignore=shutil.ignore_patterns('.*'))
+
+    # Everything the servers write stays in the workdir; gunicorn's on_starting
+    # would otherwise clear the checkout's instance/metrics
+    env = dict(os.environ, FLASK_ENV='production', DB_PROFILE='sqlite-wal', DATABASE_URL=uri,
+               UPLOAD_FOLDER=os.path.join(workdir, 'uploads'), BLOG_CONTENT_DIR=content_dir,
+               INSTANCE_PATH=os.path.join(workdir, 'instance'), METRICS_DIR=os.path.join(workdir, 'metrics'))
+    print(f"{args.rows} rows, {args.requests} requests per route, {args.threads} client threads, "
+          f"gunicorn {args.workers} workers x {args.worker_threads} threads\n")
+    print(f"{'server':<10}{'route':<9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+    try:
+        for kind in ('werkzeug', 'gunicorn'):
+            port = free_port()
+            process = start_server(kind, port, env, args.workers, args.worker_threads)
+            try:
+                for route, path in ROUTES.items():
+                    result = summarize(*run_route(port, path, args.requests, args.threads))
+                    print(f"{kind:<10}{route:<9}{result['rps']:>9.1f}{result['p50']:>9.1f}"
+                          f"{result['p95']:>9.1f}{result['max']:>9.1f}")
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
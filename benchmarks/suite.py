@@ -0,0 +1,286 @@
+"""Reproducible timings of the hot routes on synthetic corpora.
+
+Each ``--media`` size gets a fresh SQLite (WAL) database. It holds that
+many Media rows, each with a small dummy file in a temporary uploads
+folder. The ``--posts`` Markdown posts are generated once into a
+temporary ``BLOG_CONTENT_DIR``. Content comes from a fixed random seed,
+so two runs of the same arguments time the same work. The page cache is
+off, so page routes render every time.
+
+Cases (HTTP ones go through the Flask test client):
+
+* ``main.gallery``: GET /gallery
+* ``main.admin_dashboard``: GET /admin as the admin
+* ``api.stats``: GET /api/stats
+* ``blog.get_all_blogs``: the post listing, from the manifest
+* ``blog.parse_blog``: render one post, cycling over the first 50 posts
+* ``media.upload``: POST /upload with three small JPEGs
+* ``main.sync_filesystem``: GET /sync, which queues the reconcile job
+* ``sync.reconcile``: the queued job itself, run inline
+
+Results go to JSON. ``--baseline`` compares the run against a saved file.
+``--compare OLD NEW`` compares two saved files without running. Both flag
+cases whose median slowed by more than ``--threshold`` and exit with
+status 1 when any did.
+
+Usage::
+
+    python benchmarks/suite.py --media 10000,100000 --posts 1000 --output baseline.json
+    python benchmarks/suite.py --media 10000 --baseline baseline.json --output current.json
+    python benchmarks/suite.py --compare baseline.json current.json
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from db_profiles import ADMIN, build_app, seed, tiny_jpeg  # noqa: E402
+
+SEED = 1234
+PARSE_POSTS = 50
+WORDS = ('light feather wing branch morning river lens shutter exposure field migration song nest '
+         'canopy marsh heron warbler sparrow focus aperture season patience dawn dusk tide meadow '
+         'rhetoric truth image media appearance discourse argument virtue reason story').split()
+TAGS = ('Birds', 'Photography', 'Philosophy', 'Travel', 'Gear', 'Field Notes', 'Rhetoric', 'Media')
+
+
+def sentence(rng, words=12):
+    text = ' '.join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + '.'
+
+
+def write_posts(content_dir, count):
+    """Generate ``count`` published and draft posts of a few hundred words each."""
+    from app.routes.blog import format_post
+    rng = random.Random(SEED)
+    os.makedirs(content_dir, exist_ok=True)
+    filenames = []
+    for i in range(count):
+        date = f"20{15 + i % 10:02d}-{1 + i % 12:02d}-{1 + i % 28:02d}"
+        title = ' '.join(rng.choice(WORDS) for _ in range(5)).title()
+        paragraphs = [' '.join(sentence(rng) for _ in range(6)) for _ in range(6)]
+        body = (
+            f"## {title}\n\n" + '\n\n'.join(paragraphs[:3]) +
+            "\n\n- " + '\n- '.join(sentence(rng, 6) for _ in range(4)) +
+            "\n\n```python\nfor bird in sightings:\n    print(bird.name, bird.count)\n```\n\n" +
+            '\n\n'.join(paragraphs[3:]) + '\n'
+        )
+        frontmatter = {
+            'title': title,
+            'date': date,
+            'author': 'Bench',
+            'tags': rng.sample(TAGS, 2),
+            'published': i % 10 != 0,
+        }
+        filename = f"{date}-post-{i:05d}.md"
+        with open(os.path.join(content_dir, filename), 'w', encoding='utf-8') as f:
+            f.write(format_post(frontmatter, body))
+        filenames.append(filename)
+    return filenames
+
+
+def write_media_files(upload_folder, rows):
+    """One small file per seeded row, named as ``db_profiles.seed`` names them."""
+    os.makedirs(upload_folder, exist_ok=True)
+    payload = tiny_jpeg(SEED)
+    for i in range(rows):
+        with open(os.path.join(upload_folder, f"seed_{i:07d}.jpg"), 'wb') as f:
+            f.write(payload)
+
+
+def cases(app, filenames):
+    """Map each case name to a zero-argument callable that performs it once."""
+    from app.routes.blog import get_all_blogs, parse_blog
+    from app.utils.sync import reconcile
+
+    anonymous = app.test_client()
+    admin = app.test_client()
+    admin.post('/login', data=ADMIN)
+    uploads = iter(range(10 ** 9))
+    posts = iter(range(10 ** 9))
+
+    def get(client, path):
+        def run():
+            response = client.get(path)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{path}: HTTP {response.status_code}")
+        return run
+
+    def upload():
+        n = next(uploads)
+        files = [(io.BytesIO(tiny_jpeg(n * 3 + k)), f"bench_{n}_{k}.jpg") for k in range(3)]
+        response = admin.post('/upload', data={'files': files}, content_type='multipart/form-data')
+        if response.status_code >= 400:
+            raise RuntimeError(f"/upload: HTTP {response.status_code}")
+
+    def in_context(function):
+        def run():
+            with app.app_context():
+                function()
+        return run
+
+    return {
+        'main.gallery': get(anonymous, '/gallery'),
+        'main.admin_dashboard': get(admin, '/admin'),
+        'api.stats': get(anonymous, '/api/stats'),
+        'blog.get_all_blogs': in_context(get_all_blogs),
+        'blog.parse_blog': in_context(lambda: parse_blog(filenames[next(posts) % min(PARSE_POSTS, len(filenames))])),
+        'media.upload': upload,
+        'main.sync_filesystem': get(admin, '/sync'),
+        'sync.reconcile': in_context(reconcile),
+    }
+
+
+def measure(function, iterations, warmup):
+    """Run ``function`` and return timing statistics in milliseconds."""
+    for _ in range(warmup):
+        function()
+    gc.collect()
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    ordered = sorted(timings)
+    return {
+        'iterations': iterations,
+        'min': ordered[0],
+        'median': statistics.median(ordered),
+        'mean': statistics.fmean(ordered),
+        'p95': ordered[max(0, int(len(ordered) * 0.95) - 1)],
+        'stdev': statistics.stdev(ordered) if len(ordered) > 1 else 0.0,
+    }
+
+
+def run_size(rows, filenames, workdir, iterations, warmup, selected):
+    """Build the corpus for one media size and time every case on it."""
+    sizedir = os.path.join(workdir, f"media_{rows}")
+    upload_folder = os.path.join(sizedir, 'uploads')
+    app = build_app('sqlite-wal', f"sqlite:///{os.path.join(sizedir, 'bench.sqlite')}", upload_folder,
+                    PAGE_CACHE_BACKEND='none')
+
+    started = time.perf_counter()
+    seed(app, rows)
+    write_media_files(upload_folder, rows)
+    with app.app_context():
+        from app.utils.sync import reconcile
+        reconcile(full=True)  # first scan writes the snapshot later runs diff against
+    print(f"  corpus of {rows} media rows ready in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    results = {}
+    try:
+        for name, function in cases(app, filenames).items():
+            if selected and name not in selected:
+                continue
+            # Every post parse_blog cycles through is rendered once before timing
+            results[name] = measure(function, iterations, max(warmup, PARSE_POSTS if name == 'blog.parse_blog' else 0))
+            print(f"  {name:<24}{results[name]['median']:>10.3f} ms median", file=sys.stderr)
+    finally:
+        from app.extensions import db
+        with app.app_context():
+            db.engine.dispose()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, threshold, min_delta):
+    """Print median changes per case; return the names that regressed."""
+    regressions = []
+    print(f"{'media':>8}  {'case':<24}{'baseline ms':>13}{'current ms':>12}{'change':>9}")
+    for size, results in current['results'].items():
+        for name, stats in results.items():
+            old = baseline['results'].get(size, {}).get(name)
+            if old is None:
+                print(f"{size:>8}  {name:<24}{'-':>13}{stats['median']:>12.3f}{'new':>9}")
+                continue
+            change = stats['median'] / old['median'] - 1 if old['median'] else 0.0
+            # Sub-``min_delta`` differences are timer noise whatever the ratio
+            regressed = change > threshold and stats['median'] - old['median'] > min_delta
+            flag = '  REGRESSION' if regressed else ''
+            print(f"{size:>8}  {name:<24}{old['median']:>13.3f}{stats['median']:>12.3f}{change:>+9.1%}{flag}")
+            if regressed:
+                regressions.append(f"{name}@{size}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--media', default='10000', help='comma-separated Media row counts (default 10000)')
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--iterations', type=int, default=30, help='timed runs per case')
+    parser.add_argument('--warmup', type=int, default=3, help='untimed runs per case')
+    parser.add_argument('--case', action='append', dest='cases', help='only run this case (repeatable)')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--baseline', help='compare the run against this results file')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='compare two results files without running')
+    parser.add_argument('--threshold', type=float, default=0.15, help='median slowdown flagged (0.15 = 15%%)')
+    parser.add_argument('--min-delta', type=float, default=0.05, help='ms below which changes are ignored')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0], 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.compare[1], 'r', encoding='utf-8') as f:
+            current = json.load(f)
+        sys.exit(1 if compare(baseline, current, args.threshold, args.min_delta) else 0)
+
+    workdir = tempfile.mkdtemp(prefix='bench_suite_')
+    # Read by app.routes.blog at import, so it must be set before the app is built
+    os.environ['BLOG_CONTENT_DIR'] = os.path.join(workdir, 'blogs')
+    try:
+        filenames = write_posts(os.environ['BLOG_CONTENT_DIR'], args.posts)
+        report = {
+            'meta': {
+                'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'posts': args.posts,
+                'iterations': args.iterations,
+                'warmup': args.warmup,
+            },
+            'results': {},
+        }
+        for rows in (int(size) for size in args.media.split(',')):
+            print(f"media={rows} posts={args.posts}", file=sys.stderr)
+            report['results'][str(rows)] = run_size(rows, filenames, workdir, args.iterations,
+                                                    args.warmup, set(args.cases or ()))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(baseline, report, args.threshold, args.min_delta) else 0)
+
+
+if __name__ == '__main__':
+    main()
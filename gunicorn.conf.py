@@ -0,0 +1,72 @@
+"""Gunicorn settings for BirdyPhillips.
+
+Every value can be overridden from the environment (see the systemd unit)
+or the command line. Sizing follows the CPU count: one process per core,
+each with a few threads so requests waiting on MySQL or the SD card do not
+hold a whole process.
+"""
+import multiprocessing
+import os
+
+# nginx proxies to this address (deploy/nginx_birdyphillips_updated.conf)
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:5000')
+
+cpus = multiprocessing.cpu_count()
+workers = int(os.environ.get('WEB_CONCURRENCY', cpus))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Import the app once in the master; workers fork from it and share its pages
+preload_app = True
+
+# Recycle workers periodically so slow leaks (Pillow buffers, caches) stay bounded
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+# Aligned with nginx's proxy_read_timeout 300: a slow upload is never killed
+# by gunicorn before nginx itself would give up on it.
+timeout = 300
+graceful_timeout = 30
+keepalive = 5
+
+# Heartbeat files on tmpfs rather than the SD card
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+# Trust X-Forwarded-* only from the local nginx
+forwarded_allow_ips = '127.0.0.1'
+
+# An empty GUNICORN_ACCESS_LOG turns the access log off
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+proc_name = 'birdyphillips'
+
+
+def on_starting(server):
+    """Start the merged /metrics counters from zero for this server run."""
+    from app.utils.metrics import reset_metrics
+    from wsgi import app
+    reset_metrics(app)
+
+
+def post_fork(server, worker):
+    """Drop any database connections inherited from the preloading master."""
+    from app.extensions import db
+    from wsgi import app
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def worker_exit(server, worker):
+    """Write the exiting worker's last request metrics (runs in the worker)."""
+    from wsgi import app
+    registry = app.extensions.get('metrics')
+    if registry is not None:
+        registry.flush()
+
+
+def child_exit(server, worker):
+    """Keep a recycled worker's request counters in the /metrics totals."""
+    from app.utils.metrics import retire_worker
+    from wsgi import app
+    retire_worker(app, worker.pid)
@@ -0,0 +1,50 @@
+"""Shared fixtures: an app on a throwaway SQLite database and uploads folder."""
+import io
+
+import pytest
+from PIL import Image
+
+ADMIN = {'username': 'admin', 'password': 'test-password'}
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    from config import config
+    from app import create_app
+    from app.extensions import db
+    from app.models import User
+
+    class TestConfig(config['development']):
+        TESTING = True
+        DEBUG = False
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.sqlite'}"
+        UPLOAD_FOLDER = str(tmp_path / 'uploads')
+        METRICS_ENABLED = False
+        PAGE_CACHE_BACKEND = 'memory'
+        STATIC_EXPORT_DIR = str(tmp_path / 'static_site')
+
+    monkeypatch.setitem(config, 'testing', TestConfig)
+    monkeypatch.setenv('INSTANCE_PATH', str(tmp_path / 'instance'))
+    app = create_app('testing')
+    with app.app_context():
+        db.create_all()
+        admin = User(username=ADMIN['username'], is_admin=True)
+        admin.set_password(ADMIN['password'])
+        db.session.add(admin)
+        db.session.commit()
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def admin_client(app):
+    client = app.test_client()
+    client.post('/login', data=ADMIN)
+    return client
+
+
+def jpeg_bytes(color='red', size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return buffer.getvalue()
@@ -0,0 +1,33 @@
+import io
+
+import pytest
+
+from app.extensions import db
+from app.models import Media
+from conftest import jpeg_bytes
+
+
+def test_failed_upload_is_picked_up_by_backfill(app, admin_client, monkeypatch):
+    response = admin_client.post('/api/media/batch', data={'files': [(io.BytesIO(jpeg_bytes()), 'bird.jpg')]},
+                                 content_type='multipart/form-data')
+    assert response.status_code == 201
+
+    # The queued rendition job fails, leaving the row without renditions
+    import app.tasks as tasks
+
+    def fail(filename):
+        raise OSError('disk full')
+
+    monkeypatch.setattr(tasks, 'build_renditions', fail)
+    with app.app_context():
+        media = Media.query.filter_by(filename='bird.jpg').one()
+        with pytest.raises(OSError):
+            tasks.process_image({'media_id': media.id})
+        db.session.rollback()
+        assert Media.query.filter(Media.renditions.is_(None)).count() == 1
+
+    result = app.test_cli_runner().invoke(args=['backfill-renditions'])
+    assert 'Renditions generated for 1 files (0 failed).' in result.output
+    with app.app_context():
+        media = Media.query.filter_by(filename='bird.jpg').one()
+        assert set(media.renditions) == set(app.config['RENDITION_SIZES'])
@@ -0,0 +1,60 @@
+import io
+import os
+
+from app.models import Media
+from app.tasks import process_image
+from app.utils.images import RENDITION_DIR, rendition_paths
+from app.utils.storage import objects_root
+from conftest import jpeg_bytes
+
+
+def upload(client, *names):
+    data = jpeg_bytes()
+    response = client.post('/api/media/batch', data={'files': [(io.BytesIO(data), name) for name in names]},
+                           content_type='multipart/form-data')
+    assert response.status_code == 201
+
+
+def process_all(app):
+    with app.app_context():
+        for media in Media.query.filter(Media.renditions.is_(None)).all():
+            process_image({'media_id': media.id})
+
+
+def files_under(root):
+    return {os.path.relpath(os.path.join(path, name), root)
+            for path, _dirs, names in os.walk(root) for name in names}
+
+
+def paths_of(app, filename):
+    with app.app_context():
+        return rendition_paths(Media.query.filter_by(filename=filename).one().renditions)
+
+
+def test_duplicates_in_one_batch_leave_no_renditions_behind(app, admin_client):
+    upload(admin_client, 'a.jpg', 'b.jpg')
+    process_all(app)
+    renditions_root = os.path.join(app.config['UPLOAD_FOLDER'], RENDITION_DIR)
+    a_paths, b_paths = paths_of(app, 'a.jpg'), paths_of(app, 'b.jpg')
+    assert a_paths and a_paths.isdisjoint(b_paths)
+
+    admin_client.post('/delete/a.jpg')
+    assert files_under(renditions_root) == b_paths
+    admin_client.post('/delete/b.jpg')
+    assert files_under(renditions_root) == set()
+    assert [name for name in files_under(objects_root(app.config['UPLOAD_FOLDER']))
+            if not name.startswith('tmp')] == []
+
+
+def test_renditions_shared_with_a_later_duplicate_are_kept(app, admin_client):
+    upload(admin_client, 'a.jpg')
+    process_all(app)
+    upload(admin_client, 'c.jpg')  # same bytes: reuses a.jpg's renditions
+    renditions_root = os.path.join(app.config['UPLOAD_FOLDER'], RENDITION_DIR)
+    shared = paths_of(app, 'a.jpg')
+    assert paths_of(app, 'c.jpg') == shared
+
+    admin_client.post('/delete/a.jpg')
+    assert files_under(renditions_root) == shared
+    admin_client.post('/delete/c.jpg')
+    assert files_under(renditions_root) == set()
@@ -0,0 +1,55 @@
+import pytest
+
+from app.utils.metrics import reset_metrics
+
+
+@pytest.fixture
+def metrics_app(app, tmp_path):
+    from config import config
+    from app import create_app
+
+    class MetricsConfig(config['testing']):
+        METRICS_ENABLED = True
+        METRICS_DIR = str(tmp_path / 'metrics')
+        METRICS_TOKEN = 'scrape-secret'
+
+    config['metrics-test'] = MetricsConfig
+    try:
+        metrics_app = create_app('metrics-test')
+    finally:
+        del config['metrics-test']
+    reset_metrics(metrics_app)
+    return metrics_app
+
+
+def scrape(app, **kwargs):
+    return app.test_client().get('/metrics', environ_base={'REMOTE_ADDR': '127.0.0.1'}, **kwargs)
+
+
+def test_metrics_need_the_token_even_from_loopback(metrics_app):
+    assert scrape(metrics_app).status_code == 404
+    assert scrape(metrics_app, headers={'Authorization': 'Bearer wrong'}).status_code == 404
+    response = scrape(metrics_app, headers={'Authorization': 'Bearer scrape-secret'})
+    assert response.status_code == 200
+    assert b'birdyphillips_request_duration_seconds' in response.data
+
+
+def test_internal_renders_are_not_counted(metrics_app):
+    from app.utils.metrics import INTERNAL_REQUEST
+
+    client = metrics_app.test_client()
+    client.get('/gallery', environ_overrides={INTERNAL_REQUEST: True})
+    body = scrape(metrics_app, headers={'Authorization': 'Bearer scrape-secret'}).data
+    assert b'endpoint="main.gallery"' not in body
+
+    client.get('/gallery')
+    body = scrape(metrics_app, headers={'Authorization': 'Bearer scrape-secret'}).data
+    assert b'birdyphillips_request_duration_seconds_count{endpoint="main.gallery"} 1' in body
+
+
+def test_logged_in_admin_can_read_metrics(metrics_app):
+    from conftest import ADMIN
+
+    client = metrics_app.test_client()
+    client.post('/login', data=ADMIN)
+    assert client.get('/metrics').status_code == 200
@@ -0,0 +1,31 @@
+import io
+import time
+
+from conftest import jpeg_bytes
+
+
+def test_write_invalidates_cached_pages_immediately(app, admin_client):
+    admin_client.post('/api/media/batch', data={'files': [(io.BytesIO(jpeg_bytes()), 'heron.jpg')]},
+                      content_type='multipart/form-data')
+    visitor = app.test_client()
+    first = visitor.get('/gallery')
+    assert first.headers['X-Page-Cache'] == 'MISS' and b'heron.jpg' in first.data
+    assert visitor.get('/gallery').headers['X-Page-Cache'] == 'HIT'
+
+    admin_client.post('/delete/heron.jpg')
+    after = visitor.get('/gallery')
+    assert after.headers['X-Page-Cache'] == 'MISS'
+    assert b'heron.jpg' not in after.data
+
+
+def test_expired_entry_of_current_version_is_served_stale(app, monkeypatch):
+    visitor = app.test_client()
+    assert visitor.get('/gallery').headers['X-Page-Cache'] == 'MISS'
+
+    cache = app.extensions['page_cache']
+    revalidated = []
+    monkeypatch.setattr(cache, 'revalidate', lambda app, key: revalidated.append(key))
+    later = time.time() + app.config['PAGE_CACHE_TTL'] + 1
+    monkeypatch.setattr(time, 'time', lambda: later)
+    assert visitor.get('/gallery').headers['X-Page-Cache'] == 'STALE'
+    assert revalidated == ['/gallery']
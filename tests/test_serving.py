@@ -0,0 +1,23 @@
+import io
+
+from conftest import jpeg_bytes
+
+
+def test_accel_redirect_only_on_full_responses(app, admin_client):
+    app.config['UPLOADS_ACCEL_REDIRECT'] = '/_uploads/'
+    response = admin_client.post('/api/media/batch', data={'files': [(io.BytesIO(jpeg_bytes()), 'bird.jpg')]},
+                                 content_type='multipart/form-data')
+    url = response.get_json()['files'][0]['url']
+
+    client = app.test_client()
+    first = client.get(url)
+    assert first.status_code == 200
+    assert first.headers['X-Accel-Redirect'] == '/_uploads/bird.jpg'
+
+    revalidated = client.get(url, headers={'If-None-Match': first.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert 'X-Accel-Redirect' not in revalidated.headers
+
+    failed = client.get(url, headers={'If-Match': '"other"'})
+    assert failed.status_code == 412
+    assert 'X-Accel-Redirect' not in failed.headers
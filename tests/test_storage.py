@@ -0,0 +1,38 @@
+import errno
+import os
+
+import pytest
+
+from app.utils import storage
+
+
+def make_blob(upload_folder, content_hash, data):
+    path = storage.blob_path(upload_folder, content_hash)
+    os.makedirs(os.path.dirname(path))
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_link_blob_never_replaces_an_existing_file(tmp_path):
+    make_blob(str(tmp_path), 'ab' * 32, b'new bytes')
+    (tmp_path / 'bird.jpg').write_bytes(b'someone else')
+    with pytest.raises(FileExistsError):
+        storage.link_blob(str(tmp_path), 'ab' * 32, 'bird.jpg')
+    assert (tmp_path / 'bird.jpg').read_bytes() == b'someone else'
+
+
+def test_link_blob_copies_where_hard_links_fail(tmp_path, monkeypatch):
+    make_blob(str(tmp_path), 'ab' * 32, b'bytes')
+
+    def no_links(source, target):
+        raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+    monkeypatch.setattr(storage.os, 'link', no_links)
+    storage.link_blob(str(tmp_path), 'ab' * 32, 'bird.jpg')
+    assert (tmp_path / 'bird.jpg').read_bytes() == b'bytes'
+
+    # The copy is exclusive too
+    (tmp_path / 'taken.jpg').write_bytes(b'someone else')
+    with pytest.raises(FileExistsError):
+        storage.link_blob(str(tmp_path), 'ab' * 32, 'taken.jpg')
+    assert (tmp_path / 'taken.jpg').read_bytes() == b'someone else'
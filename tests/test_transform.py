@@ -0,0 +1,47 @@
+import os
+
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+
+from app.utils.images import supported_formats
+from app.utils.transform import DERIVED_DIR, SIZE_FILE, get_variant, negotiate_format
+from conftest import jpeg_bytes
+
+
+def accept(header):
+    return parse_accept_header(header, MIMEAccept)
+
+
+def test_negotiation_honours_q_zero():
+    assert negotiate_format(accept('image/webp;q=0,image/*;q=0.8,*/*;q=0.5')) == ('jpeg', True)
+    assert negotiate_format(accept('*/*')) == ('jpeg', True)
+    if supported_formats(['webp']):
+        assert negotiate_format(accept('image/webp,*/*;q=0.8')) == ('webp', True)
+
+
+def cache_files(upload_folder):
+    root = os.path.join(upload_folder, DERIVED_DIR)
+    return [os.path.join(path, name) for path, dirs, names in os.walk(root)
+            for name in names if '.locks' not in path and name != SIZE_FILE]
+
+
+def test_cache_budget_is_one_shared_total(tmp_path):
+    upload_folder = str(tmp_path)
+    for i in range(6):
+        (tmp_path / f"{i}.jpg").write_bytes(jpeg_bytes(color=(40 * i, 0, 0), size=(600, 400)))
+
+    sizes = []
+    for i in range(6):
+        relpath = get_variant(upload_folder, f"{i}.jpg", str(i), 400, 'jpeg', 80, budget=10 ** 9)
+        sizes.append(os.path.getsize(os.path.join(upload_folder, relpath)))
+    total_file = os.path.join(upload_folder, DERIVED_DIR, SIZE_FILE)
+    assert int(open(total_file).read()) == sum(sizes)
+
+    # Another worker's renders show up in the shared total, so a small budget evicts
+    budget = sum(sizes) // 2
+    with open(total_file, 'w') as f:
+        f.write(str(sum(sizes)))
+    get_variant(upload_folder, '0.jpg', '0', 200, 'jpeg', 80, budget=budget)
+    on_disk = sum(os.path.getsize(path) for path in cache_files(upload_folder))
+    assert on_disk <= budget
+    assert int(open(total_file).read()) == on_disk
@@ -0,0 +1,8 @@
+"""WSGI entry point for production servers (``gunicorn -c gunicorn.conf.py wsgi:app``)."""
+import os
+from app import create_app
+
+# Production unless explicitly told otherwise; run.py stays the dev server
+config_name = 'development' if os.environ.get('FLASK_ENV') == 'development' else 'production'
+
+app = create_app(config_name)